@@ -0,0 +1,95 @@
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import aiohttp
+
+# Load test for chat_server.py: many simulated users asking questions at once.
+#
+# Offline, start the server with the local stub models first, e.g.
+#   MODEL_BACKEND=stub VECTOR_BACKEND=local python chat_server.py
+# and then
+#   python benchmarks/chat_load.py --users 50 --questions 10
+#
+# Every question is unique by default, so the answer cache doesn't hide the real cost.
+
+QUESTIONS = [
+    "What does error {n} mean?",
+    "How do I configure the API client for project {n}?",
+    "Which documents mention release {n}?",
+    "Summarise the installation guide, section {n}.",
+]
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+async def ask(session, url, question, stream):
+    started = time.perf_counter()
+    first_token = None
+    async with session.post(url + ("/chat/stream" if stream else "/chat"), json={"question": question}) as response:
+        if response.status != 200:
+            await response.read()
+            return response.status, time.perf_counter() - started, None
+        if stream:
+            async for line in response.content:
+                if first_token is None and line.startswith(b"event: token"):
+                    first_token = time.perf_counter() - started
+        else:
+            await response.json()
+    return 200, time.perf_counter() - started, first_token
+
+
+async def user(session, url, number, args, results):
+    for question_number in range(args.questions):
+        n = number * args.questions + question_number
+        question = QUESTIONS[n % len(QUESTIONS)].format(n=n if not args.repeat else n % len(QUESTIONS))
+        try:
+            results.append(await ask(session, url, question, args.stream))
+        except aiohttp.ClientError as e:
+            results.append((type(e).__name__, 0.0, None))
+
+
+async def main(args):
+    results = []
+    connector = aiohttp.TCPConnector(limit=args.users)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(user(session, args.url, number, args, results) for number in range(args.users)))
+        elapsed = time.perf_counter() - started
+        async with session.get(args.url + "/stats") as response:
+            server_stats = await response.json()
+
+    ok = [latency for status, latency, _ in results if status == 200]
+    first_tokens = [first for status, _, first in results if status == 200 and first is not None]
+    report = {
+        "users": args.users,
+        "requests": len(results),
+        "ok": len(ok),
+        "errors": {str(status): sum(1 for s, _, _ in results if s == status) for status, _, _ in results if status != 200},
+        "requests_per_second": round(len(results) / elapsed, 2),
+        "latency_p50": percentile(ok, 0.50),
+        "latency_p95": percentile(ok, 0.95),
+        "latency_p99": percentile(ok, 0.99),
+        "latency_mean": statistics.mean(ok) if ok else None,
+        "first_token_p50": percentile(first_tokens, 0.50),
+        "first_token_p95": percentile(first_tokens, 0.95),
+        "server": server_stats,
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test for the Nexora chat server")
+    parser.add_argument("--url", default="http://localhost:8080")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--questions", type=int, default=5, help="questions per user")
+    parser.add_argument("--stream", action="store_true", help="use /chat/stream and measure time to first token")
+    parser.add_argument("--repeat", action="store_true", help="ask the same few questions (exercises the answer cache)")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,96 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import fixtures
+
+# Crawls the fixture site with the project's settings and pipelines and prints
+# the crawl numbers as JSON. Scrapy's reactor can only run once per process, so
+# run_benchmarks.py starts this script as a subprocess.
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("base_url")
+    parser.add_argument("--mongo-uri")
+    parser.add_argument("--frontier", help="crawl from this shared frontier together with other workers")
+    args = parser.parse_args()
+
+    if not args.mongo_uri:
+        fixtures.use_mongomock()
+    os.environ["MONGO_URI"] = args.mongo_uri or "mongodb://localhost:27017"
+
+    # The project settings are found through scrapy.cfg in the project folder
+    os.chdir(fixtures.PROJECT_DIR)
+    import scrapy
+    from scrapy.crawler import CrawlerProcess
+    from scrapy.utils.project import get_project_settings
+
+    from nexora_crawler.items import NexoraCrawlerItem
+
+    class FixtureSpider(scrapy.Spider):
+        # html_spider and media_spider in one, for the fixture site
+        name = "benchmark_fixture"
+
+        async def start(self):
+            yield scrapy.Request(f"{args.base_url}/index.html", callback=self.parse_index)
+
+        def parse_index(self, response):
+            for href in response.css("a::attr(href)").getall():
+                yield response.follow(href, callback=self.parse)
+
+        def parse(self, response):
+            item = NexoraCrawlerItem()
+            item["source_url"] = response.url
+            if response.body[:5] == b"%PDF-":
+                item["file_body"] = response.body
+            else:
+                item["html_body"] = response.text
+            yield item
+
+    settings = get_project_settings()
+    settings.set("LOG_LEVEL", "WARNING")
+    # Plain HTTP to a local server: no browser, and no politeness delays to measure
+    settings.set("DOWNLOAD_HANDLERS", {})
+    settings.set("ROBOTSTXT_OBEY", False)
+    settings.set("DOWNLOAD_DELAY", 0)
+    settings.set("CONCURRENT_REQUESTS_PER_DOMAIN", 16)
+    settings.set("ADAPTIVE_THROTTLE_ENABLED", False)
+    settings.set("INCREMENTAL_CRAWL_ENABLED", False)
+    if args.frontier:
+        settings.set("SCHEDULER", "nexora_crawler.scheduler.SharedScheduler")
+        settings.set("FRONTIER_URI", args.frontier)
+        settings.set("FRONTIER_DOMAIN_DELAY", 0)
+
+    process = CrawlerProcess(settings)
+    crawler = process.create_crawler(FixtureSpider)
+    process.crawl(crawler)
+    started_at = time.time()
+    started = time.perf_counter()
+    process.start()
+    elapsed = time.perf_counter() - started
+
+    stats = crawler.stats.get_stats()
+    items = stats.get("item_scraped_count", 0)
+    json.dump({
+        "items": items,
+        "seconds": round(elapsed, 3),
+        "items_per_second": round(items / elapsed, 2),
+        # Wall clock times, to time several workers crawling together
+        "started_at": started_at,
+        "finished_at": started_at + elapsed,
+        "responses": stats.get("response_received_count", 0),
+        "mongo_bulk_writes": stats.get("mongo/bulk_writes", 0),
+        "mongo_bulk_errors": stats.get("mongo/bulk_errors", 0),
+        # Mean milliseconds per item / download, from the StageTimingExtension
+        "stage_mean_ms": {
+            key[len("timing/"):-len("/count")]: round(stats[key.replace("/count", "/total_ms")] / count, 3)
+            for key, count in stats.items() if key.startswith("timing/") and key.endswith("/count")
+        },
+    }, sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import functools
+import os
+import random
+import sys
+import tempfile
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+# Everything the offline benchmarks need instead of the internet, Atlas and Gemini:
+# a generated HTML + PDF corpus, a local HTTP server for it, a Mongo stand-in
+# and environment settings that select the stub models and local indexes.
+
+# Scripts in benchmarks/ import the project modules the way console_app.py does
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+WORDS = (
+    "crawler index passage vector query embedding latency throughput cluster shard replica "
+    "document request response timeout retry session token cache budget server client "
+    "pipeline parser worker queue batch release install configure upgrade migrate"
+).split()
+
+
+def sentence(rng):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(8, 16))]
+    # Exact identifiers are what the keyword index is for, so the corpus has plenty
+    words.insert(rng.randrange(len(words)), f"E-{rng.randint(1000, 9999)}")
+    return " ".join(words).capitalize() + "."
+
+
+def paragraph(rng):
+    return " ".join(sentence(rng) for _ in range(rng.randint(3, 7)))
+
+
+# Boilerplate around every generated page, for ContentExtractionPipeline to remove.
+# None of it may end up in the extracted text (see BOILERPLATE_MARKERS).
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Page {number} - Fixture Docs</title>
+<link rel="stylesheet" href="site.css"><style>body {{ font-family: sans-serif; }}</style>
+<script>window.dataLayer = window.dataLayer || []; function gtag() {{ dataLayer.push(arguments); }}</script>
+</head><body>
+<header class="site-header"><a class="logo" href="index.html">Fixture Docs</a>
+<nav><ul><li><a href="index.html">Home</a></li><li><a href="page-0.html">Getting started</a></li>
+<li><a href="page-1.html">Configuration</a></li><li><a href="page-2.html">Release notes</a></li></ul></nav>
+<form class="search" action="search.html"><input name="q" placeholder="Search the docs"><button>Search</button></form>
+</header>
+<div class="cookie-banner" role="dialog">This site uses cookies to remember your settings. <button>Accept</button></div>
+<div class="layout">
+<div class="sidebar"><h3>In this section</h3><ul><li><a href="page-3.html">Installing</a></li>
+<li><a href="page-4.html">Upgrading</a></li><li><a href="page-5.html">Troubleshooting</a></li></ul></div>
+<div id="content" class="content">
+<h1>Page {number}</h1>
+{body}
+<div class="share">Share this page: <a href="#">Twitter</a> <a href="#">LinkedIn</a> <a href="#">Email</a></div>
+</div>
+</div>
+<footer><p class="legal">Copyright 2024 Fixture Docs. All rights reserved.</p>
+<a href="privacy.html">Privacy policy</a> <a href="terms.html">Terms of use</a></footer>
+<script src="analytics.js"></script>
+</body></html>
+"""
+BOILERPLATE_MARKERS = ["Fixture Docs", "Search the docs", "uses cookies", "In this section", "Share this page",
+                       "Privacy policy", "dataLayer"]
+
+
+def build_corpus(directory, html_pages=200, pdfs=20, pdf_pages=10, seed=0):
+    # Writes index.html linking to every page and PDF; the same seed gives the same corpus
+    import fitz
+
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    links = []
+
+    for number in range(html_pages):
+        name = f"page-{number}.html"
+        paragraphs = [f"<p>{paragraph(rng)}</p>" for _ in range(rng.randint(3, 10))]
+        # A section heading before every other paragraph, and the page inside the usual site furniture
+        body = "\n".join(
+            (f"<h2>Section {i // 2 + 1}</h2>\n" if i % 2 == 0 and i else "") + p for i, p in enumerate(paragraphs)
+        )
+        with open(os.path.join(directory, name), "w", encoding="utf-8") as f:
+            f.write(PAGE_TEMPLATE.format(number=number, body=body))
+        links.append(name)
+
+    for number in range(pdfs):
+        name = f"doc-{number}.pdf"
+        pdf = fitz.open()
+        for _ in range(pdf_pages):
+            page = pdf.new_page()
+            page.insert_textbox(fitz.Rect(50, 50, 550, 800), "\n\n".join(paragraph(rng) for _ in range(3)), fontsize=9)
+        pdf.save(os.path.join(directory, name))
+        pdf.close()
+        links.append(name)
+
+    with open(os.path.join(directory, "index.html"), "w", encoding="utf-8") as f:
+        f.write("<html><body>" + "".join(f'<a href="{link}">{link}</a>\n' for link in links) + "</body></html>")
+    return links
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(directory):
+    # Serves `directory` on a free local port from a background thread; returns (server, base url)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(QuietHandler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def use_mongomock():
+    # Every MongoClient() in this process becomes the same in-memory mongomock client.
+    # Current pymongo passes a `sort` option to bulk updates that mongomock doesn't know yet.
+    import mongomock
+    import pymongo
+    from mongomock.collection import BulkOperationBuilder
+
+    for name in ["add_update", "add_replace"]:
+        original = getattr(BulkOperationBuilder, name)
+
+        def without_sort(self, *args, original=original, sort=None, **kwargs):
+            return original(self, *args, **kwargs)
+
+        setattr(BulkOperationBuilder, name, without_sort)
+
+    client = mongomock.MongoClient()
+    pymongo.MongoClient = lambda *args, **kwargs: client
+    return client
+
+
+def offline_environment(work_dir, mongo_uri=None):
+    # Must run before nexora_crawler.runtime is imported (it reads the environment on use)
+    os.environ.update({
+        "MODEL_BACKEND": "stub",
+        "STUB_EMBED_LATENCY": os.getenv("STUB_EMBED_LATENCY", "0"),
+        "STUB_LLM_LATENCY": os.getenv("STUB_LLM_LATENCY", "0"),
+        "VECTOR_BACKEND": "local",
+        "LOCAL_VECTOR_PATH": os.path.join(work_dir, "vector_store"),
+        "BM25_INDEX_PATH": os.path.join(work_dir, "bm25.sqlite"),
+        "EMBEDDING_CACHE_PATH": os.path.join(work_dir, "embeddings.sqlite"),
+        "ANSWER_CACHE_PATH": os.path.join(work_dir, "answers.sqlite"),
+        # Every query should take the full path, never the answer cache
+        "ANSWER_CACHE_THRESHOLD": "2",
+        "MONGO_URI": mongo_uri or "mongodb://localhost:27017",
+    })
+
+
+def work_directory():
+    return tempfile.mkdtemp(prefix="nexora-bench-")
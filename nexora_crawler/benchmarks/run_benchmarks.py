@@ -0,0 +1,435 @@
+import argparse
+import asyncio
+import contextlib
+import glob
+import io
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import fixtures
+
+# Offline end-to-end benchmarks: crawl, HTML content extraction, PDF parsing, Mongo
+# writes, indexing and queries.
+#
+#   python benchmarks/run_benchmarks.py
+#   python benchmarks/run_benchmarks.py --compare benchmarks/results/<earlier run>.json
+#   python benchmarks/run_benchmarks.py --html-corpus saved_pages/   (real pages for the extractor)
+#
+# No network, API key or Atlas needed: a generated corpus is served from a local
+# HTTP server, Mongo is mongomock (or a local server with --mongo-uri, which must be a
+# throwaway one: its nexora_db collections are emptied), and the models are the stubs
+# from nexora_crawler/models.py (STUB_EMBED_LATENCY / STUB_LLM_LATENCY add simulated
+# API time, 0 by default so only our own overhead is measured).
+#
+# Results go to benchmarks/results/ as JSON, named after the time and git commit.
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+
+    def at(fraction):
+        return round(samples[min(len(samples) - 1, int(fraction * len(samples)))] * 1000, 3)
+
+    return {
+        "count": len(samples),
+        "p50_ms": at(0.50),
+        "p95_ms": at(0.95),
+        "p99_ms": at(0.99),
+        "mean_ms": round(statistics.mean(samples) * 1000, 3),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=fixtures.PROJECT_DIR, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def crawl_command(base_url, mongo_uri):
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "crawl_worker.py"), base_url]
+    if mongo_uri:
+        command += ["--mongo-uri", mongo_uri]
+    return command
+
+
+def crawl_error(result):
+    return {"error": result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "crawl failed"}
+
+
+def bench_crawl(base_url, mongo_uri):
+    result = subprocess.run(crawl_command(base_url, mongo_uri), capture_output=True, text=True)
+    if result.returncode != 0:
+        return crawl_error(result)
+    run = json.loads(result.stdout.strip().splitlines()[-1])
+    # Clock times are only for bench_crawl_fleet; --compare would list them as changes
+    run.pop("started_at")
+    run.pop("finished_at")
+    return run
+
+
+def bench_crawl_fleet(base_url, mongo_uri, work_dir, workers):
+    # The same crawl split over several worker processes sharing a SQLite frontier
+    from nexora_crawler.frontier import open_frontier
+
+    uri = f"sqlite:///{os.path.join(work_dir, 'frontier.sqlite')}"
+    frontier = open_frontier(uri, "benchmark_fixture")
+    frontier.clear()
+    frontier.close()
+
+    processes = [
+        subprocess.Popen(crawl_command(base_url, mongo_uri) + ["--frontier", uri],
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        for _ in range(workers)
+    ]
+    outputs = [(process.communicate(), process.returncode) for process in processes]
+
+    for (stdout, stderr), code in outputs:
+        if code != 0:
+            return crawl_error(subprocess.CompletedProcess([], code, stdout, stderr))
+    runs = [json.loads(stdout.strip().splitlines()[-1]) for (stdout, _), _ in outputs]
+    items = sum(run["items"] for run in runs)
+    # From the first worker starting its crawl to the last one finishing, like bench_crawl
+    # (which doesn't count starting Python and Scrapy either)
+    elapsed = max(run["finished_at"] for run in runs) - min(run["started_at"] for run in runs)
+    return {
+        "workers": workers,
+        "items": items,
+        "items_per_worker": [run["items"] for run in runs],
+        "seconds": round(elapsed, 3),
+        "items_per_second": round(items / elapsed, 2),
+    }
+
+
+def bench_pdf_pipeline(corpus_dir, base_url, pdf_names, work_dir, workers):
+    from nexora_crawler.items import NexoraCrawlerItem
+    from nexora_crawler.pipelines import PdfParsingPipeline
+
+    bodies = []
+    for name in pdf_names:
+        with open(os.path.join(corpus_dir, name), "rb") as f:
+            bodies.append((f"{base_url}/{name}", f.read()))
+
+    pipeline = PdfParsingPipeline(files_store=work_dir, workers=workers)
+    pipeline.open_spider(None)
+
+    async def run():
+        # The first PDF also starts the worker processes; that isn't what we measure
+        await pipeline.extract_text_from_pdf(bodies[0][1])
+        started = time.perf_counter()
+        # A PDF that can't be read comes back as the DropItem the pipeline raised
+        items = await asyncio.gather(*(
+            pipeline.process_item(NexoraCrawlerItem(source_url=url, file_body=body), None) for url, body in bodies
+        ), return_exceptions=True)
+        return items, time.perf_counter() - started
+
+    try:
+        items, seconds = asyncio.run(run())
+    finally:
+        pipeline.close_spider(None)
+
+    errors = [item for item in items if isinstance(item, Exception)]
+    items = [item for item in items if not isinstance(item, Exception)]
+    megabytes = sum(len(body) for _, body in bodies) / 1e6
+    pages = sum(item["text_content"].count("\f") + 1 for item in items)
+    return items, {
+        "items": len(bodies),
+        "workers": pipeline.workers,
+        "seconds": round(seconds, 3),
+        "items_per_second": round(len(bodies) / seconds, 2),
+        "pages_per_second": round(pages / seconds, 2),
+        "megabytes_per_second": round(megabytes / seconds, 2),
+        "errors": len(errors),
+    }
+
+
+def bench_extraction(paths, markers=(), min_seconds=1.0):
+    # ContentExtractionPipeline's work on saved HTML pages: repeated until it has run
+    # for min_seconds, so small corpora still give stable numbers
+    from nexora_crawler.content_extraction import extract_main_content
+
+    pages = []
+    for path in paths:
+        with open(path, "rb") as f:
+            pages.append(f.read().decode("utf-8", errors="replace"))
+    if not pages:
+        return {"error": "no .html files"}
+
+    samples = []
+    texts = []
+    started = time.perf_counter()
+    while not samples or time.perf_counter() - started < min_seconds:
+        texts = []
+        for page in pages:
+            begin = time.perf_counter()
+            texts.append(extract_main_content(page))
+            samples.append(time.perf_counter() - begin)
+    seconds = sum(samples)
+    megabytes = sum(len(page.encode("utf-8")) for page in pages) * len(samples) / len(pages) / 1e6
+
+    result = {
+        "pages": len(pages),
+        "runs": len(samples) // len(pages),
+        "pages_per_second": round(len(samples) / seconds, 2),
+        "megabytes_per_second": round(megabytes / seconds, 2),
+        "per_page": percentiles(samples),
+        # How much of the HTML survives as text
+        "text_ratio": round(sum(map(len, texts)) / sum(map(len, pages)), 4),
+        "empty_pages": sum(1 for text in texts if not text),
+    }
+    if markers:
+        # Generated pages know their boilerplate: none of it may be in the text
+        result["boilerplate_leaks"] = sum(1 for text in texts if any(marker in text for marker in markers))
+    return result
+
+
+def html_items(corpus_dir, base_url, names):
+    from nexora_crawler.items import NexoraCrawlerItem
+
+    items = []
+    for name in names:
+        with open(os.path.join(corpus_dir, name), encoding="utf-8") as f:
+            text = "\n\n".join(re.findall(r"<p>(.*?)</p>", f.read()))
+        items.append(NexoraCrawlerItem(source_url=f"{base_url}/{name}", text_content=text))
+    return items
+
+
+def bench_mongo_pipeline(runtime, items, total, bulk_size):
+    # MongoPipeline's own buffering and bulk writes, without the reactor around them
+    from nexora_crawler.pipelines import MongoPipeline
+
+    pipeline = MongoPipeline(bulk_size=bulk_size)
+    pipeline.collection = runtime.client["nexora_db"]["benchmark_pipeline"]
+    pipeline.collection.drop()
+    pipeline.collection.create_index("source_url")
+    pipeline.collection.create_index("content_hash")
+
+    # The corpus repeated under new URLs, so every item is a new document
+    copies = [dict(items[n % len(items)], source_url=f"{items[n % len(items)]['source_url']}?copy={n}")
+              for n in range(total)]
+
+    started = time.perf_counter()
+    for data in copies:
+        data.pop("file_body", None)
+        pipeline.buffer.append((data, pipeline.build_operation(data)))
+        if len(pipeline.buffer) >= bulk_size:
+            batch, pipeline.buffer = pipeline.buffer, []
+            pipeline.write_batch(batch)
+    if pipeline.buffer:
+        pipeline.write_batch(pipeline.buffer)
+    seconds = time.perf_counter() - started
+
+    written = pipeline.collection.count_documents({})
+    pipeline.collection.drop()
+    return {
+        "items": total,
+        "written": written,
+        "bulk_size": bulk_size,
+        "seconds": round(seconds, 3),
+        "items_per_second": round(total / seconds, 2),
+    }
+
+
+def bench_index(runtime, items):
+    import indexer
+    from nexora_crawler.pipelines import content_hash
+
+    runtime.collection.insert_many([
+        {"source_url": item["source_url"], "text_content": item["text_content"],
+         "content_hash": content_hash(item["text_content"]), "index_status": "pending"}
+        for item in items
+    ])
+
+    # The indexer reports progress after every batch; we only want the totals
+    with contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        indexer.run_indexing()
+        seconds = time.perf_counter() - started
+
+    duplicates = runtime.collection.count_documents({"index_status": "duplicate"})
+    docs = runtime.collection.count_documents({"index_status": "indexed"}) + duplicates
+    passages = runtime.passages.count_documents({})
+    return {
+        "docs": docs,
+        "duplicates": duplicates,
+        "dedup_ratio": round(duplicates / max(docs, 1), 4),
+        "passages": passages,
+        "batch_size": indexer.BATCH_SIZE,
+        "concurrency": indexer.CONCURRENCY,
+        "seconds": round(seconds, 3),
+        "docs_per_second": round(docs / seconds, 2),
+        "passages_per_second": round(passages / seconds, 2),
+    }
+
+
+def questions(count, seed=1):
+    rng = random.Random(seed)
+    return [f"What does E-{rng.randint(1000, 9999)} mean for the {rng.choice(fixtures.WORDS)} "
+            f"{rng.choice(fixtures.WORDS)}? (#{number})" for number in range(count)]
+
+
+def bench_query(runtime, count):
+    import console_app
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        retriever = runtime.retriever
+        llm = runtime.llm
+        for question in questions(3, seed=99):
+            retriever.invoke(question)
+
+    # Retrieval alone, then the whole console_app path (embedding, answer cache check,
+    # retrieval, prompt, streamed LLM answer)
+    retrieval = []
+    for question in questions(count, seed=1):
+        started = time.perf_counter()
+        retriever.invoke(question)
+        retrieval.append(time.perf_counter() - started)
+
+    async def answer_all():
+        latencies = []
+        for question in questions(count, seed=2):
+            started = time.perf_counter()
+            await console_app.answer_query(question)
+            latencies.append(time.perf_counter() - started)
+        return latencies
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        end_to_end = asyncio.run(answer_all())
+
+    return {
+        "retrieval": percentiles(retrieval),
+        "end_to_end": percentiles(end_to_end),
+        "retrieval_mode": os.getenv("RETRIEVAL_MODE", "hybrid"),
+        "llm": type(llm).__name__,
+    }
+
+
+def numbers(results, prefix=""):
+    # Flattens the results into {"index.docs_per_second": 123.4, ...}
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(numbers(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare(previous_path, results):
+    with open(previous_path, encoding="utf-8") as f:
+        previous = json.load(f)
+    old, new = numbers(previous["results"]), numbers(results)
+    print(f"\nCompared with {previous['meta']['commit']} ({previous['meta']['timestamp']}):")
+    for key in sorted(new):
+        if key in old and old[key]:
+            change = (new[key] - old[key]) / old[key]
+            print(f"  {key:<40} {old[key]:>12} -> {new[key]:>12}  ({change:+.1%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline Nexora benchmarks")
+    parser.add_argument("--html-pages", type=int, default=200)
+    parser.add_argument("--pdfs", type=int, default=20)
+    parser.add_argument("--pdf-pages", type=int, default=10)
+    parser.add_argument("--pdf-workers", type=int, default=0, help="0 = one per CPU, like PDF_WORKERS")
+    parser.add_argument("--mongo-items", type=int, default=5000)
+    parser.add_argument("--mongo-bulk-size", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--mongo-uri", help="a throwaway local MongoDB instead of mongomock")
+    parser.add_argument("--skip-crawl", action="store_true")
+    parser.add_argument("--html-corpus", help="a folder of saved .html pages for the content extraction benchmark "
+                                              "(default: the generated pages)")
+    parser.add_argument("--crawl-workers", type=int, default=4,
+                        help="also crawl with this many workers sharing a frontier (0 = don't)")
+    parser.add_argument("--output", help="where to write the JSON (default: benchmarks/results/)")
+    parser.add_argument("--compare", help="an earlier results file to compare with")
+    args = parser.parse_args()
+
+    work_dir = fixtures.work_directory()
+    fixtures.offline_environment(work_dir, args.mongo_uri)
+    if not args.mongo_uri:
+        fixtures.use_mongomock()
+
+    from nexora_crawler.runtime import runtime
+    for name in ["raw_materials", "passages"]:
+        runtime.client["nexora_db"][name].drop()
+
+    corpus_dir = os.path.join(work_dir, "site")
+    print(f"Building the corpus in {corpus_dir} ...")
+    names = fixtures.build_corpus(corpus_dir, args.html_pages, args.pdfs, args.pdf_pages)
+    server, base_url = fixtures.serve(corpus_dir)
+
+    results = {}
+    if not args.skip_crawl:
+        print("Crawling the fixture site ...")
+        results["crawl"] = bench_crawl(base_url, args.mongo_uri)
+        if args.crawl_workers:
+            print(f"Crawling with {args.crawl_workers} workers ...")
+            results["crawl_fleet"] = bench_crawl_fleet(base_url, args.mongo_uri, work_dir, args.crawl_workers)
+
+    print("Content extraction ...")
+    if args.html_corpus:
+        paths = glob.glob(os.path.join(args.html_corpus, "**", "*.html"), recursive=True)
+        results["content_extraction"] = bench_extraction(sorted(paths))
+    else:
+        paths = [os.path.join(corpus_dir, name) for name in names if name.endswith(".html")]
+        results["content_extraction"] = bench_extraction(paths, fixtures.BOILERPLATE_MARKERS)
+
+    print("PdfParsingPipeline ...")
+    pdf_items, results["pdf_pipeline"] = bench_pdf_pipeline(
+        corpus_dir, base_url, [name for name in names if name.endswith(".pdf")], work_dir, args.pdf_workers
+    )
+    items = html_items(corpus_dir, base_url, [name for name in names if name.endswith(".html")]) + list(pdf_items)
+
+    print("MongoPipeline ...")
+    results["mongo_pipeline"] = bench_mongo_pipeline(runtime, items, args.mongo_items, args.mongo_bulk_size)
+
+    print("Indexer ...")
+    results["index"] = bench_index(runtime, items)
+
+    print("Queries ...")
+    results["query"] = bench_query(runtime, args.queries)
+    server.shutdown()
+
+    commit = git_commit()
+    report = {
+        "meta": {
+            "commit": commit,
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "mongo": "mongodb" if args.mongo_uri else "mongomock",
+            "stub_embed_latency": float(os.environ["STUB_EMBED_LATENCY"]),
+            "stub_llm_latency": float(os.environ["STUB_LLM_LATENCY"]),
+            "corpus": {"html_pages": args.html_pages, "pdfs": args.pdfs, "pdf_pages": args.pdf_pages},
+        },
+        "results": results,
+    }
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{commit}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print(json.dumps(results, indent=2))
+    print(f"\nSaved to {output}")
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
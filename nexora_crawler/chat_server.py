@@ -0,0 +1,249 @@
+import asyncio
+import json
+import os
+import time
+
+from aiohttp import web
+
+# The same prompt, retriever, LLM, caches and pooled MongoClient as the console app
+from console_app import build_context, build_prompt, chunk_text, format_source, timed
+from nexora_crawler.metrics import metrics
+from nexora_crawler.runtime import runtime
+
+# Nexora as an HTTP service for many users at once:
+#   POST /chat         {"question": "..."} -> {"answer", "sources", "cached", "context", "timing"}
+#   POST /chat/stream  the same, as server-sent events: "token" events, then one "done" event
+#   GET  /stats        batching and load numbers
+#   GET  /metrics      latency histograms per stage, in the Prometheus text format
+#
+# Questions that arrive together are embedded in one API call (micro-batching),
+# and at most CHAT_MAX_LLM_CALLS answers are generated at once. When more than
+# CHAT_MAX_WAITING requests are already waiting for the LLM, new ones get a 503
+# with Retry-After instead of piling up.
+
+HOST = os.getenv("CHAT_HOST", "0.0.0.0")
+PORT = int(os.getenv("CHAT_PORT", "8080"))
+EMBED_MAX_BATCH = int(os.getenv("CHAT_EMBED_MAX_BATCH", "32"))
+EMBED_MAX_WAIT = float(os.getenv("CHAT_EMBED_MAX_WAIT", "0.01"))
+MAX_LLM_CALLS = int(os.getenv("CHAT_MAX_LLM_CALLS", "8"))
+MAX_WAITING = int(os.getenv("CHAT_MAX_WAITING", "64"))
+
+
+class MicroBatchEmbedder:
+    # Collects the questions of concurrent requests and embeds them together.
+    # A batch is sent when it is full or `max_wait` seconds after its first question;
+    # questions arriving while a batch is being embedded simply form the next one.
+
+    def __init__(self, embeddings, max_batch=32, max_wait=0.01):
+        self.embeddings = embeddings
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = asyncio.Queue()
+        self.batches = 0
+        self.queries = 0
+
+    async def embed(self, text):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((text, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                vectors = await asyncio.to_thread(self.embeddings.embed_queries, [text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for (_, future), vector in zip(batch, vectors):
+                    if not future.done():
+                        future.set_result(vector)
+            self.batches += 1
+            self.queries += len(batch)
+
+
+class LLMLimiter:
+    # A semaphore for the LLM calls that refuses new work once too many requests wait for it
+
+    def __init__(self, max_in_flight, max_waiting):
+        self.semaphore = asyncio.Semaphore(max_in_flight)
+        self.max_waiting = max_waiting
+        self.waiting = 0
+        self.in_flight = 0
+        self.rejected = 0
+
+    async def __aenter__(self):
+        if self.waiting >= self.max_waiting:
+            self.rejected += 1
+            raise web.HTTPServiceUnavailable(
+                text=json.dumps({"error": "Too many questions at once, please retry"}),
+                content_type="application/json",
+                headers={"Retry-After": "1"},
+            )
+        self.waiting += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+
+    async def __aexit__(self, *exc_info):
+        self.in_flight -= 1
+        self.semaphore.release()
+
+
+async def read_question(request):
+    try:
+        question = (await request.json()).get("question", "")
+    except (ValueError, AttributeError):
+        question = ""
+    if not isinstance(question, str) or not question.strip():
+        raise web.HTTPBadRequest(text=json.dumps({"error": 'Send {"question": "..."}'}), content_type="application/json")
+    return question
+
+
+async def prepare(app, question):
+    # Returns (cached answer and sources or None, query vector, passages for the prompt, context usage)
+    # "embed" includes the wait for the micro-batch to fill
+    query_vector = await timed("embed", app["embedder"].embed(question))
+
+    # The answer cache before retrieval: a hit then costs no retrieval thread at all
+    cached = await timed("answer_cache", asyncio.to_thread(runtime.answer_cache.lookup, query_vector, runtime.passages))
+    if cached:
+        return cached, query_vector, [], None
+
+    # The embedding is cached now, so retrieval doesn't embed the question again
+    source_docs = await timed("retrieval", runtime.retriever.ainvoke(question))
+    source_docs, usage = await timed("context", asyncio.to_thread(build_context, question, query_vector, source_docs))
+    return None, query_vector, source_docs, usage
+
+
+async def remember(question, query_vector, answer, sources, source_docs):
+    await asyncio.to_thread(runtime.answer_cache.store, question, query_vector, answer, sources,
+                            [str(doc.metadata["_id"]) for doc in source_docs if "_id" in doc.metadata])
+
+
+def timing(started, first_token):
+    now = time.perf_counter()
+    metrics.observe("chat", now - started, stage="total")
+    return {"first_token_seconds": round(first_token - started, 4), "total_seconds": round(now - started, 4)}
+
+
+async def chat(request):
+    started = time.perf_counter()
+    question = await read_question(request)
+    cached, query_vector, source_docs, usage = await prepare(request.app, question)
+    if cached:
+        answer, sources = cached
+        return web.json_response({"answer": answer, "sources": sources, "cached": True,
+                                  "timing": timing(started, time.perf_counter())})
+
+    async with request.app["llm_limiter"]:
+        response = await timed("llm", runtime.llm.ainvoke(build_prompt(question, source_docs)))
+    answer = chunk_text(response)
+    sources = sorted({format_source(doc) for doc in source_docs})
+    await remember(question, query_vector, answer, sources, source_docs)
+    return web.json_response({"answer": answer, "sources": sources, "cached": False, "context": usage,
+                              "timing": timing(started, time.perf_counter())})
+
+
+async def chat_stream(request):
+    started = time.perf_counter()
+    question = await read_question(request)
+    cached, query_vector, source_docs, usage = await prepare(request.app, question)
+
+    async def send(response, event, data):
+        await response.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8"))
+
+    if cached:
+        answer, sources = cached
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        await send(response, "token", answer)
+        await send(response, "done", {"sources": sources, "cached": True,
+                                      "timing": timing(started, time.perf_counter())})
+        return response
+
+    # The limiter may refuse with a 503, so it is entered before the stream starts
+    async with request.app["llm_limiter"]:
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        first_token = None
+        parts = []
+        llm_started = time.perf_counter()
+        async for chunk in runtime.llm.astream(build_prompt(question, source_docs)):
+            text = chunk_text(chunk)
+            if not text:
+                continue
+            if first_token is None:
+                first_token = time.perf_counter()
+                metrics.observe("chat", first_token - llm_started, stage="llm_first_token")
+            parts.append(text)
+            await send(response, "token", text)
+        metrics.observe("chat", time.perf_counter() - llm_started, stage="llm")
+
+    sources = sorted({format_source(doc) for doc in source_docs})
+    await send(response, "done", {"sources": sources, "cached": False, "context": usage,
+                                   "timing": timing(started, first_token or time.perf_counter())})
+    await remember(question, query_vector, "".join(parts), sources, source_docs)
+    return response
+
+
+async def stats(request):
+    embedder = request.app["embedder"]
+    limiter = request.app["llm_limiter"]
+    return web.json_response({
+        "embedding_batches": embedder.batches,
+        "embedded_questions": embedder.queries,
+        "average_batch_size": round(embedder.queries / max(embedder.batches, 1), 2),
+        "llm_in_flight": limiter.in_flight,
+        "llm_waiting": limiter.waiting,
+        "rejected": limiter.rejected,
+        "embedding_cache": runtime.embeddings.report(),
+        "answer_cache": runtime.answer_cache.report(),
+        "context_budget": runtime.context_budgeter.report() if runtime.context_budgeter else "off",
+    })
+
+
+async def prometheus(request):
+    return web.Response(text=metrics.to_prometheus(), content_type="text/plain", charset="utf-8")
+
+
+async def background_tasks(app):
+    # Everything is built before the first request comes in, without blocking the event loop
+    for name in ["embeddings", "answer_cache", "retriever", "context_budgeter", "llm"]:
+        await asyncio.to_thread(getattr, runtime, name)
+    print(runtime.report())
+
+    app["embedder"] = MicroBatchEmbedder(runtime.embeddings, EMBED_MAX_BATCH, EMBED_MAX_WAIT)
+    app["llm_limiter"] = LLMLimiter(MAX_LLM_CALLS, MAX_WAITING)
+    batcher = asyncio.create_task(app["embedder"].run())
+    yield
+    batcher.cancel()
+
+
+def create_app():
+    app = web.Application()
+    app.cleanup_ctx.append(background_tasks)
+    app.router.add_post("/chat", chat)
+    app.router.add_post("/chat/stream", chat_stream)
+    app.router.add_get("/stats", stats)
+    app.router.add_get("/metrics", prometheus)
+    return app
+
+
+if __name__ == "__main__":
+    web.run_app(create_app(), host=HOST, port=PORT)
@@ -1,51 +1,158 @@
+import asyncio
 import os
-import sys
-from dotenv import load_dotenv
-from pymongo import MongoClient
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
-from langchain_mongodb import MongoDBAtlasVectorSearch
-
-# 1. Load Environment Variables
-load_dotenv()
-MONGO_URI = os.getenv("MONGO_URI")
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-
-# 2. Setup Database Connection
-client = MongoClient(MONGO_URI)
-db = client["nexora_db"]
-collection = db["raw_materials"]
-
-# 3. Setup Embedding Model
-embeddings = GoogleGenerativeAIEmbeddings(model="models/text-embedding-004")
-
-# 4. Connect to the Vector Store
-vector_store = MongoDBAtlasVectorSearch(
-    collection=collection,
-    embedding=embeddings,
-    index_name="vector_index"
-)
-
-# 5. Setup the LLM (using gemini-2.5-flash - fast and reliable)
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash",
-    temperature=0
-)
-
-# 6. Create the Retriever
-retriever = vector_store.as_retriever(search_kwargs={"k": 3})
-
-def start_chat():
+import time
+
+from nexora_crawler.metrics import metrics, profiled
+from nexora_crawler.runtime import runtime
+
+# The database, models, caches and retriever come from the shared runtime
+# (nexora_crawler/runtime.py). They are built on first use, and start_chat
+# builds them in the background while the first question is being typed.
+
+# Print answers token by token as they are generated (STREAM_ANSWERS=0 waits for the whole answer)
+STREAM_ANSWERS = os.getenv("STREAM_ANSWERS", "1") != "0"
+
+# Every step of an answer is timed into nexora_crawler.metrics as chat{stage=...}:
+# embed, answer_cache, retrieval, llm_first_token, llm and total. The summary is
+# printed on exit and exported to METRICS_EXPORT_PATH when that is set.
+
+def format_source(doc):
+    # "https://site/doc.pdf (p. 3-4)" for PDF passages, just the URL for web pages
+    source = doc.metadata.get('source_url', 'Unknown')
+    start, end = doc.metadata.get('page_start'), doc.metadata.get('page_end')
+    if start and end and end > 1:
+        pages = f"p. {start}" if start == end else f"p. {start}-{end}"
+        return f"{source} ({pages})"
+    return source
+
+def build_prompt(query, source_docs):
+    # Format context
+    context = "\n\n".join(doc.page_content for doc in source_docs)
+
+    return f"""Answer the following question based only on the provided context:
+
+<context>
+{context}
+</context>
+
+Question: {query}"""
+
+def chunk_text(chunk):
+    # Gemini chunks carry either a plain string or a list of content parts
+    content = chunk.content if hasattr(chunk, 'content') else chunk
+    if isinstance(content, str):
+        return content
+    return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+
+def print_sources(sources):
+    if sources:
+        print(f"\n[Sources: {', '.join(sources)}]")
+    else:
+        print("\n[Source: General Knowledge]")
+
+def build_context(query, query_vector, source_docs):
+    # The retriever over-fetches; the budgeter picks diverse passages and trims them
+    # to CONTEXT_MAX_TOKENS (nexora_crawler/context_budget.py). CONTEXT_BUDGET=0 skips it.
+    budgeter = runtime.context_budgeter
+    if budgeter is None:
+        return source_docs, None
+    return budgeter.select(query, query_vector, source_docs)
+
+def print_context(usage):
+    if usage and usage["candidates"]:
+        print(f"[Context: {usage['tokens']} tokens from {usage['passages']} of {usage['candidates']} passages, "
+              f"{usage['tokens_saved']} tokens saved]")
+
+async def timed(stage, awaitable):
+    started = time.perf_counter()
+    result = await awaitable
+    metrics.observe("chat", time.perf_counter() - started, stage=stage)
+    return result
+
+def print_timing(started, first_token):
+    # Time to first token is what the user feels; total is until the answer is complete
+    now = time.perf_counter()
+    metrics.observe("chat", now - started, stage="total")
+    print(f"[First token after {first_token - started:.2f}s, answered in {now - started:.2f}s]")
+
+async def answer_query(query):
+    started = time.perf_counter()
+
+    # The query embedding is cached, so the retriever below reuses it for free
+    query_vector = await timed("embed", asyncio.to_thread(runtime.embeddings.embed_query, query))
+
+    # The answer cache first: a lookup is a scan of a few cached question vectors, and a
+    # hit means no retrieval at all (a retrieval already running in a thread couldn't be stopped)
+    cached = await timed("answer_cache", asyncio.to_thread(runtime.answer_cache.lookup, query_vector, runtime.passages))
+    if cached:
+        answer, sources = cached
+        print(f"Nexora: {answer}                    ")  # Extra spaces to clear "Thinking..."
+        print_sources(sources)
+        print_timing(started, time.perf_counter())
+        return
+
+    source_docs = await timed("retrieval", runtime.retriever.ainvoke(query))
+    source_docs, usage = await timed("context", asyncio.to_thread(build_context, query, query_vector, source_docs))
+    prompt_text = build_prompt(query, source_docs)
+    sources = sorted({format_source(doc) for doc in source_docs})
+
+    # Print the answer as Gemini writes it (or all at once with STREAM_ANSWERS=0)
+    first_token = None
+    parts = []
+    llm_started = time.perf_counter()
+    if STREAM_ANSWERS:
+        async for chunk in runtime.llm.astream(prompt_text):
+            text = chunk_text(chunk)
+            if not text:
+                continue
+            if first_token is None:
+                first_token = time.perf_counter()
+                metrics.observe("chat", first_token - llm_started, stage="llm_first_token")
+                print("Nexora: " + " " * 12, end="\r")  # Clear "Thinking..."
+                print("Nexora: ", end="")
+            print(text, end="", flush=True)
+            parts.append(text)
+        print()
+    else:
+        response = await runtime.llm.ainvoke(prompt_text)
+        first_token = time.perf_counter()
+        metrics.observe("chat", first_token - llm_started, stage="llm_first_token")
+        parts.append(chunk_text(response))
+        print(f"Nexora: {parts[0]}                    ")  # Extra spaces to clear "Thinking..."
+
+    metrics.observe("chat", time.perf_counter() - llm_started, stage="llm")
+    answer = "".join(parts)
+    print_sources(sources)
+    print_context(usage)
+    print_timing(started, first_token or time.perf_counter())
+    await asyncio.to_thread(runtime.answer_cache.store, query, query_vector, answer, sources,
+                            [str(doc.metadata["_id"]) for doc in source_docs if "_id" in doc.metadata])
+
+async def start_chat():
     print("----------------------------------------------------------------")
     print("Welcome to Nexora")
     print("Type 'exit' to quit.")
     print("----------------------------------------------------------------")
+    runtime.mark("prompt shown")
+
+    # Everything a question needs, in the order it needs it
+    runtime.prewarm("embeddings", "answer_cache", "retriever", "context_budgeter", "llm")
 
     while True:
-        query = input("\nUser: ")
-        
+        # input() blocks, so it waits in a thread and the event loop stays free
+        query = await asyncio.to_thread(input, "\nUser: ")
+
         if query.lower() in ["exit", "quit"]:
             print("Nexora: Goodbye!")
-            sys.exit()
+            for name in ["embeddings", "answer_cache", "context_budgeter"]:
+                if runtime.is_built(name) and getattr(runtime, name) is not None:
+                    print(getattr(runtime, name).report())
+            print(runtime.report())
+            print(metrics.summary())
+            path = metrics.export()
+            if path:
+                print(f"Timings written to {path}")
+            return
 
         if not query.strip():
             continue
@@ -53,36 +160,11 @@ def start_chat():
         print("Nexora: Thinking...", end="\r")
 
         try:
-            # Get relevant documents
-            source_docs = retriever.invoke(query)
-            
-            # Format context
-            context = "\n\n".join(doc.page_content for doc in source_docs)
-            
-            # Create prompt
-            prompt_text = f"""Answer the following question based only on the provided context:
-
-<context>
-{context}
-</context>
-
-Question: {query}"""
-            
-            # Get response
-            response = llm.invoke(prompt_text)
-            answer = response.content if hasattr(response, 'content') else str(response)
-
-            print(f"Nexora: {answer}                    ")  # Extra spaces to clear "Thinking..."
-            
-            # Print Sources
-            if source_docs:
-                unique_sources = {doc.metadata.get('source', 'Unknown') for doc in source_docs}
-                print(f"\n[Sources: {', '.join(unique_sources)}]")
-            else:
-                print("\n[Source: General Knowledge]")
-
+            await answer_query(query)
         except Exception as e:
             print(f"\nError: {e}")
 
 if __name__ == "__main__":
-    start_chat()
\ No newline at end of file
+    # PROFILE_OUTPUT=chat.prof profiles the event loop thread for the whole session
+    with profiled():
+        asyncio.run(start_chat())
@@ -0,0 +1,115 @@
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+from scrapy.utils.project import get_project_settings
+
+from nexora_crawler.frontier import open_frontier
+
+# Runs a spider in several worker processes that crawl together from one shared
+# request queue (the frontier, see nexora_crawler/frontier.py):
+#
+#   python crawl_workers.py site_spider --workers 4 -a start_urls=https://docs.example.com/
+#
+# Every worker is a normal `scrapy crawl` with SharedScheduler, so each has its own
+# downloader, Playwright browser and PDF pool, and the work spreads over the CPU
+# cores. The frontier keeps the fleet from fetching a URL twice and keeps
+# FRONTIER_DOMAIN_DELAY between two requests to a domain across all the workers.
+#
+# More machines: run the same command on each, with the same Mongo frontier
+# (--frontier mongodb, the default). A worker that crashes is restarted here, and
+# the requests it had leased go to the other workers when their lease runs out.
+# The crawl is over when the frontier has nothing queued or in progress.
+#
+# The queue is kept after the crawl (that is how a stopped crawl resumes);
+# --fresh empties it first to crawl everything again.
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawl with several Scrapy workers sharing one request queue")
+    parser.add_argument("spider")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes on this machine")
+    parser.add_argument("--frontier", help="FRONTIER_URI: mongodb, a mongodb:// URI or sqlite:///path")
+    parser.add_argument("--name", help="name of the shared queue (default: the spider name)")
+    parser.add_argument("--fresh", action="store_true", help="empty the queue before starting")
+    parser.add_argument("--max-restarts", type=int, default=3, help="restarts per crashed worker")
+    parser.add_argument("-a", dest="spider_args", action="append", default=[], metavar="NAME=VALUE")
+    parser.add_argument("-s", dest="settings", action="append", default=[], metavar="NAME=VALUE")
+    args = parser.parse_args()
+
+    os.chdir(PROJECT_DIR)
+    settings = get_project_settings()
+    uri = args.frontier or settings.get("FRONTIER_URI")
+    name = args.name or args.spider
+
+    # 1. The queue
+    frontier = open_frontier(uri, name)
+    if args.fresh:
+        frontier.clear()
+    before = frontier.counts()
+    print(f"Frontier {name} ({uri}): {before}")
+
+    # 2. The workers
+    command = [sys.executable, "-m", "scrapy", "crawl", args.spider,
+               "-s", "SCHEDULER=nexora_crawler.scheduler.SharedScheduler",
+               "-s", f"FRONTIER_URI={uri}", "-s", f"FRONTIER_NAME={name}"]
+    if not any(setting.startswith("PDF_WORKERS=") for setting in args.settings):
+        # PDF_WORKERS = 0 is a process per core in every worker: share the cores out instead
+        command += ["-s", f"PDF_WORKERS={max(1, (os.cpu_count() or 1) // args.workers)}"]
+    for value in args.spider_args:
+        command += ["-a", value]
+    for value in args.settings:
+        command += ["-s", value]
+
+    started = time.time()
+    workers = {}
+    restarts = {}
+    for number in range(args.workers):
+        workers[number] = start_worker(command, number)
+        restarts[number] = 0
+
+    # 3. Wait for them, restarting any that crash while there is still work
+    try:
+        while workers:
+            time.sleep(1)
+            for number, process in list(workers.items()):
+                code = process.poll()
+                if code is None:
+                    continue
+                del workers[number]
+                if code != 0 and restarts[number] < args.max_restarts and frontier.has_pending():
+                    restarts[number] += 1
+                    print(f"Worker {number} exited with {code}, restarting ({restarts[number]}/{args.max_restarts})")
+                    workers[number] = start_worker(command, number)
+    except KeyboardInterrupt:
+        # The workers got the Ctrl-C too; they finish what they are downloading and
+        # put their leased requests back. A second Ctrl-C stops them right away.
+        print("Stopping the workers...")
+        try:
+            for process in workers.values():
+                process.wait()
+        except KeyboardInterrupt:
+            for process in workers.values():
+                process.send_signal(signal.SIGTERM)
+
+    # 4. Report
+    elapsed = time.time() - started
+    counts = frontier.counts()
+    done = counts["done"] - before["done"]
+    print(f"Frontier {name}: {counts}")
+    print(f"{done} requests done in {elapsed:.1f}s with {args.workers} workers ({done / max(elapsed, 1e-9):.1f}/s)")
+    frontier.close()
+
+
+def start_worker(command, number):
+    return subprocess.Popen(command + ["-s", f"FRONTIER_WORKER_ID={socket.gethostname()}-{number}"], cwd=PROJECT_DIR)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,66 +1,499 @@
+import argparse
 import os
-from dotenv import load_dotenv
-from pymongo import MongoClient
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_mongodb import MongoDBAtlasVectorSearch
-from langchain_core.documents import Document
-
-# 1. Load Secrets
-load_dotenv()
-MONGO_URI = os.getenv("MONGO_URI")
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-
-# 2. Connect to MongoDB
-client = MongoClient(MONGO_URI)
-db = client["nexora_db"]
-collection = db["raw_materials"]
-
-# 3. Setup Gemini Embeddings
-# We use 'text-embedding-004' which matches our Index definition (768 dimensions)
-embeddings = GoogleGenerativeAIEmbeddings(model="models/text-embedding-004")
+import random
+import time
+from datetime import datetime, timezone
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pymongo import DeleteMany, ReplaceOne, UpdateOne
+from pymongo.errors import OperationFailure, PyMongoError
+
+from nexora_crawler.chunking import estimate_tokens, split_into_passages
+from nexora_crawler.metrics import metrics, profiled
+from nexora_crawler.near_duplicates import NearDuplicateFinder, encode_signature
+from nexora_crawler.pipelines import create_url_index
+from nexora_crawler.runtime import runtime
+from nexora_crawler.vector_codec import encode_vector, storage_format
+from nexora_crawler.vector_backends import build_vector_store, sync_local_store, vector_backend
+
+# 1. Settings (the runtime has already loaded .env)
+# How many documents go into one embedding call, how many calls run at once,
+# and how often a rate-limited call is retried before we give up on that batch
+BATCH_SIZE = int(os.getenv("INDEX_BATCH_SIZE", "32"))
+CONCURRENCY = int(os.getenv("INDEX_CONCURRENCY", "4"))
+MAX_RETRIES = int(os.getenv("INDEX_MAX_RETRIES", "6"))
+# A document whose batch has failed this many times is marked index_status "failed"
+# and left alone (index_error says why). Re-crawling it, or setting it back to
+# "pending", gives it another try.
+MAX_FAILURES = int(os.getenv("INDEX_MAX_FAILURES", "3"))
+
+# Size of the passages we embed, and how much consecutive passages overlap (in tokens)
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "400"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "50"))
+
+# Near-duplicates of an already indexed document (estimated Jaccard similarity of
+# their 5-word shingles >= DEDUP_THRESHOLD) are not embedded: they are marked
+# index_status "duplicate" with duplicate_of pointing at the original.
+# See nexora_crawler/near_duplicates.py. DEDUP_ENABLED=0 indexes everything.
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "1") != "0"
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.85"))
+
+# Watch mode (python indexer.py --watch) keeps running and indexes documents as the
+# crawler writes them. It follows a MongoDB change stream when the server has one
+# (Atlas, replica sets) and otherwise polls for pending documents every
+# INDEX_POLL_INTERVAL seconds. INDEX_WATCH_MODE=poll forces polling.
+# Changes arriving within INDEX_WATCH_DEBOUNCE seconds are indexed together, and
+# every INDEX_RESCAN_INTERVAL seconds pending documents are looked for anyway
+# (batches that failed, changes missed while reconnecting).
+WATCH_MODE = os.getenv("INDEX_WATCH_MODE", "auto").lower()
+POLL_INTERVAL = float(os.getenv("INDEX_POLL_INTERVAL", "2"))
+WATCH_DEBOUNCE = float(os.getenv("INDEX_WATCH_DEBOUNCE", "1"))
+RESCAN_INTERVAL = float(os.getenv("INDEX_RESCAN_INTERVAL", "60"))
+
+# 2. MongoDB, the embeddings (Gemini 'text-embedding-004', or the stub with MODEL_BACKEND=stub)
+# and the BM25 keyword index come from the shared runtime (nexora_crawler/runtime.py).
+# They are only built when there is something to index.
+
+# 3. Every stage is timed into nexora_crawler.metrics (indexer{stage=read|chunk|embed|
+# mongo_write|bm25}); METRICS_EXPORT_PATH and PROFILE_OUTPUT export the timings / a profile.
+
+
+def is_retryable(error):
+    # Rate limits (429 / ResourceExhausted) and temporary server errors are worth retrying
+    message = f"{type(error).__name__} {error}".lower()
+    return any(word in message for word in ["429", "resourceexhausted", "quota", "rate", "503", "unavailable", "timeout"])
+
+
+def embed_with_backoff(texts):
+    delay = 2
+    for attempt in range(MAX_RETRIES):
+        try:
+            return runtime.embeddings.embed_documents(texts)
+        except Exception as e:
+            if attempt == MAX_RETRIES - 1 or not is_retryable(e):
+                raise
+            # Exponential backoff with jitter so parallel batches don't retry in lockstep
+            time.sleep(delay + random.random())
+            delay = min(delay * 2, 60)
+
+
+def prepare_collections():
+    # The Atlas "vector_index" is defined on the passages collection (path "embedding", 768 dimensions)
+    runtime.passages.create_index("parent_id")
+    # Finding work is an index lookup on "pending", oldest first, not a collection scan.
+    # MongoPipeline creates the same index; this covers collections filled some other way.
+    runtime.collection.create_index([("index_status", 1), ("ingested_at", 1)])
+    # Near-duplicate candidates are found by their LSH band hashes (a multikey index)
+    runtime.collection.create_index("lsh_bands")
+    # ... and the duplicates of a document by duplicate_of, when it changes
+    runtime.collection.create_index("duplicate_of", sparse=True)
+    # Documents from before index_status existed count as pending (once, via the same index)
+    runtime.collection.update_many({"index_status": {"$exists": False}}, {"$set": {"index_status": "pending"}})
+
+
+def read_batches():
+    # We stream the collection with a cursor instead of loading everything into memory.
+    # Only documents that are not indexed yet (new or changed since) are read, so a
+    # restarted run simply continues with whatever is left.
+    cursor = runtime.collection.find(
+        {"index_status": "pending"},
+        {"text_content": 1, "source_url": 1, "content_hash": 1},
+    ).sort("ingested_at", 1).batch_size(BATCH_SIZE)
+
+    # "read" is the time spent waiting on the cursor, not on whoever consumes the batches
+    batch = []
+    started = time.perf_counter()
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) == BATCH_SIZE:
+            metrics.observe("indexer", time.perf_counter() - started, stage="read")
+            yield batch
+            batch = []
+            started = time.perf_counter()
+    if batch:
+        metrics.observe("indexer", time.perf_counter() - started, stage="read")
+        yield batch
+
+
+def build_passages(doc):
+    # A document without text (an unreadable PDF, an empty page) gets no passages
+    chunks = split_into_passages(doc.get("text_content") or "", CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS)
+    return [
+        {
+            # A stable id, so re-indexing a document overwrites its passages in place
+            "_id": f"{doc['_id']}:{number}",
+            "parent_id": doc["_id"],
+            "source_url": doc.get("source_url", "unknown"),
+            "chunk_index": number,
+            "page_start": chunk["page_start"],
+            "page_end": chunk["page_end"],
+            "text": chunk["text"],
+        }
+        for number, chunk in enumerate(chunks)
+    ]
+
+
+def status_update(doc, found, indexed_at):
+    # What the document looks like once indexed: an original, a duplicate or empty
+    update = {"$set": {"index_status": "indexed", "indexed_at": indexed_at}}
+    if doc["_id"] not in found:
+        # No text now (or dedup is off): the signature of older content must not stay
+        # behind, or a later copy of that content would be matched against this document
+        update["$unset"] = {"minhash": "", "lsh_bands": "", "duplicate_of": ""}
+        return update
+    sig, bands, canonical = found[doc["_id"]]
+    update["$set"].update(minhash=encode_signature(sig), lsh_bands=bands)
+    if canonical is None:
+        update["$unset"] = {"duplicate_of": ""}
+    else:
+        update["$set"].update(index_status="duplicate", duplicate_of=canonical)
+    return update
+
+
+def requeue_duplicates(batch):
+    # The documents of this batch have new content, so their duplicates may not be
+    # duplicates any more: they are checked (and indexed, if need be) again
+    ids = [doc["_id"] for doc in batch]
+    runtime.collection.update_many(
+        {"duplicate_of": {"$in": ids}, "_id": {"$nin": ids}, "index_status": "duplicate"},
+        {"$set": {"index_status": "pending"}},
+    )
+
+
+def index_batch(batch):
+    # 4. Set the near-duplicates aside, split the rest into passages and embed them all in one call
+    with metrics.timer("indexer", stage="dedup"):
+        found = NearDuplicateFinder(runtime.collection, DEDUP_THRESHOLD).find(batch) if DEDUP_ENABLED else {}
+    duplicates = {doc_id for doc_id, (_, _, canonical) in found.items() if canonical is not None}
+
+    with metrics.timer("indexer", stage="chunk"):
+        batch_passages = [passage for doc in batch if doc["_id"] not in duplicates for passage in build_passages(doc)]
+    texts = [passage["text"] for passage in batch_passages]
+    with metrics.timer("indexer", stage="embed"):
+        vectors = embed_with_backoff(texts) if texts else []
+
+    indexed_at = datetime.now(timezone.utc)
+
+    # 5. Save the passages first, then mark the documents as indexed.
+    # If we crash in between, the documents are simply indexed again next time.
+    # A document that was re-crawled meanwhile has a new content_hash and stays pending.
+    # The vectors go in as packed float32 (VECTOR_STORAGE, see vector_codec.py)
+    operations = [ReplaceOne({"_id": passage["_id"]},
+                             dict(passage, embedding=encode_vector(vector), indexed_at=indexed_at), upsert=True)
+                  for passage, vector in zip(batch_passages, vectors)]
+    for doc in batch:
+        # Remove passages left over from a longer, older version of the document
+        # (all of them for a document that has become a duplicate)
+        count = sum(1 for passage in batch_passages if passage["parent_id"] == doc["_id"])
+        operations.append(DeleteMany({"parent_id": doc["_id"], "chunk_index": {"$gte": count}}))
+    with metrics.timer("indexer", stage="mongo_write"):
+        runtime.passages.bulk_write(operations, ordered=False)
+
+        runtime.collection.bulk_write(
+            [UpdateOne({"_id": doc["_id"], "content_hash": doc.get("content_hash")}, status_update(doc, found, indexed_at))
+             for doc in batch],
+            ordered=False,
+        )
+        requeue_duplicates(batch)
+
+    with metrics.timer("indexer", stage="bm25"):
+        for doc in batch:
+            runtime.bm25.replace_parent(str(doc["_id"]), [(passage["_id"], passage["text"])
+                                                          for passage in batch_passages if passage["parent_id"] == doc["_id"]])
+    return len(batch), len(batch_passages), sum(estimate_tokens(text) for text in texts), len(duplicates)
+
+
+class Progress:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.docs = 0
+        self.passages = 0
+        self.tokens = 0
+        self.duplicates = 0
+        self.failed = 0
+
+    def add(self, docs, passages, tokens, duplicates):
+        self.docs += docs
+        self.passages += passages
+        self.tokens += tokens
+        self.duplicates += duplicates
+        self.report()
+
+    def report(self):
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        # The dedup ratio: how many of the documents we read were near-duplicates and not embedded
+        print(
+            f"Indexed {self.docs} docs ({self.passages} passages) | {self.docs / elapsed:.1f} docs/sec | "
+            f"{self.tokens / elapsed:,.0f} tokens/sec | {self.duplicates} near-duplicates skipped "
+            f"({self.duplicates / max(self.docs, 1):.1%}) | {self.failed} failed batches"
+        )
+
+
+def index_batch_or_split(batch):
+    try:
+        return index_batch(batch)
+    except Exception as e:
+        if len(batch) == 1 or is_retryable(e):
+            raise
+    # One bad document fails the whole embedding call: one by one, only that one fails
+    totals = [0, 0, 0, 0]
+    failed = []
+    for doc in batch:
+        try:
+            totals = [a + b for a, b in zip(totals, index_batch([doc]))]
+        except Exception as e:
+            failed.append((doc, e))
+    if failed:
+        raise BatchFailed(totals, failed)
+    return tuple(totals)
+
+
+class BatchFailed(Exception):
+    # Some documents of a split batch failed; the others were indexed
+    def __init__(self, totals, failed):
+        super().__init__(f"{len(failed)} documents failed, e.g. {type(failed[0][1]).__name__}: {failed[0][1]}")
+        self.totals = totals
+        self.failed = failed
+
+
+def record_failures(failed):
+    # Counts a failed attempt for each document; the ones that keep failing are marked
+    # "failed" so they stop using up embedding calls (and holding up their batch)
+    for doc, error in failed:
+        key = {"_id": doc["_id"], "content_hash": doc.get("content_hash"), "index_status": "pending"}
+        updated = runtime.collection.find_one_and_update(
+            key, {"$inc": {"index_failures": 1}, "$set": {"index_error": f"{type(error).__name__}: {str(error)[:500]}"}},
+            projection={"index_failures": 1}, return_document=True,
+        )
+        if updated and updated.get("index_failures", 0) >= MAX_FAILURES:
+            runtime.collection.update_one(key, {"$set": {"index_status": "failed"}})
+            print(f"Giving up on {doc.get('source_url', doc['_id'])} after {MAX_FAILURES} failed attempts")
+
+
+def collect(futures, batches, progress):
+    for future in futures:
+        batch = batches.pop(future)
+        try:
+            progress.add(*future.result())
+        except BatchFailed as e:
+            progress.add(*e.totals)
+            progress.failed += 1
+            print(f"Batch failed: {str(e)[:200]}")
+            record_failures(e.failed)
+        except Exception as e:
+            # The documents of this batch stay pending and are picked up by the next run
+            progress.failed += 1
+            print(f"Batch failed: {type(e).__name__}: {str(e)[:200]}")
+            record_failures([(doc, e) for doc in batch])
+
+
+def index_pending(executor, progress):
+    # Generate Vectors & Save, several batches at a time
+    running = {}  # future -> its batch
+    for batch in read_batches():
+        # Don't read further ahead than the workers can keep up with
+        if len(running) >= CONCURRENCY:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            collect(done, running, progress)
+        running[executor.submit(index_batch_or_split, batch)] = batch
+
+    collect(list(running), running, progress)
+
 
 def run_indexing():
-    print("--- 1. Fetching Raw Data ---")
-    # We find documents that DO NOT have an embedding yet
-    raw_docs = list(collection.find({"embedding": {"$exists": False}}))
-    print(f"Found {len(raw_docs)} documents to process.")
+    print("--- 1. Streaming Raw Data ---")
+    prepare_collections()
+    progress = Progress()
 
-    if not raw_docs:
+    # The profile (PROFILE_OUTPUT) covers this thread: reading, scheduling and waiting.
+    with profiled(), ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+        index_pending(executor, progress)
+        # Duplicates of documents that changed went back to pending: they are checked now too
+        while runtime.collection.find_one({"index_status": "pending", "duplicate_of": {"$exists": True}}, {"_id": 1}):
+            index_pending(executor, progress)
+
+    if progress.docs == 0 and progress.failed == 0:
         print("Nothing new to index!")
+        print(runtime.report())
+        return
+
+    print("--- 2. Done! ---")
+    progress.report()
+    print(runtime.embeddings.report())
+    print(runtime.report())
+    print(metrics.summary())
+    path = metrics.export()
+    if path:
+        print(f"Timings written to {path}")
+
+    # The local vector store (VECTOR_BACKEND=local) picks up the new passages right away
+    if vector_backend() == "local":
+        build_vector_store(runtime.passages, runtime.embeddings)
+
+
+def compact_vectors(batch_size=1000):
+    # Rewrites passages stored as arrays of doubles in the current VECTOR_STORAGE format.
+    # indexed_at stays as it is: the vectors themselves don't change.
+    if storage_format() == "array":
+        print("VECTOR_STORAGE=array, nothing to compact")
         return
+    converted = 0
+    operations = []
+    for passage in runtime.passages.find({"embedding": {"$type": "array"}}, {"embedding": 1}).batch_size(batch_size):
+        operations.append(UpdateOne({"_id": passage["_id"]}, {"$set": {"embedding": encode_vector(passage["embedding"])}}))
+        if len(operations) == batch_size:
+            runtime.passages.bulk_write(operations, ordered=False)
+            converted += len(operations)
+            operations = []
+            print(f"Compacted {converted} passages")
+    if operations:
+        runtime.passages.bulk_write(operations, ordered=False)
+        converted += len(operations)
+    print(f"Done: {converted} passages now store packed float32 vectors")
 
-    # 4. Create LangChain Documents
-    # We need to convert Mongo dicts into LangChain 'Document' objects
-    documents_to_embed = []
-    ids_to_update = []
-    
-    for doc in raw_docs:
-        # We only want to embed the 'text_content'
-        if "text_content" in doc and doc["text_content"]:
-            # Create a Document object
-            new_doc = Document(
-                page_content=doc["text_content"],
-                metadata={"source": doc.get("source_url", "unknown")}
-            )
-            documents_to_embed.append(new_doc)
-            ids_to_update.append(doc["_id"])
-
-    # 5. Generate Vectors & Save
-    if documents_to_embed:
-        print(f"--- 2. Generating Embeddings for {len(documents_to_embed)} docs ---")
-        
-        # This function automatically:
-        # 1. Calls Gemini API
-        # 2. Gets the vectors
-        # 3. Saves them back to MongoDB Atlas in the 'embedding' field
-        vector_store = MongoDBAtlasVectorSearch.from_documents(
-            documents=documents_to_embed,
-            embedding=embeddings,
-            collection=collection,
-            index_name="vector_index" # Must match the name you typed in Atlas UI
+
+def dedupe_urls(batch_size=1000):
+    # One-off migration for collections filled before source_url was unique: the
+    # insert_one pipeline of earlier versions stored a new copy on every re-crawl.
+    # The newest copy of each URL stays; the others go, with their passages.
+    # Afterwards MongoPipeline (and this function) can create the unique index.
+    groups = runtime.collection.aggregate([
+        {"$match": {"source_url": {"$type": "string"}}},
+        {"$sort": {"ingested_at": -1, "_id": -1}},
+        {"$group": {"_id": "$source_url", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ], allowDiskUse=True)
+
+    urls = 0
+    removed = []
+    for group in groups:
+        urls += 1
+        removed.extend(group["ids"][1:])  # the first one is the newest
+    print(f"{urls} URLs are stored more than once, {len(removed)} older copies to remove")
+
+    for start in range(0, len(removed), batch_size):
+        ids = removed[start:start + batch_size]
+        runtime.passages.delete_many({"parent_id": {"$in": ids}})
+        runtime.collection.delete_many({"_id": {"$in": ids}})
+        # Documents set aside as near-duplicates of a removed copy are checked again
+        runtime.collection.update_many(
+            {"duplicate_of": {"$in": ids}, "index_status": "duplicate"},
+            {"$set": {"index_status": "pending"}, "$unset": {"duplicate_of": ""}},
         )
-        
-        print("--- 3. Success! Data is now Vectorized ---")
+        for doc_id in ids:
+            runtime.bm25.replace_parent(str(doc_id), [])
+        print(f"Removed {min(start + batch_size, len(removed))} copies")
+
+    if removed and vector_backend() == "local":
+        build_vector_store(runtime.passages, runtime.embeddings)  # drops the removed passages
+
+    if create_url_index(runtime.collection):
+        print("Done: source_url is unique now")
+    else:
+        # Only a crawl writing more copies while this ran; running it again finishes the job
+        print("Done, but source_url could not be made unique yet: run --dedupe-urls again")
+
+
+def open_change_stream():
+    # Inserts, replacements and every MongoPipeline upsert (they all set ingested_at).
+    # Our own "indexed" updates don't match, so indexing doesn't wake us up again.
+    pipeline = [{"$match": {"$or": [
+        {"operationType": {"$in": ["insert", "replace"]}},
+        {"operationType": "update", "updateDescription.updatedFields.ingested_at": {"$exists": True}},
+    ]}}]
+    return runtime.collection.watch(pipeline, max_await_time_ms=int(WATCH_DEBOUNCE * 1000))
+
+
+def wait_for_changes(stream, timeout):
+    # Returns True once something changed (after collecting what follows within
+    # the debounce time), False when `timeout` seconds pass without a change
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if stream.try_next() is not None:
+            settle = time.monotonic() + WATCH_DEBOUNCE
+            while time.monotonic() < settle and stream.try_next() is not None:
+                pass
+            return True
+    return False
+
+
+def watch():
+    print("--- Watching for new documents (Ctrl-C to stop) ---")
+    prepare_collections()
+    progress = Progress()
+    local_store = build_vector_store(runtime.passages, runtime.embeddings) if vector_backend() == "local" else None
+
+    stream = None
+    use_stream = WATCH_MODE != "poll"
+    if use_stream:
+        try:
+            stream = open_change_stream()
+            print("Following the change stream of raw_materials")
+        except (OperationFailure, NotImplementedError, AttributeError, TypeError) as e:
+            # Standalone servers (and mongomock) have no change streams
+            use_stream = False
+            print(f"No change stream ({type(e).__name__}), polling every {POLL_INTERVAL}s instead")
+    else:
+        print(f"Polling every {POLL_INTERVAL}s")
+
+    delay = POLL_INTERVAL
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+        try:
+            while True:
+                try:
+                    if use_stream and stream is None:
+                        stream = open_change_stream()
+
+                    # Catch up first (and after every wake-up): the pending query is what decides
+                    # what gets indexed, the change stream only says when to look
+                    before = progress.docs
+                    index_pending(executor, progress)
+                    if local_store is not None and progress.docs > before:
+                        sync_local_store(local_store, runtime.passages)
+
+                    if stream is None:
+                        time.sleep(POLL_INTERVAL)
+                    else:
+                        wait_for_changes(stream, RESCAN_INTERVAL)
+                    delay = POLL_INTERVAL
+                except PyMongoError as e:
+                    # MongoDB is away (a failover, the network): wait longer each time and carry
+                    # on. The stream is reopened and the next pass catches up on what we missed.
+                    print(f"MongoDB error ({type(e).__name__}: {str(e)[:200]}), retrying in {delay:.0f}s")
+                    if stream is not None:
+                        close_quietly(stream)
+                        stream = None
+                    time.sleep(delay + random.random())
+                    delay = min(delay * 2, 60)
+        except KeyboardInterrupt:
+            print("--- Stopped ---")
+            progress.report()
+            print(metrics.summary())
+            metrics.export()
+        finally:
+            if stream is not None:
+                close_quietly(stream)
+
+
+def close_quietly(stream):
+    try:
+        stream.close()
+    except PyMongoError:
+        pass
+
 
 if __name__ == "__main__":
-    run_indexing()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Chunk, embed and index the crawled documents")
+    parser.add_argument("--watch", action="store_true", help="keep running and index new documents as they arrive")
+    parser.add_argument("--compact-vectors", action="store_true",
+                        help="convert passages stored as arrays of doubles to packed float32 and exit")
+    parser.add_argument("--dedupe-urls", action="store_true",
+                        help="keep only the newest document of each URL, make source_url unique and exit")
+    args = parser.parse_args()
+    if args.compact_vectors:
+        compact_vectors()
+    elif args.dedupe_urls:
+        dedupe_urls()
+    elif args.watch:
+        watch()
+    else:
+        run_indexing()
@@ -0,0 +1,151 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import timezone
+
+import numpy as np
+
+# Remembers the answers console_app gave, keyed by the question's embedding.
+# A new question that is close enough to an earlier one (a paraphrase of the
+# same FAQ) gets the earlier answer and sources back without retrieval or an
+# LLM call.
+#
+# Entries expire after `ttl` seconds, the least recently used ones are evicted
+# beyond `max_entries`, and an entry is dropped as soon as one of the passages
+# it was answered from has been re-indexed (or removed) since.
+
+DEFAULT_ANSWERS_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache", "answers.sqlite"
+)
+
+
+class AnswerCache:
+    def __init__(self, path=DEFAULT_ANSWERS_PATH, model_name="", threshold=0.92, ttl=86400, max_entries=1000):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.model_name = model_name
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS answers (id INTEGER PRIMARY KEY, model TEXT NOT NULL, question TEXT NOT NULL, "
+            "vector BLOB NOT NULL, answer TEXT NOT NULL, sources TEXT NOT NULL, passage_ids TEXT NOT NULL, "
+            "created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.db.commit()
+
+        # The questions are few (max_entries), so we keep their vectors in memory and scan them
+        self.vectors = {}
+        for entry_id, blob in self.db.execute("SELECT id, vector FROM answers WHERE model = ?", (model_name,)):
+            self.vectors[entry_id] = np.frombuffer(blob, dtype=np.float32)
+        # The same vectors as the rows of one matrix (entry ids in `self.ids`), so a lookup
+        # is a single matrix-vector product. Rebuilt on the first lookup after a change.
+        self.ids = []
+        self.matrix = None
+
+    def lookup(self, vector, passages=None):
+        # Returns (answer, sources) of the closest earlier question, or None
+        query = unit(vector)
+        with self.lock:
+            self.expire()
+            best_id = None
+            if self.vectors:
+                if self.matrix is None:
+                    self.ids = list(self.vectors)
+                    self.matrix = np.vstack(list(self.vectors.values()))
+                scores = self.matrix @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    best_id = self.ids[best]
+
+            if best_id is None:
+                self.misses += 1
+                return None
+
+            answer, sources, passage_ids, created = self.db.execute(
+                "SELECT answer, sources, passage_ids, created FROM answers WHERE id = ?", (best_id,)
+            ).fetchone()
+
+        if passages is not None and not still_current(passages, json.loads(passage_ids), created):
+            with self.lock:
+                self.remove([best_id])
+                self.db.commit()
+                self.misses += 1
+            return None
+
+        with self.lock:
+            self.db.execute("UPDATE answers SET last_used = ? WHERE id = ?", (time.time(), best_id))
+            self.db.commit()
+            self.hits += 1
+        return answer, json.loads(sources)
+
+    def store(self, question, vector, answer, sources, passage_ids):
+        now = time.time()
+        vector = unit(vector)
+        with self.lock:
+            cursor = self.db.execute(
+                "INSERT INTO answers (model, question, vector, answer, sources, passage_ids, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.model_name, question, vector.tobytes(), answer, json.dumps(sources),
+                 json.dumps(passage_ids), now, now),
+            )
+            self.vectors[cursor.lastrowid] = vector
+            self.matrix = None
+
+            overflow = len(self.vectors) - self.max_entries
+            if overflow > 0:
+                oldest = [row[0] for row in self.db.execute(
+                    "SELECT id FROM answers WHERE model = ? ORDER BY last_used LIMIT ?", (self.model_name, overflow)
+                )]
+                self.remove(oldest)
+            self.db.commit()
+
+    def expire(self):
+        expired = [row[0] for row in self.db.execute(
+            "SELECT id FROM answers WHERE model = ? AND created < ?", (self.model_name, time.time() - self.ttl)
+        )]
+        if expired:
+            self.remove(expired)
+            self.db.commit()
+
+    def remove(self, ids):
+        self.db.executemany("DELETE FROM answers WHERE id = ?", [(entry_id,) for entry_id in ids])
+        for entry_id in ids:
+            self.vectors.pop(entry_id, None)
+        self.matrix = None
+
+    def report(self):
+        total = self.hits + self.misses
+        if total == 0:
+            return "Answer cache: not used yet"
+        return f"Answer cache: {self.hits} of {total} questions answered from the cache ({self.hits / total:.0%})"
+
+
+def unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector) or 1.0
+    return vector / norm
+
+
+def still_current(passages, passage_ids, created):
+    # Every passage must still exist and must not have been indexed again after the answer
+    if not passage_ids:
+        return True
+    found = list(passages.find({"_id": {"$in": passage_ids}}, {"indexed_at": 1}))
+    if len(found) < len(set(passage_ids)):
+        return False
+    for passage in found:
+        indexed_at = passage.get("indexed_at")
+        if indexed_at is None:
+            continue
+        if indexed_at.tzinfo is None:
+            # pymongo hands back naive datetimes in UTC
+            indexed_at = indexed_at.replace(tzinfo=timezone.utc)
+        if indexed_at.timestamp() > created:
+            return False
+    return True
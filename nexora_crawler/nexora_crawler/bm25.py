@@ -0,0 +1,120 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+
+# A BM25 keyword index over the passages, kept on disk in SQLite.
+# Vector search is good at meaning but misses exact terms like error codes,
+# product names and API identifiers; this index finds those.
+#
+# Passages are added (and replaced) as the indexer writes them, grouped by their
+# parent document so a re-indexed document drops its old passages in one go.
+
+DEFAULT_INDEX_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache", "bm25.sqlite"
+)
+
+# Keeps identifiers like "err_404", "api.v2" or "E-1234" together as one term
+TOKEN = re.compile(r"[a-z0-9](?:[a-z0-9_.\-]*[a-z0-9])?")
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "how", "i", "in", "is", "it",
+    "of", "on", "or", "that", "the", "this", "to", "was", "what", "when", "where", "which", "who",
+    "why", "with", "you",
+}
+
+
+def tokenize(text):
+    return [token for token in TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    def __init__(self, path=DEFAULT_INDEX_PATH, k1=1.2, b=0.75):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.k1 = k1
+        self.b = b
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS docs (id TEXT PRIMARY KEY, parent TEXT, length INTEGER NOT NULL);
+            CREATE INDEX IF NOT EXISTS docs_parent ON docs (parent);
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL, doc_id TEXT NOT NULL, tf INTEGER NOT NULL,
+                PRIMARY KEY (term, doc_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc_id);
+            """
+        )
+        self.db.commit()
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def replace_parent(self, parent, docs):
+        # docs: list of (passage id, text) that now make up this parent document
+        with self.lock:
+            old = [row[0] for row in self.db.execute("SELECT id FROM docs WHERE parent = ?", (parent,))]
+            self.delete_ids(old)
+            for doc_id, text in docs:
+                terms = Counter(tokenize(text))
+                self.db.execute(
+                    "INSERT OR REPLACE INTO docs (id, parent, length) VALUES (?, ?, ?)",
+                    (doc_id, parent, sum(terms.values())),
+                )
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO postings (term, doc_id, tf) VALUES (?, ?, ?)",
+                    [(term, doc_id, tf) for term, tf in terms.items()],
+                )
+            self.db.commit()
+
+    def delete_ids(self, ids):
+        self.db.executemany("DELETE FROM postings WHERE doc_id = ?", [(doc_id,) for doc_id in ids])
+        self.db.executemany("DELETE FROM docs WHERE id = ?", [(doc_id,) for doc_id in ids])
+
+    def search(self, query, k=20):
+        # Returns [(passage id, score)], best first
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+
+        with self.lock:
+            n_docs, total_length = self.db.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs").fetchone()
+            if n_docs == 0:
+                return []
+            average_length = total_length / n_docs
+
+            scores = Counter()
+            for term in terms:
+                postings = self.db.execute(
+                    "SELECT p.doc_id, p.tf, d.length FROM postings p JOIN docs d ON d.id = p.doc_id WHERE p.term = ?",
+                    (term,),
+                ).fetchall()
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf, length in postings:
+                    norm = self.k1 * (1 - self.b + self.b * length / average_length)
+                    scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        return scores.most_common(k)
+
+    def rebuild_from_mongo(self, passages, batch_size=1000):
+        # One-off backfill for passages that were indexed before this index existed
+        current_parent, current_docs = None, []
+        count = 0
+        cursor = passages.find({}, {"_id": 1, "parent_id": 1, "text": 1}).sort("parent_id", 1).batch_size(batch_size)
+        for doc in cursor:
+            parent = str(doc["parent_id"])
+            if parent != current_parent and current_docs:
+                self.replace_parent(current_parent, current_docs)
+                current_docs = []
+            current_parent = parent
+            current_docs.append((str(doc["_id"]), doc.get("text", "")))
+            count += 1
+        if current_docs:
+            self.replace_parent(current_parent, current_docs)
+        return count
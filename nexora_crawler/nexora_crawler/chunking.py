@@ -0,0 +1,102 @@
+import re
+
+# Splits long documents into overlapping passages that fit the embedding model
+# and can be retrieved on their own. PDF text keeps its pages separated by "\f"
+# (see pdf_worker.py), so every passage knows which pages it came from.
+
+PAGE_BREAK = "\f"
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def estimate_tokens(text):
+    # Roughly 4 characters per token for English text; good enough for budgeting
+    return len(text) // 4
+
+
+def split_into_passages(text, max_tokens=400, overlap_tokens=50):
+    # Greedily packs paragraphs into passages of up to `max_tokens`. Each new passage
+    # starts with the last paragraphs of the previous one (up to `overlap_tokens`),
+    # so a sentence near a boundary is never cut off from its context.
+    passages = []
+    current = []
+    current_tokens = 0
+
+    for page, unit in iter_units(text, max(max_tokens - overlap_tokens, 1)):
+        tokens = estimate_tokens(unit)
+        if current and current_tokens + tokens > max_tokens:
+            passages.append(make_passage(current))
+            current = overlap_tail(current, overlap_tokens)
+            current_tokens = sum(estimate_tokens(u) for _, u in current)
+        current.append((page, unit))
+        current_tokens += tokens
+
+    if current:
+        passages.append(make_passage(current))
+    return passages
+
+
+def iter_units(text, max_tokens):
+    # Yields (page number, paragraph) pairs, splitting paragraphs that are too long
+    for page_number, page in enumerate(text.split(PAGE_BREAK), start=1):
+        for paragraph in PARAGRAPH_BREAK.split(page):
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+            if estimate_tokens(paragraph) <= max_tokens:
+                yield page_number, paragraph
+            else:
+                for piece in split_long(paragraph, max_tokens):
+                    yield page_number, piece
+
+
+def split_long(paragraph, max_tokens):
+    # First along sentences, then (for very long sentences) along words,
+    # and as a last resort (e.g. a huge unbroken token) at a fixed width
+    max_chars = max_tokens * 4
+    piece = ""
+    for sentence in SENTENCE_END.split(paragraph):
+        for word in sentence.split() if len(sentence) > max_chars else [sentence]:
+            while len(word) > max_chars:
+                if piece:
+                    yield piece
+                    piece = ""
+                yield word[:max_chars]
+                word = word[max_chars:]
+            if piece and len(piece) + len(word) + 1 > max_chars:
+                yield piece
+                piece = ""
+            piece = f"{piece} {word}" if piece else word
+    if piece:
+        yield piece
+
+
+def overlap_tail(units, overlap_tokens):
+    # Whole paragraphs from the end while they fit, then the last sentences of the next one
+    tail = []
+    tokens = 0
+    for page, unit in reversed(units):
+        if tokens + estimate_tokens(unit) <= overlap_tokens:
+            tail.insert(0, (page, unit))
+            tokens += estimate_tokens(unit)
+            continue
+
+        sentences = []
+        for sentence in reversed(SENTENCE_END.split(unit)):
+            if tokens + estimate_tokens(sentence) > overlap_tokens:
+                break
+            sentences.insert(0, sentence)
+            tokens += estimate_tokens(sentence)
+        if sentences:
+            tail.insert(0, (page, " ".join(sentences)))
+        break
+    return tail
+
+
+def make_passage(units):
+    pages = [page for page, _ in units]
+    return {
+        "text": "\n\n".join(unit for _, unit in units),
+        "page_start": min(pages),
+        "page_end": max(pages),
+    }
@@ -0,0 +1,212 @@
+import functools
+import re
+
+from lxml import etree
+
+# Pulls the main text out of an HTML page, without a browser and without knowing
+# the site: what ContentExtractionPipeline stores as text_content for every page.
+#
+#   1. The content root is <main> (or role="main") if the page has one, a lone
+#      <article> otherwise, else the whole <body>.
+#   2. Boilerplate in it goes: scripts and styles, <nav>, <footer>, <aside>, site
+#      headers, hidden elements, ARIA landmarks like role="navigation", and elements
+#      whose class or id says what they are (menu, sidebar, cookie-banner, share, ...).
+#   3. Blocks that are mostly link text (menus and "related pages" lists without
+#      any of the markup above) are skipped, unless that would leave nothing:
+#      then the page is a list of links, and the links are its content.
+#   4. The text comes out one block per paragraph (blank lines between, which is
+#      where chunking.py splits), with headings as "# Title", "## Section", ... so
+#      the structure survives into the passages, list items as "- item" and table
+#      cells separated by " | ". <pre> blocks keep their line breaks.
+#
+# lxml parses in C and the rest is one or two passes over the tree, so a typical
+# page takes around a millisecond (run_benchmarks.py measures it).
+
+BOILERPLATE_TAGS = (
+    "script", "style", "noscript", "template", "svg", "canvas", "iframe", "object", "embed",
+    "nav", "footer", "aside", "dialog", "button", "select", "input", "textarea", "label",
+)
+BOILERPLATE_ROLES = {"navigation", "banner", "contentinfo", "complementary", "search", "menu", "menubar", "dialog", "alert"}
+# Words in a class or id that mark boilerplate, unless the same name also says it is content
+BOILERPLATE_WORDS = {
+    "nav", "navbar", "navigation", "menu", "footer", "sidebar", "breadcrumb", "breadcrumbs", "cookie", "cookies",
+    "consent", "banner", "share", "sharing", "social", "comment", "comments", "advert", "advertisement", "ad", "ads",
+    "promo", "related", "subscribe", "newsletter", "skip", "toc", "pagination", "pager", "masthead", "popup", "modal",
+}
+CONTENT_WORDS = {"content", "main", "article", "post", "body", "entry", "text"}
+NAME_SEPARATORS = re.compile(r"[-_]")
+HIDDEN_STYLE = re.compile(r"display\s*:\s*none|visibility\s*:\s*hidden")
+
+HEADINGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+BLOCK_TAGS = HEADINGS | {
+    "address", "article", "blockquote", "body", "caption", "center", "dd", "details", "div", "dl", "dt",
+    "fieldset", "figcaption", "figure", "form", "header", "hr", "li", "main", "ol", "p", "section", "summary",
+    "table", "tbody", "tfoot", "thead", "tr", "ul",
+}
+CELL_TAGS = {"td", "th"}
+# Blocks that can be a menu in disguise, and how much of their text may be links.
+# Not <p>: "Read the docs and the API reference" is mostly link text, but it is prose.
+LINK_BLOCKS = {"div", "section", "ul", "ol", "dl", "table", "header", "form"}
+MAX_LINK_DENSITY = 0.5
+
+# Plain lxml elements rather than lxml.html's: no per-element class lookup in Python.
+# Comments go while parsing; their tails (the text after them) stay where they were.
+PARSER = etree.HTMLParser(remove_comments=True, remove_pis=True)
+UTF8_PARSER = etree.HTMLParser(remove_comments=True, remove_pis=True, encoding="utf-8")
+
+
+def extract_main_content(page):
+    # `page` is the HTML as text (response.text, decoded the way the server said) or
+    # UTF-8 bytes. Returns "" for an empty page.
+    doc = parse(page)
+    if doc is None:
+        return ""
+    body = doc.find("body")
+    if body is None:
+        body = doc
+
+    # Everything outside the content root is dropped anyway, so only the root is cleaned up
+    root = content_root(body)
+    remove_boilerplate(root)
+    blocks = render(root, link_heavy_blocks(root)) or render(root, set())
+
+    title = " ".join((doc.findtext(".//title") or "").split())
+    if title and not any(block.startswith("#") for block in blocks):
+        blocks.insert(0, f"# {title}")
+    return "\n\n".join(blocks)
+
+
+def parse(page):
+    if isinstance(page, bytes):
+        page = page.decode("utf-8", errors="replace")
+    try:
+        return etree.fromstring(page, PARSER)  # None for nothing but whitespace
+    except ValueError:
+        # Text with an <?xml encoding=...?> declaration: lxml only takes that as bytes
+        return etree.fromstring(page.encode("utf-8"), UTF8_PARSER)
+
+
+def remove_boilerplate(root):
+    found = list(root.iter(*BOILERPLATE_TAGS))
+    # The site header, not the header of an article (or one holding the page title)
+    found += [header for header in root.iter("header") if not header.xpath("ancestor::main or ancestor::article or .//h1")]
+    # Syntax highlighters name their spans after the code ("hljs-comment", "token comment"),
+    # not after what the page is made of
+    in_code = {element for block in root.iter("pre", "code") for element in block.iter()}
+
+    for element in root.xpath(".//*[@class or @id or @role or @hidden or @aria-hidden or @style]"):
+        if (
+            element.get("hidden") is not None
+            or element.get("aria-hidden") == "true"
+            or HIDDEN_STYLE.search(element.get("style", ""))
+            or element.get("role", "").lower() in BOILERPLATE_ROLES
+        ):
+            found.append(element)
+        elif element not in in_code and is_boilerplate_name(f"{element.get('class', '')} {element.get('id', '')}"):
+            # A badly named wrapper around the actual content stays
+            if not element.xpath("self::main or self::article or .//main or .//article or .//h1"):
+                found.append(element)
+
+    for element in found:
+        if element.getparent() is not None:
+            drop(element)
+
+
+def drop(element):
+    # Removes the element but not the text that follows it (its tail)
+    parent = element.getparent()
+    if element.tail:
+        previous = element.getprevious()
+        if previous is not None:
+            previous.tail = (previous.tail or "") + element.tail
+        else:
+            parent.text = (parent.text or "") + element.tail
+    parent.remove(element)
+
+
+# Pages repeat the same few class names on thousands of elements
+@functools.lru_cache(maxsize=4096)
+def is_boilerplate_name(names):
+    for name in names.lower().split():
+        words = set(NAME_SEPARATORS.split(name))
+        if words & BOILERPLATE_WORDS and not words & CONTENT_WORDS:
+            return True
+    return False
+
+
+def content_root(body):
+    mains = body.xpath(".//main | .//*[@role='main']")
+    if mains:
+        return max(mains, key=lambda element: len("".join(element.itertext())))
+    articles = body.xpath(".//article")
+    if len(articles) == 1:
+        return articles[0]
+    return body  # several articles is a listing page: all of them are the content
+
+
+def link_heavy_blocks(root):
+    # One bottom-up pass: the length of every element's text and of the link text in it
+    text_length = {}
+    link_length = {}
+    heavy = set()
+    for _, element in etree.iterwalk(root, events=("end",)):
+        total = len((element.text or "").strip())
+        links = 0
+        for child in element:
+            total += text_length.get(child, 0) + len((child.tail or "").strip())
+            links += link_length.get(child, 0)
+        if element.tag == "a":
+            links = total
+        text_length[element] = total
+        link_length[element] = links
+        if element.tag in LINK_BLOCKS and total and links / total > MAX_LINK_DENSITY:
+            heavy.add(element)
+    return heavy
+
+
+def render(root, skip):
+    blocks = []
+    parts = []
+    kinds = []  # the block elements we are inside, innermost last
+    walker = etree.iterwalk(root, events=("start", "end"))
+    for event, element in walker:
+        tag = element.tag
+        if event == "start":
+            if element in skip:
+                walker.skip_subtree()
+                continue
+            if tag == "pre":
+                flush(blocks, parts, kinds[-1] if kinds else None)
+                code = "".join(element.itertext()).strip("\n")
+                if code.strip():
+                    blocks.append(code)
+                walker.skip_subtree()
+                continue
+            if tag in BLOCK_TAGS:
+                flush(blocks, parts, kinds[-1] if kinds else None)
+                kinds.append(tag)
+            elif tag == "br":
+                parts.append(" ")
+            elif tag in CELL_TAGS and "".join(parts).strip():
+                parts.append(" | ")
+            if element.text:
+                parts.append(element.text)
+        else:
+            if tag in BLOCK_TAGS and tag != "pre" and element not in skip:
+                flush(blocks, parts, kinds.pop())
+            if element is not root and element.tail:
+                parts.append(element.tail)
+    flush(blocks, parts, kinds[-1] if kinds else None)
+    return blocks
+
+
+def flush(blocks, parts, kind):
+    text = " ".join("".join(parts).split())
+    parts.clear()
+    if not text:
+        return
+    if kind in HEADINGS:
+        text = "#" * int(kind[1]) + " " + text
+    elif kind == "li":
+        text = "- " + text
+    blocks.append(text)
@@ -0,0 +1,148 @@
+import numpy as np
+from langchain_core.documents import Document
+
+from nexora_crawler.bm25 import tokenize
+from nexora_crawler.chunking import SENTENCE_END, estimate_tokens
+from nexora_crawler.vector_codec import VECTOR_FIELD, decode_vector
+
+# Builds the context for the LLM from what the retriever found, between
+# retriever.ainvoke and the LLM call:
+#
+#   1. The retriever over-fetches (CONTEXT_FETCH_K candidates instead of 3).
+#   2. Maximal marginal relevance picks up to CONTEXT_MAX_PASSAGES of them: each next
+#      passage is the one most similar to the question and least similar to the
+#      passages already picked, so three near-copies don't fill all the slots.
+#   3. If the picked passages are longer than CONTEXT_MAX_TOKENS together, their
+#      sentences are ranked by the question words they contain plus their passage's
+#      similarity to the question, and only the best ones are kept (in their original
+#      order, so the text still reads naturally).
+#
+# The passage vectors come from the embedding cache, where the indexer put them when
+# it embedded the same texts. This runs on every question, so it never calls the
+# embedding API: passages missing from the cache (indexed on another machine, or the
+# cache was trimmed) are read with their stored vectors from the passages collection.
+# A passage with no vector anywhere keeps its place in the retriever's ranking, and
+# MMR picks the other places from the rest.
+
+
+class ContextBudgeter:
+    def __init__(self, embeddings, passages=None, max_tokens=1500, max_passages=3, mmr_lambda=0.7):
+        self.embeddings = embeddings
+        self.passages = passages
+        self.max_tokens = max_tokens
+        self.max_passages = max_passages
+        self.mmr_lambda = mmr_lambda  # 1 = relevance only, 0 = diversity only
+        self.queries = 0
+        self.tokens_saved = 0
+        self.from_mongo = 0  # passage vectors read from Mongo because the cache didn't have them
+        self.unranked = 0  # passages with no vector at all, left in the retriever's order
+
+    def select(self, query, query_vector, docs):
+        # Returns (the passages for the prompt, a usage dict for reporting)
+        if not docs:
+            return [], {"candidates": 0, "passages": 0, "tokens": 0, "baseline_tokens": 0, "tokens_saved": 0}
+
+        vectors = self.passage_vectors(docs)
+        scored = [i for i, vector in enumerate(vectors) if vector is not None]
+        self.unranked += len(docs) - len(scored)
+
+        # The retriever's top places of passages without a vector stay theirs; the
+        # others are filled by MMR over the passages we have vectors for
+        top = range(min(self.max_passages, len(docs)))
+        kept = [i for i in top if vectors[i] is None]
+        relevance = np.zeros(len(docs), dtype=np.float32)  # no vector: trimmed by the question words alone
+        picked = []
+        if scored:
+            matrix = normalize(np.asarray([vectors[i] for i in scored], dtype=np.float32))
+            query_vec = normalize(np.asarray(query_vector, dtype=np.float32)[None, :])[0]
+            relevance[scored] = matrix @ query_vec
+            picked = [scored[i] for i in mmr(relevance[scored], matrix, len(top) - len(kept), self.mmr_lambda)]
+        order = iter(picked)
+        chosen = [i if i in kept else next(order) for i in top]
+        selected = self.trim(query, [docs[i] for i in chosen], relevance[chosen])
+
+        # What the prompt would have held without this stage: the top passages, whole
+        baseline = sum(estimate_tokens(doc.page_content) for doc in docs[:self.max_passages])
+        used = sum(estimate_tokens(doc.page_content) for doc in selected)
+        self.queries += 1
+        self.tokens_saved += max(baseline - used, 0)
+        return selected, {
+            "candidates": len(docs),
+            "passages": len(selected),
+            "tokens": used,
+            "baseline_tokens": baseline,
+            "tokens_saved": max(baseline - used, 0),
+        }
+
+    def passage_vectors(self, docs):
+        # One vector (or None) per doc: from the embedding cache, else stored with the passage
+        vectors = self.embeddings.cached_documents([doc.page_content for doc in docs])
+        missing = {str(doc.metadata.get("_id")): i for i, doc in enumerate(docs)
+                   if vectors[i] is None and doc.metadata.get("_id") is not None}
+        if missing and self.passages is not None:
+            for passage in self.passages.find({"_id": {"$in": list(missing)}, VECTOR_FIELD: {"$exists": True}},
+                                              {VECTOR_FIELD: 1}):
+                vectors[missing[str(passage["_id"])]] = decode_vector(passage[VECTOR_FIELD])
+                self.from_mongo += 1
+        return vectors
+
+    def trim(self, query, docs, relevance):
+        total = sum(estimate_tokens(doc.page_content) for doc in docs)
+        if total <= self.max_tokens:
+            return docs
+
+        terms = set(tokenize(query))
+        sentences = []  # (score, doc index, sentence index, text)
+        split = [SENTENCE_END.split(doc.page_content) for doc in docs]
+        for doc_index, parts in enumerate(split):
+            for sentence_index, sentence in enumerate(parts):
+                words = tokenize(sentence)
+                overlap = len(terms.intersection(words)) / max(len(terms), 1)
+                sentences.append((overlap + float(relevance[doc_index]), doc_index, sentence_index, sentence))
+
+        kept = set()
+        budget = self.max_tokens
+        ranked = sorted(sentences, key=lambda s: -s[0])
+        for score, doc_index, sentence_index, sentence in ranked:
+            tokens = estimate_tokens(sentence)
+            if tokens <= budget:
+                kept.add((doc_index, sentence_index))
+                budget -= tokens
+        if not kept:
+            # Not even one sentence fits (text without punctuation): the start of the best one
+            _, doc_index, sentence_index, sentence = ranked[0]
+            split[doc_index][sentence_index] = sentence[:self.max_tokens * 4]
+            kept.add((doc_index, sentence_index))
+
+        trimmed = []
+        for doc_index, (doc, parts) in enumerate(zip(docs, split)):
+            text = " ".join(sentence for i, sentence in enumerate(parts) if (doc_index, i) in kept)
+            if text:
+                trimmed.append(Document(page_content=text, metadata=doc.metadata))
+        return trimmed
+
+    def report(self):
+        if self.queries == 0:
+            return "Context budget: not used yet"
+        return (
+            f"Context budget: {self.tokens_saved:,} prompt tokens saved over {self.queries} questions "
+            f"(~{self.tokens_saved // self.queries:,} per question, "
+            f"{self.from_mongo} passage vectors read from Mongo, {self.unranked} passages without one)"
+        )
+
+
+def mmr(relevance, vectors, count, mmr_lambda):
+    # Indexes of the chosen rows, best first
+    chosen = [int(np.argmax(relevance))]
+    while len(chosen) < min(count, len(relevance)):
+        redundancy = (vectors @ vectors[chosen].T).max(axis=1)
+        scores = mmr_lambda * relevance - (1 - mmr_lambda) * redundancy
+        scores[chosen] = -np.inf
+        chosen.append(int(np.argmax(scores)))
+    return chosen
+
+
+def normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
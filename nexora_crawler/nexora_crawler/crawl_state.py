@@ -0,0 +1,27 @@
+import os
+import pymongo
+
+
+def load_crawl_state(fields):
+    # Read what we stored on the last crawl for every URL, keyed by source_url, and
+    # also by the URL we asked for when a redirect took us there: requests are made
+    # for that one. This runs once when the spider opens, so lookups during the crawl never hit the network.
+    client = pymongo.MongoClient(os.getenv("MONGO_URI"))
+    try:
+        projection = {"_id": 0, "source_url": 1, "requested_url": 1}
+        projection.update({field: 1 for field in fields})
+        cursor = client["nexora_db"]["raw_materials"].find(
+            {"source_url": {"$exists": True}}, projection
+        )
+        state = {}
+        redirected = []
+        for doc in cursor:
+            state[doc["source_url"]] = doc
+            if doc.get("requested_url") and doc["requested_url"] != doc["source_url"]:
+                redirected.append(doc)
+        for doc in redirected:
+            # A page stored under its own URL wins over a redirect to somewhere else
+            state.setdefault(doc["requested_url"], doc)
+        return state
+    finally:
+        client.close()
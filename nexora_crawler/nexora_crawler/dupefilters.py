@@ -0,0 +1,141 @@
+import logging
+import math
+import mmap
+import os
+
+from scrapy.dupefilters import RFPDupeFilter
+from scrapy.utils.job import job_dir
+
+# Scrapy's default dupefilter keeps every request fingerprint in a Python set
+# (and appends it to JOBDIR/requests.seen), so memory grows with every URL seen.
+# A Bloom filter answers "seen before?" from a fixed-size bit array instead:
+# 10 million URLs at a 1-in-a-million false positive rate fit in about 36 MB,
+# however long the crawl runs. The price is that a tiny fraction of new URLs is
+# wrongly taken as seen and skipped.
+#
+# With JOBDIR the bit array is a memory-mapped file (JOBDIR/requests.bloom), so a
+# paused or crashed crawl resumes with everything it had seen. Without JOBDIR
+# it lives in anonymous memory and is gone when the crawl ends.
+
+MAGIC = b"NXBLOOM1"
+# magic, number of bits, number of hash functions, number of URLs added
+HEADER_SIZE = 32
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate, path=None):
+        if os.path.exists(path or ""):
+            self.file = open(path, "r+b")
+            header = self.file.read(HEADER_SIZE)
+            if header[:8] != MAGIC:
+                raise ValueError(f"{path} is not a Bloom filter file")
+            # A resumed crawl keeps the size it started with, whatever the settings say now
+            self.bits = int.from_bytes(header[8:16], "big")
+            self.hashes = int.from_bytes(header[16:24], "big")
+            self.count = int.from_bytes(header[24:32], "big")
+            self.map = mmap.mmap(self.file.fileno(), 0)
+        else:
+            # The standard sizing: m = -n ln(p) / ln(2)^2 bits and k = m/n ln(2) hash functions
+            self.bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+            self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+            self.count = 0
+            size = HEADER_SIZE + (self.bits + 7) // 8
+            if path:
+                self.file = open(path, "w+b")
+                self.file.truncate(size)  # a sparse file: only the pages we touch take disk space
+                self.map = mmap.mmap(self.file.fileno(), size)
+            else:
+                self.file = None
+                self.map = mmap.mmap(-1, size)
+            self.map[:8] = MAGIC
+            self.write_header()
+        self.capacity = capacity
+
+    def positions(self, fingerprint):
+        # The fingerprint is already a SHA1, so two slices of it serve as independent
+        # hashes, and (h1 + i * h2) gives the k positions (Kirsch-Mitzenmacher)
+        h1 = int.from_bytes(fingerprint[:8], "big")
+        h2 = int.from_bytes(fingerprint[8:16], "big") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, fingerprint):
+        # Returns True if the fingerprint was (probably) there already
+        seen = True
+        for position in self.positions(fingerprint):
+            index = HEADER_SIZE + (position >> 3)
+            mask = 1 << (position & 7)
+            byte = self.map[index]
+            if not byte & mask:
+                self.map[index] = byte | mask
+                seen = False
+        if not seen:
+            self.count += 1
+        return seen
+
+    def __contains__(self, fingerprint):
+        return all(self.map[HEADER_SIZE + (position >> 3)] & (1 << (position & 7))
+                   for position in self.positions(fingerprint))
+
+    def __len__(self):
+        return self.count
+
+    def false_positive_rate(self):
+        # The expected rate at the current fill: (1 - e^(-kn/m))^k
+        return (1 - math.exp(-self.hashes * self.count / self.bits)) ** self.hashes
+
+    def write_header(self):
+        self.map[8:16] = self.bits.to_bytes(8, "big")
+        self.map[16:24] = self.hashes.to_bytes(8, "big")
+        self.map[24:32] = self.count.to_bytes(8, "big")
+
+    def close(self):
+        self.write_header()
+        self.map.flush()
+        self.map.close()
+        if self.file:
+            self.file.close()
+
+
+class BloomDupeFilter(RFPDupeFilter):
+    # A drop-in DUPEFILTER_CLASS. Fingerprints, logging and the dupefilter/filtered
+    # stat work like RFPDupeFilter; only the storage is different.
+
+    def __init__(self, path=None, debug=False, *, fingerprinter=None, capacity=10_000_000, error_rate=1e-6, stats=None):
+        super().__init__(None, debug, fingerprinter=fingerprinter)
+        self.logger = logging.getLogger(__name__)
+        self.stats = stats
+        self.warned_full = False
+        self.bloom = BloomFilter(capacity, error_rate, os.path.join(path, "requests.bloom") if path else None)
+        if len(self.bloom):
+            self.logger.info("Resuming with %d URLs already seen (%s)", len(self.bloom), path)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(
+            job_dir(settings),
+            settings.getbool("DUPEFILTER_DEBUG"),
+            fingerprinter=crawler.request_fingerprinter,
+            capacity=settings.getint("BLOOM_CAPACITY", 10_000_000),
+            error_rate=settings.getfloat("BLOOM_ERROR_RATE", 1e-6),
+            stats=crawler.stats,
+        )
+
+    def request_seen(self, request):
+        seen = self.bloom.add(self._fingerprint(request))
+        if not seen and len(self.bloom) > self.bloom.capacity and not self.warned_full:
+            # Still works, but the false positive rate climbs from here on
+            self.logger.warning(
+                "More than BLOOM_CAPACITY=%d URLs seen; expected false positive rate is now %.2g. "
+                "Start the next crawl with a larger BLOOM_CAPACITY.",
+                self.bloom.capacity, self.bloom.false_positive_rate(),
+            )
+            self.warned_full = True
+        return seen
+
+    def close(self, reason):
+        if self.stats:
+            self.stats.set_value("bloom/urls_seen", len(self.bloom))
+            self.stats.set_value("bloom/megabytes", round(self.bloom.bits / 8 / 1e6, 1))
+            self.stats.set_value("bloom/false_positive_rate", self.bloom.false_positive_rate())
+        self.bloom.close()
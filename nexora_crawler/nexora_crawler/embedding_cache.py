@@ -0,0 +1,173 @@
+import hashlib
+import inspect
+import os
+import sqlite3
+import threading
+import time
+from array import array
+
+from langchain_core.embeddings import Embeddings
+
+# A persistent cache of embeddings, shared by indexer.py and console_app.py.
+# Identical text (boilerplate pages, the same PDF under two URLs, repeated
+# questions) is only ever sent to the embedding API once per model.
+
+DEFAULT_CACHE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache", "embeddings.sqlite"
+)
+
+
+def normalize(text):
+    # Whitespace differences alone shouldn't cost another API call
+    return " ".join(text.split())
+
+
+class EmbeddingCache:
+    # SQLite table of key -> float32 vector, trimmed to `max_entries` by evicting
+    # the least recently used rows.
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=200000):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self.db.commit()
+        self.count = self.db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, keys):
+        found = {}
+        now = time.time()
+        with self.lock:
+            # SQLite limits the number of "?" in one statement, so we ask in slices
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                marks = ",".join("?" * len(chunk))
+                rows = self.db.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({marks})", chunk)
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+            if found:
+                self.db.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+                self.db.commit()
+        return found
+
+    def put_many(self, items):
+        now = time.time()
+        with self.lock:
+            cursor = self.db.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, array("f", vector).tobytes(), now) for key, vector in items],
+            )
+            self.count += max(cursor.rowcount, 0)
+            if self.count > self.max_entries:
+                overflow = self.count - self.max_entries
+                self.db.execute(
+                    "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (overflow,),
+                )
+                self.count -= overflow
+            self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+class CachedEmbeddings(Embeddings):
+    # Wraps any LangChain embeddings object (e.g. GoogleGenerativeAIEmbeddings)
+    # and answers from the cache first. Only the misses go to the real model.
+
+    def __init__(self, embeddings, model_name, cache):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+        self.api_seconds = 0.0
+
+    def key(self, kind, text):
+        # Queries and documents are embedded differently by Gemini, so they are cached apart
+        digest = hashlib.sha256(normalize(text).encode("utf-8")).hexdigest()
+        return f"{self.model_name}:{kind}:{digest}"
+
+    def embed_documents(self, texts):
+        return self.embed_cached("document", texts, self.embeddings.embed_documents)
+
+    def cached_documents(self, texts):
+        # Only what the cache already has, never an API call: None for each miss
+        keys = [self.key("document", text) for text in texts]
+        found = self.cache.get_many(list(set(keys)))
+        return [found.get(key) for key in keys]
+
+    def embed_cached(self, kind, texts, embed_missing):
+        keys = [self.key(kind, text) for text in texts]
+        found = self.cache.get_many(list(set(keys)))
+
+        # Embed each missing text once, even if it appears several times in this call
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+
+        seconds = 0.0
+        if missing:
+            started = time.monotonic()
+            vectors = embed_missing(list(missing.values()))
+            seconds = time.monotonic() - started
+            new = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(new.items())
+            found.update(new)
+
+        self.record(len(texts) - len(missing), len(missing), seconds)
+        return [found[key] for key in keys]
+
+    def embed_query(self, text):
+        key = self.key("query", text)
+        found = self.cache.get_many([key])
+        if key in found:
+            self.record(1, 0)
+            return found[key]
+
+        started = time.monotonic()
+        vector = self.embeddings.embed_query(text)
+        self.record(0, 1, time.monotonic() - started)
+        self.cache.put_many([(key, vector)])
+        return vector
+
+    def record(self, hits, misses, api_seconds=0.0):
+        # The indexer's worker threads and asyncio.to_thread callers embed at the same
+        # time, and += on an attribute is not atomic: the cache's lock guards the counts
+        with self.cache.lock:
+            self.hits += hits
+            self.misses += misses
+            self.api_seconds += api_seconds
+
+    def embed_queries(self, texts):
+        # Several questions in one API call (chat_server.py batches concurrent users this way)
+        return self.embed_cached("query", texts, self.embed_missing_queries)
+
+    def embed_missing_queries(self, texts):
+        # Gemini takes the task type per call, so a batch of queries is one embed_documents call.
+        # Models without that option embed the queries one by one.
+        if "task_type" in inspect.signature(self.embeddings.embed_documents).parameters:
+            return self.embeddings.embed_documents(texts, task_type="retrieval_query")
+        return [self.embeddings.embed_query(text) for text in texts]
+
+    def report(self):
+        with self.cache.lock:
+            hits, misses, api_seconds = self.hits, self.misses, self.api_seconds
+        total = hits + misses
+        if total == 0:
+            return "Embedding cache: not used yet"
+        # What the hits would have cost at the average speed of the real calls
+        saved = hits * api_seconds / max(misses, 1)
+        return (
+            f"Embedding cache: {hits} hits, {misses} misses ({hits / total:.0%} hit rate), "
+            f"~{saved:.1f}s of embedding calls saved"
+        )
@@ -0,0 +1,77 @@
+import bisect
+import os
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+from nexora_crawler.metrics import BUCKETS, Profiler, metrics
+
+
+class StageTimingExtension:
+    # Times every download (plain HTTP or Playwright) and collects the timings of
+    # the item pipelines, so a slow crawl shows which stage the time goes to. The
+    # pipelines time their own process_item (metrics.timed_pipeline_stage).
+    #
+    # The histograms go into the stats collector (and so into the crawl's stats dump):
+    #   timing/pipeline/<Pipeline>/count, /total_ms, /max_ms, /le_<bound>ms (when the spider closes)
+    #   timing/download/<http|playwright>/...
+    # and into nexora_crawler.metrics, which is exported to METRICS_EXPORT_PATH when
+    # the spider closes. PROFILE_OUTPUT profiles the reactor thread during the crawl.
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.export_path = crawler.settings.get("METRICS_EXPORT_PATH") or os.getenv("METRICS_EXPORT_PATH")
+        profile_output = crawler.settings.get("PROFILE_OUTPUT") or os.getenv("PROFILE_OUTPUT")
+        self.profiler = Profiler(profile_output) if profile_output else None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("METRICS_ENABLED"):
+            raise NotConfigured
+        extension = cls(crawler)
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(extension.response_received, signal=signals.response_received)
+        return extension
+
+    def spider_opened(self, spider):
+        if self.profiler:
+            self.profiler.start()
+
+    def spider_closed(self, spider):
+        self.record_pipeline_timings()
+        if self.profiler:
+            spider.logger.info("Profile of the crawl:\n%s", self.profiler.stop())
+        path = metrics.export(self.export_path)
+        if path:
+            spider.logger.info("Stage timings written to %s", path)
+
+    def record_pipeline_timings(self):
+        # The pipelines time themselves (metrics.timed_pipeline_stage); into the stats they go
+        for labels, histogram in metrics.snapshot("pipeline"):
+            key = f"timing/pipeline/{labels['stage']}"
+            self.stats.set_value(f"{key}/count", histogram.count)
+            self.stats.set_value(f"{key}/total_ms", histogram.sum * 1000)
+            self.stats.set_value(f"{key}/max_ms", histogram.max * 1000)
+            for index, count in enumerate(histogram.counts):
+                if count:
+                    self.stats.set_value(f"{key}/le_{bucket_name(index)}", count)
+
+    def response_received(self, response, request, spider):
+        latency = request.meta.get("download_latency")
+        if latency is not None:
+            self.observe("download", "route", "playwright" if request.meta.get("playwright") else "http", latency)
+
+    def observe(self, name, label_name, label, seconds):
+        metrics.observe(name, seconds, **{label_name: label})
+        key = f"timing/{name}/{label}"
+        milliseconds = seconds * 1000
+        self.stats.inc_value(f"{key}/count")
+        self.stats.inc_value(f"{key}/total_ms", milliseconds)
+        self.stats.max_value(f"{key}/max_ms", milliseconds)
+        self.stats.inc_value(f"{key}/le_{bucket_name(bisect.bisect_left(BUCKETS, seconds))}")
+
+
+def bucket_name(index):
+    return f"{BUCKETS[index] * 1000:g}ms" if index < len(BUCKETS) else "inf"
@@ -0,0 +1,299 @@
+import os
+import sqlite3
+import time
+
+import pymongo
+from bson.binary import Binary
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+# The shared request queue ("frontier") for crawling with several worker
+# processes (see scheduler.py and crawl_workers.py). Every worker pushes the
+# requests it finds and leases the next one to download from here.
+#
+# One document/row per request, keyed by its fingerprint. That key is also the
+# seen-URL set of the whole fleet: a request whose fingerprint is already there
+# (queued, in progress or done) is not added again, dont_filter or not; the
+# queue outlives a crawl so a stopped crawl can resume, and is emptied to crawl
+# everything again (crawl_workers.py --fresh).
+#
+#   state         queued -> leased -> done (or failed)
+#   available_at  queued: when it may be leased; leased: when the lease runs out
+#                 (lease_seconds after the request's download slot)
+#   attempts      how often it was leased; after max_attempts it is failed
+#
+# A lease is not a delete: if a worker dies with requests in progress, their
+# leases run out after lease_seconds and another worker picks them up. They are
+# only marked done once their callback has finished (and the requests it yielded
+# were pushed), so a crash loses nothing; at worst a page is fetched twice, and
+# MongoPipeline's upserts by source_url keep that to one document.
+#
+# Politeness across the fleet: every domain has a next_at time. Leasing a request
+# reserves the domain's next slot (next_at = slot + delay) and the worker waits
+# until the slot before downloading (FrontierDelayMiddleware). A request whose
+# domain has no slot within max_wait seconds goes back in the queue until then.
+#
+# Two backends with the same methods:
+#   MongoFrontier   collections frontier_<name> and frontier_<name>_domains in
+#                   nexora_db: workers on any number of machines
+#   SqliteFrontier  one SQLite file: workers on this machine, no database needed
+
+QUEUED = "queued"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+
+def open_frontier(uri, name, **options):
+    # FRONTIER_URI: "mongodb" (the MONGO_URI from .env), a mongodb:// URI, or
+    # sqlite:///relative/path (sqlite:////absolute/path, like SQLAlchemy)
+    if uri == "mongodb":
+        uri = os.getenv("MONGO_URI")
+    if uri.startswith("sqlite:///"):
+        return SqliteFrontier(uri[len("sqlite:///"):], name, **options)
+    if uri.startswith(("mongodb://", "mongodb+srv://")):
+        return MongoFrontier(pymongo.MongoClient(uri), name, **options)
+    raise ValueError(f"Unknown FRONTIER_URI '{uri}' (use 'mongodb', a mongodb:// URI or sqlite:///path)")
+
+
+class MongoFrontier:
+    def __init__(self, client, name, lease_seconds=300, max_attempts=3):
+        self.client = client
+        db = client["nexora_db"]
+        self.requests = db[f"frontier_{name}"]
+        self.domains = db[f"frontier_{name}_domains"]
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # Leasing: equality on state, sort by priority, range on available_at
+        self.requests.create_index([("state", 1), ("priority", -1), ("available_at", 1)])
+
+    def push(self, entries):
+        # entries: dicts with _id (fingerprint), url, domain, priority and request (bytes).
+        # Returns how many were new to the frontier.
+        if not entries:
+            return 0
+        now = time.time()
+        docs = [
+            {
+                "_id": entry["_id"], "url": entry["url"], "domain": entry["domain"],
+                "priority": entry["priority"], "request": Binary(entry["request"]),
+                "state": QUEUED, "available_at": now, "attempts": 0,
+            }
+            for entry in entries
+        ]
+        try:
+            self.requests.insert_many(docs, ordered=False)
+            return len(docs)
+        except BulkWriteError as e:
+            # Duplicate keys are the URLs the fleet has already seen
+            if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+                raise
+            return e.details["nInserted"]
+
+    def lease(self, worker, delay, max_wait, tries=5):
+        # Returns (id, request bytes, slot time) or None if nothing can be downloaded now
+        for _ in range(tries):
+            now = time.time()
+            doc = self.requests.find_one_and_update(
+                # A leased request that is "available" again is one whose lease ran out
+                {"state": {"$in": [QUEUED, LEASED]}, "available_at": {"$lte": now}},
+                {"$set": {"state": LEASED, "worker": worker, "available_at": now + self.lease_seconds},
+                 "$inc": {"attempts": 1}},
+                sort=[("priority", -1), ("available_at", 1)],
+                return_document=pymongo.ReturnDocument.AFTER,
+            )
+            if doc is None:
+                return None
+            if doc["attempts"] > self.max_attempts:
+                self.finish(doc["_id"], FAILED, f"Still not done after {self.max_attempts} attempts")
+                continue
+
+            slot = self.reserve(doc["domain"], now, delay, max_wait)
+            if slot > now + max_wait:
+                # The domain is booked up: back in the queue until it can get a slot
+                self.requests.update_one(
+                    {"_id": doc["_id"], "worker": worker},
+                    {"$set": {"state": QUEUED, "available_at": slot - max_wait}, "$inc": {"attempts": -1}},
+                )
+                continue
+            if slot > now:
+                # The lease runs from the slot, not from now: waiting for it isn't being stuck
+                self.requests.update_one({"_id": doc["_id"]}, {"$set": {"available_at": slot + self.lease_seconds}})
+            return doc["_id"], bytes(doc["request"]), slot
+        return None
+
+    def reserve(self, domain, now, delay, max_wait):
+        # Books the domain's next download slot and returns its time, or returns a
+        # time after now + max_wait (without booking) when the next free slot is that late.
+        # Compare-and-set on next_at, so two workers never get the same slot.
+        while True:
+            current = self.domains.find_one({"_id": domain})
+            if current is None:
+                try:
+                    self.domains.insert_one({"_id": domain, "next_at": now + delay})
+                    return now
+                except DuplicateKeyError:
+                    continue  # another worker booked it first
+            slot = max(current["next_at"], now)
+            if slot > now + max_wait:
+                return slot
+            # An operator can slow a single domain down by setting its "delay"
+            next_at = slot + current.get("delay", delay)
+            result = self.domains.update_one({"_id": domain, "next_at": current["next_at"]}, {"$set": {"next_at": next_at}})
+            if result.modified_count:
+                return slot
+
+    def finish(self, request_id, state=DONE, error=None):
+        update = {"$set": {"state": state, "finished_at": time.time()}, "$unset": {"request": ""}}
+        if error:
+            update["$set"]["error"] = error
+        self.requests.update_one({"_id": request_id}, update)
+
+    def release(self, request_ids):
+        # Leased requests a stopping worker won't finish: back in the queue right away
+        if request_ids:
+            self.requests.update_many(
+                {"_id": {"$in": list(request_ids)}, "state": LEASED},
+                {"$set": {"state": QUEUED, "available_at": time.time()}, "$inc": {"attempts": -1}},
+            )
+
+    def has_pending(self):
+        return self.requests.find_one({"state": {"$in": [QUEUED, LEASED]}}, {"_id": 1}) is not None
+
+    def counts(self):
+        return {state: self.requests.count_documents({"state": state}) for state in (QUEUED, LEASED, DONE, FAILED)}
+
+    def clear(self):
+        self.requests.drop()
+        self.domains.drop()
+
+    def close(self):
+        self.client.close()
+
+
+class SqliteFrontier:
+    # The same frontier in a SQLite file. WAL mode lets the workers read while one of
+    # them writes, and every lease is a single IMMEDIATE transaction, so two
+    # processes can never take the same request or the same domain slot.
+
+    def __init__(self, path, name, lease_seconds=300, max_attempts=3):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.requests = f"frontier_{name}"
+        self.domains = f"frontier_{name}_domains"
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.db.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.requests} (id TEXT PRIMARY KEY, url TEXT, domain TEXT, "
+            "priority INTEGER, request BLOB, state TEXT, available_at REAL, attempts INTEGER, "
+            "worker TEXT, finished_at REAL, error TEXT)"
+        )
+        self.db.execute(
+            f"CREATE INDEX IF NOT EXISTS {self.requests}_lease ON {self.requests} (state, priority DESC, available_at)"
+        )
+        self.db.execute(f"CREATE TABLE IF NOT EXISTS {self.domains} (domain TEXT PRIMARY KEY, next_at REAL, delay REAL)")
+
+    def push(self, entries):
+        if not entries:
+            return 0
+        now = time.time()
+        added = 0
+        with self.transaction():
+            for entry in entries:
+                cursor = self.db.execute(
+                    f"INSERT OR IGNORE INTO {self.requests} (id, url, domain, priority, request, state, available_at, attempts) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+                    (entry["_id"], entry["url"], entry["domain"], entry["priority"], entry["request"], QUEUED, now),
+                )
+                added += cursor.rowcount
+        return added
+
+    def lease(self, worker, delay, max_wait, tries=5):
+        for _ in range(tries):
+            now = time.time()
+            with self.transaction():
+                row = self.db.execute(
+                    f"SELECT id, domain, request, attempts FROM {self.requests} "
+                    "WHERE state IN (?, ?) AND available_at <= ? ORDER BY priority DESC, available_at LIMIT 1",
+                    (QUEUED, LEASED, now),
+                ).fetchone()
+                if row is None:
+                    return None
+                request_id, domain, request, attempts = row
+                if attempts + 1 > self.max_attempts:
+                    self.db.execute(
+                        f"UPDATE {self.requests} SET state = ?, finished_at = ?, request = NULL, error = ? WHERE id = ?",
+                        (FAILED, now, f"Still not done after {self.max_attempts} attempts", request_id),
+                    )
+                    continue
+
+                current = self.db.execute(f"SELECT next_at, delay FROM {self.domains} WHERE domain = ?", (domain,)).fetchone()
+                slot = max(current[0], now) if current else now
+                if slot > now + max_wait:
+                    self.db.execute(
+                        f"UPDATE {self.requests} SET available_at = ? WHERE id = ?", (slot - max_wait, request_id)
+                    )
+                    continue
+                domain_delay = current[1] if current and current[1] is not None else delay
+                self.db.execute(
+                    f"INSERT INTO {self.domains} (domain, next_at) VALUES (?, ?) "
+                    "ON CONFLICT (domain) DO UPDATE SET next_at = excluded.next_at",
+                    (domain, slot + domain_delay),
+                )
+                self.db.execute(
+                    f"UPDATE {self.requests} SET state = ?, worker = ?, available_at = ?, attempts = attempts + 1 WHERE id = ?",
+                    (LEASED, worker, slot + self.lease_seconds, request_id),
+                )
+            return request_id, request, slot
+        return None
+
+    def finish(self, request_id, state=DONE, error=None):
+        with self.transaction():
+            self.db.execute(
+                f"UPDATE {self.requests} SET state = ?, finished_at = ?, request = NULL, error = ? WHERE id = ?",
+                (state, time.time(), error, request_id),
+            )
+
+    def release(self, request_ids):
+        if request_ids:
+            with self.transaction():
+                self.db.executemany(
+                    f"UPDATE {self.requests} SET state = ?, available_at = ?, attempts = attempts - 1 "
+                    "WHERE id = ? AND state = ?",
+                    [(QUEUED, time.time(), request_id, LEASED) for request_id in request_ids],
+                )
+
+    def has_pending(self):
+        return self.db.execute(
+            f"SELECT 1 FROM {self.requests} WHERE state IN (?, ?) LIMIT 1", (QUEUED, LEASED)
+        ).fetchone() is not None
+
+    def counts(self):
+        counts = dict.fromkeys((QUEUED, LEASED, DONE, FAILED), 0)
+        counts.update(self.db.execute(f"SELECT state, COUNT(*) FROM {self.requests} GROUP BY state").fetchall())
+        return counts
+
+    def clear(self):
+        with self.transaction():
+            self.db.execute(f"DELETE FROM {self.requests}")
+            self.db.execute(f"DELETE FROM {self.domains}")
+
+    def close(self):
+        self.db.close()
+
+    def transaction(self):
+        return Transaction(self.db)
+
+
+class Transaction:
+    # BEGIN IMMEDIATE takes the write lock up front, so a read-then-update can't race another process
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute("BEGIN IMMEDIATE")
+
+    def __exit__(self, exc_type, exc, tb):
+        self.db.execute("COMMIT" if exc_type is None else "ROLLBACK")
@@ -0,0 +1,49 @@
+from typing import Any
+
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from nexora_crawler.vector_codec import WITHOUT_VECTORS
+
+# Combines the vector search with the BM25 keyword index (bm25.py).
+# Both return a ranked list of passages; the lists are merged with reciprocal
+# rank fusion, which only looks at ranks, so the very different scores of the
+# two searches never have to be compared. A passage that ranks well in both
+# ends up on top, and an exact error code or API name found only by BM25 still
+# makes it into the top k.
+
+
+class HybridRetriever(BaseRetriever):
+    vector_store: Any
+    bm25: Any
+    passages: Any  # the Mongo collection, to load passages that only BM25 found
+    k: int = 3
+    fetch_k: int = 20  # how many results we take from each search before fusing
+    rrf_k: int = 60  # the usual RRF constant; larger values flatten the rank differences
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        vector_docs = self.vector_store.similarity_search(query, k=self.fetch_k)
+        keyword_hits = self.bm25.search(query, self.fetch_k)
+
+        scores = {}
+        docs = {}
+        for rank, doc in enumerate(vector_docs):
+            doc_id = str(doc.metadata.get("_id"))
+            docs[doc_id] = doc
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1 / (self.rrf_k + rank + 1)
+        for rank, (doc_id, _) in enumerate(keyword_hits):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1 / (self.rrf_k + rank + 1)
+
+        top = sorted(scores, key=scores.get, reverse=True)[:self.k]
+        self.load_missing([doc_id for doc_id in top if doc_id not in docs], docs)
+        return [docs[doc_id] for doc_id in top if doc_id in docs]
+
+    def load_missing(self, ids, docs):
+        # We never need the stored vectors here, so they are not sent over the wire
+        if not ids:
+            return
+        for passage in self.passages.find({"_id": {"$in": ids}}, WITHOUT_VECTORS):
+            doc_id = str(passage["_id"])
+            text = passage.pop("text", "")
+            passage["_id"] = doc_id
+            docs[doc_id] = Document(page_content=text, metadata=passage)
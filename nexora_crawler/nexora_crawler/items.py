@@ -7,6 +7,21 @@ class NexoraCrawlerItem(scrapy.Item):
     # Scrapy will fill this in automatically when the file is downloaded
     files = scrapy.Field()
     
+    # The raw PDF bytes, handed straight to PdfParsingPipeline.
+    # This is never saved to MongoDB.
+    file_body = scrapy.Field()
+    
+    # The raw HTML of a page (response.text), handed to ContentExtractionPipeline,
+    # which turns it into text_content. Like file_body, never saved to MongoDB.
+    html_body = scrapy.Field()
+
     # We will still keep a text field for normal page content
     text_content = scrapy.Field()
     source_url = scrapy.Field()
+
+    # Used by the incremental crawl to skip pages that haven't changed
+    etag = scrapy.Field()
+    last_modified = scrapy.Field()
+    content_hash = scrapy.Field()
+    # The URL we asked for; differs from source_url when a redirect took us there
+    requested_url = scrapy.Field()
@@ -0,0 +1,364 @@
+import json
+import math
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+from nexora_crawler.vector_codec import (
+    VECTOR_FIELD, decode_vector, hamming_similarity, quantize_binary, quantize_int8,
+)
+
+# An in-process vector store, used instead of Atlas Vector Search when
+# VECTOR_BACKEND=local. Searching it costs no network round trip, and it works
+# offline and in CI.
+#
+# On disk (in one folder):
+#   vectors.f32  - float32 matrix, one normalised vector per row (memory-mapped)
+#   lists.i32    - the IVF list each row belongs to (memory-mapped)
+#   centroids.npy - the IVF centroids, once there are enough vectors to train them
+#   store.sqlite - id, text, metadata and deleted flag per row
+#   codes.i8 + scales.f32 / codes.u1 - int8 or 1-bit codes per row, with quantization
+#
+# Small stores are searched exactly. From TRAIN_MIN_ROWS vectors on, an IVF index
+# (k-means centroids + inverted lists) is trained and only the `nprobe` lists
+# closest to the query are scanned.
+#
+# With quantization="int8" or "binary" (VECTOR_QUANTIZATION) the candidates are
+# scored on the codes, which are 4x or 32x smaller than the float32 vectors, and only
+# the best k * rescore_factor of them (4 for int8, 16 for binary by default) are
+# scored again with the float32 vectors.
+# The float32 file then stays on disk except for the rows being rescored.
+
+TRAIN_MIN_ROWS = 4096
+
+
+class LocalVectorStore(VectorStore):
+    def __init__(self, path, embedding, nprobe=8, quantization="none", rescore_factor=None):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.embedding = embedding
+        self.nprobe = nprobe
+        self.quantization = quantization
+        # Sign bits lose much more than int8, so binary codes need a deeper shortlist
+        self.rescore_factor = rescore_factor or (16 if quantization == "binary" else 4)
+        self.lock = threading.RLock()
+
+        self.db = sqlite3.connect(os.path.join(path, "store.sqlite"), check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS rows (row INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, "
+            "text TEXT NOT NULL, metadata TEXT NOT NULL, deleted INTEGER NOT NULL DEFAULT 0)"
+        )
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.db.commit()
+
+        self.dim = self.get_meta("dim", int)
+        self.trained_rows = self.get_meta("trained_rows", int) or 0
+        self.count = self.db.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM rows").fetchone()[0]
+        self.row_of_id = dict(self.db.execute("SELECT id, row FROM rows WHERE deleted = 0"))
+
+        self.vectors = None
+        self.lists = None
+        self.codes = None
+        self.scales = None
+        if self.dim:
+            self.open_files(self.count)
+
+        self.alive = np.zeros(max(self.count, 1), dtype=bool)
+        self.alive[list(self.row_of_id.values())] = True
+
+        # Codes written with another quantization (or none) are rebuilt from the float32 vectors
+        if self.get_meta("quantization", str) != self.quantization:
+            if self.dim and self.quantization != "none":
+                for start in range(0, self.count, 65536):
+                    self.encode_rows(np.arange(start, min(start + 65536, self.count)))
+                self.codes.flush()
+            self.set_meta("quantization", self.quantization)
+            self.db.commit()
+
+        centroids_path = os.path.join(path, "centroids.npy")
+        self.centroids = np.load(centroids_path) if os.path.exists(centroids_path) else None
+        self.build_inverted_lists()
+
+    @property
+    def embeddings(self):
+        return self.embedding
+
+    # --- storage -------------------------------------------------------
+
+    def get_meta(self, key, cast):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return cast(row[0]) if row else None
+
+    def set_meta(self, key, value):
+        self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def open_files(self, needed):
+        # The files grow in big steps (doubling), and are re-mapped when they do
+        capacity = self.vectors.shape[0] if self.vectors is not None else 0
+        if self.vectors is not None and capacity >= needed:
+            return
+        capacity = max(1024, needed, capacity * 2)
+
+        vectors_path = os.path.join(self.path, "vectors.f32")
+        lists_path = os.path.join(self.path, "lists.i32")
+        for file_path, row_bytes in [(vectors_path, 4 * self.dim), (lists_path, 4)]:
+            with open(file_path, "ab") as f:
+                if f.tell() < capacity * row_bytes:
+                    f.truncate(capacity * row_bytes)
+
+        self.vectors = np.memmap(vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        self.lists = np.memmap(lists_path, dtype=np.int32, mode="r+", shape=(capacity,))
+
+        if self.quantization == "int8":
+            self.codes = self.open_array("codes.i8", np.int8, (capacity, self.dim))
+            self.scales = self.open_array("scales.f32", np.float32, (capacity,))
+        elif self.quantization == "binary":
+            self.codes = self.open_array("codes.u1", np.uint8, (capacity, (self.dim + 7) // 8))
+
+    def open_array(self, name, dtype, shape):
+        file_path = os.path.join(self.path, name)
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        with open(file_path, "ab") as f:
+            if f.tell() < size:
+                f.truncate(size)
+        return np.memmap(file_path, dtype=dtype, mode="r+", shape=shape)
+
+    def encode_rows(self, rows):
+        if self.quantization == "int8":
+            self.codes[rows], self.scales[rows] = quantize_int8(self.vectors[rows])
+        elif self.quantization == "binary":
+            self.codes[rows] = quantize_binary(self.vectors[rows])
+
+    def build_inverted_lists(self):
+        # list id -> array of rows, rebuilt from lists.i32 on start-up and after training
+        self.inverted = {}
+        if self.centroids is None or self.count == 0:
+            return
+        rows = np.flatnonzero(self.alive[:self.count])
+        order = np.argsort(self.lists[rows], kind="stable")
+        rows = rows[order]
+        bounds = np.searchsorted(self.lists[rows], np.arange(len(self.centroids) + 1))
+        for list_id in range(len(self.centroids)):
+            self.inverted[list_id] = rows[bounds[list_id]:bounds[list_id + 1]]
+
+    # --- writing -------------------------------------------------------
+
+    def add_texts(self, texts, metadatas=None, *, ids=None, **kwargs):
+        texts = list(texts)
+        vectors = self.embedding.embed_documents(texts)
+        return self.add_embeddings(texts, vectors, metadatas, ids)
+
+    def add_embeddings(self, texts, vectors, metadatas=None, ids=None):
+        # Adding an id that already exists replaces it (same row, new vector)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [os.urandom(12).hex() for _ in texts]
+        matrix = normalize(np.asarray(vectors, dtype=np.float32))
+
+        with self.lock:
+            if self.dim is None:
+                self.dim = matrix.shape[1]
+                self.set_meta("dim", self.dim)
+            self.open_files(self.count + len(ids))
+            if len(self.alive) < self.vectors.shape[0]:
+                self.alive = np.concatenate([self.alive, np.zeros(self.vectors.shape[0] - len(self.alive), dtype=bool)])
+
+            rows = []
+            replaced = []
+            for doc_id in ids:
+                row = self.row_of_id.get(doc_id)
+                if row is None:
+                    row = self.count
+                    self.count += 1
+                    self.row_of_id[doc_id] = row
+                else:
+                    replaced.append(row)
+                rows.append(row)
+
+            rows = np.asarray(rows)
+            self.vectors[rows] = matrix
+            self.encode_rows(rows)
+            self.alive[rows] = True
+            self.db.executemany(
+                "INSERT OR REPLACE INTO rows (row, id, text, metadata, deleted) VALUES (?, ?, ?, ?, 0)",
+                [(int(row), doc_id, text, json.dumps(metadata, default=str))
+                 for row, doc_id, text, metadata in zip(rows, ids, texts, metadatas)],
+            )
+
+            if self.centroids is not None:
+                self.assign(rows, np.asarray(replaced, dtype=np.int64))
+            # (Re)train once the store has grown a lot since the last training
+            if self.count >= TRAIN_MIN_ROWS and self.count >= 4 * self.trained_rows:
+                self.train()
+
+            self.vectors.flush()
+            self.lists.flush()
+            if self.codes is not None:
+                self.codes.flush()
+            self.db.commit()
+        return list(ids)
+
+    def assign(self, rows, replaced):
+        # A replaced vector may belong to another list now, so it leaves its old one first
+        for list_id in np.unique(self.lists[replaced]):
+            members = self.inverted.get(int(list_id))
+            if members is not None:
+                self.inverted[int(list_id)] = np.setdiff1d(members, replaced)
+
+        lists = np.argmax(self.vectors[rows] @ self.centroids.T, axis=1).astype(np.int32)
+        self.lists[rows] = lists
+        for list_id in np.unique(lists):
+            current = self.inverted.get(int(list_id), np.empty(0, dtype=np.int64))
+            self.inverted[int(list_id)] = np.union1d(current, rows[lists == list_id])
+
+    def train(self, iterations=10):
+        # Spherical k-means on a sample of the live vectors
+        rows = np.flatnonzero(self.alive[:self.count])
+        nlist = max(1, int(math.sqrt(len(rows))))
+        rng = np.random.default_rng(0)
+        sample = self.vectors[rng.choice(rows, min(len(rows), nlist * 64), replace=False)]
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=nlist)
+            filled = counts > 0
+            centroids[filled] = normalize(sums[filled])
+
+        self.centroids = centroids
+        np.save(os.path.join(self.path, "centroids.npy"), centroids)
+        for start in range(0, len(rows), 65536):
+            chunk = rows[start:start + 65536]
+            self.lists[chunk] = np.argmax(self.vectors[chunk] @ centroids.T, axis=1)
+        self.trained_rows = len(rows)
+        self.set_meta("trained_rows", self.trained_rows)
+        self.build_inverted_lists()
+
+    def delete(self, ids=None, **kwargs):
+        if not ids:
+            return False
+        with self.lock:
+            rows = [self.row_of_id.pop(doc_id) for doc_id in ids if doc_id in self.row_of_id]
+            self.alive[rows] = False
+            self.db.executemany("UPDATE rows SET deleted = 1 WHERE row = ?", [(int(row),) for row in rows])
+            self.db.commit()
+        return True
+
+    def sync_from_mongo(self, collection, batch_size=1000):
+        # Mirrors the passages collection: new and re-indexed passages are added,
+        # passages that were removed in Mongo are removed here too.
+        # Only passages indexed since the last sync are read with their vectors.
+        last_sync = self.get_meta("last_sync", datetime.fromisoformat)
+        query = {"embedding": {"$exists": True}}
+        if last_sync:
+            query["indexed_at"] = {"$gte": last_sync}
+
+        added = 0
+        newest = last_sync
+        batch = []
+        for doc in collection.find(query).batch_size(batch_size):
+            if doc.get("indexed_at") and (newest is None or doc["indexed_at"] > newest):
+                newest = doc["indexed_at"]
+            batch.append(doc)
+            if len(batch) == batch_size:
+                added += self.add_mongo_batch(batch)
+                batch = []
+        if batch:
+            added += self.add_mongo_batch(batch)
+
+        # Finding deletions needs every id, but only the ids
+        existing = {str(doc["_id"]) for doc in collection.find({}, {"_id": 1})}
+        removed = [doc_id for doc_id in list(self.row_of_id) if doc_id not in existing]
+        self.delete(removed)
+
+        with self.lock:
+            if newest:
+                self.set_meta("last_sync", newest.isoformat())
+            self.db.commit()
+        return added, len(removed)
+
+    def add_mongo_batch(self, docs):
+        ids = [str(doc.pop("_id")) for doc in docs]
+        # Binary float32 or a plain array, whichever VECTOR_STORAGE wrote
+        vectors = [decode_vector(doc.pop(VECTOR_FIELD)) for doc in docs]
+        texts = [doc.pop("text", "") for doc in docs]
+        self.add_embeddings(texts, vectors, docs, ids)
+        return len(docs)
+
+    # --- searching -----------------------------------------------------
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        return self.similarity_search_by_vector_with_score(self.embedding.embed_query(query), k)
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k)]
+
+    def similarity_search_by_vector_with_score(self, embedding, k=4):
+        with self.lock:
+            if not self.row_of_id:
+                return []
+            query = normalize(np.asarray(embedding, dtype=np.float32)[None, :])[0]
+
+            if self.centroids is None:
+                candidates = np.flatnonzero(self.alive[:self.count])
+            else:
+                nprobe = min(self.nprobe, len(self.centroids))
+                probe = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+                candidates = np.concatenate([self.inverted.get(int(list_id), np.empty(0, dtype=np.int64))
+                                             for list_id in probe])
+                candidates = candidates[self.alive[candidates]]
+            if len(candidates) == 0:
+                return []
+
+            if self.codes is not None and len(candidates) > k:
+                candidates = self.shortlist(candidates, query, k * self.rescore_factor)
+
+            scores = self.vectors[candidates] @ query
+            top = np.argpartition(-scores, min(k, len(scores)) - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(self.load_document(int(candidates[i])), float(scores[i])) for i in top]
+
+    def shortlist(self, candidates, query, size):
+        # The `size` best candidates by their quantized score, for exact rescoring
+        if len(candidates) <= size:
+            return candidates
+        if self.quantization == "int8":
+            approximate = (self.codes[candidates] @ query) * self.scales[candidates]
+        else:
+            approximate = hamming_similarity(self.codes[candidates], quantize_binary(query[None, :])[0], self.dim)
+        best = np.argpartition(-approximate, size - 1)[:size]
+        # Sorted rows read the float32 file front to back
+        return np.sort(candidates[best])
+
+    def load_document(self, row):
+        doc_id, text, metadata = self.db.execute(
+            "SELECT id, text, metadata FROM rows WHERE row = ?", (row,)
+        ).fetchone()
+        metadata = json.loads(metadata)
+        metadata["_id"] = doc_id
+        return Document(page_content=text, metadata=metadata)
+
+    def _select_relevance_score_fn(self):
+        # Scores are cosine similarities (-1..1)
+        return lambda score: (score + 1) / 2
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, *, ids=None, path=None, **kwargs):
+        store = cls(path, embedding, **kwargs)
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
+
+
+def normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
@@ -0,0 +1,211 @@
+import bisect
+import copy
+import cProfile
+import functools
+import inspect
+import io
+import json
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency histograms for every stage we care about, in one place:
+#   pipeline  {stage=<pipeline class>}       - crawler item pipelines (timed_pipeline_stage)
+#   download  {route=http|playwright}        - crawler downloads (extensions.py)
+#   indexer   {stage=read|chunk|embed|...}   - indexer.py
+#   chat      {stage=embed|retrieval|llm...} - console_app.py and chat_server.py
+#
+# Export them as Prometheus text (a path ending in .prom or .txt) or JSON (anything
+# else) with METRICS_EXPORT_PATH, and set PROFILE_OUTPUT to a file name to get a
+# cProfile dump of the hot path as well (open it with `python -m pstats` or snakeviz).
+
+# Bucket upper bounds in seconds, from a fast Mongo write to a slow Playwright render
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, fraction):
+        # The upper bound of the bucket the quantile falls into (the max for the last one)
+        if self.count == 0:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def snapshot(self, name):
+        # [(labels, histogram)] of one family, copied so they can be read without the lock
+        with self.lock:
+            return [
+                (dict(labels), copy.deepcopy(histogram))
+                for (family, labels), histogram in sorted(self.histograms.items()) if family == name
+            ]
+
+    def to_prometheus(self):
+        lines = []
+        typed = set()
+        with self.lock:
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                family = f"nexora_{name}_seconds"
+                if family not in typed:
+                    lines.append(f"# TYPE {family} histogram")
+                    typed.add(family)
+                label_text = ",".join(f'{key}="{value}"' for key, value in labels)
+                prefix = f"{label_text}," if label_text else ""
+                cumulative = 0
+                for bound, count in zip(list(histogram.buckets) + ["+Inf"], histogram.counts):
+                    cumulative += count
+                    lines.append(f'{family}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+                braces = f"{{{label_text}}}" if label_text else ""
+                lines.append(f"{family}_sum{braces} {histogram.sum:.6f}")
+                lines.append(f"{family}_count{braces} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def to_json(self):
+        result = {}
+        with self.lock:
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                result.setdefault(name, []).append({
+                    "labels": dict(labels),
+                    "count": histogram.count,
+                    "sum_seconds": round(histogram.sum, 6),
+                    "max_seconds": round(histogram.max, 6),
+                    "p50_seconds": histogram.quantile(0.50),
+                    "p95_seconds": histogram.quantile(0.95),
+                    "p99_seconds": histogram.quantile(0.99),
+                    "buckets": dict(zip([str(b) for b in histogram.buckets] + ["+Inf"], histogram.counts)),
+                })
+        return result
+
+    def export(self, path=None):
+        # Writes to `path` (or METRICS_EXPORT_PATH); does nothing when neither is set
+        path = path or os.getenv("METRICS_EXPORT_PATH")
+        if not path:
+            return None
+        with open(path, "w", encoding="utf-8") as f:
+            if path.endswith((".prom", ".txt")):
+                f.write(self.to_prometheus())
+            else:
+                json.dump(self.to_json(), f, indent=2)
+        return path
+
+    def summary(self):
+        lines = []
+        with self.lock:
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                label_text = ",".join(str(value) for _, value in labels)
+                mean = histogram.sum / max(histogram.count, 1)
+                lines.append(
+                    f"  {name}[{label_text}]: {histogram.count} calls, {histogram.sum:.2f}s total, "
+                    f"mean {mean * 1000:.1f}ms, p95 <= {histogram.quantile(0.95) * 1000:.0f}ms"
+                )
+        return "Timings:\n" + "\n".join(lines) if lines else "Timings: nothing measured yet"
+
+
+metrics = Metrics()
+
+
+def timed_pipeline_stage(process_item):
+    # For an item pipeline's process_item: observed as pipeline{stage=<its class>} once
+    # the item is through, whether it returns the item, a Deferred or a coroutine.
+    # StageTimingExtension copies these into the crawl stats.
+    def record(pipeline, started):
+        metrics.observe("pipeline", time.perf_counter() - started, stage=type(pipeline).__name__)
+
+    if inspect.iscoroutinefunction(process_item):
+        @functools.wraps(process_item)
+        async def timed_async(self, item, *args):
+            started = time.perf_counter()
+            try:
+                return await process_item(self, item, *args)
+            finally:
+                record(self, started)
+        return timed_async
+
+    @functools.wraps(process_item)
+    def timed(self, item, *args):
+        started = time.perf_counter()
+        try:
+            result = process_item(self, item, *args)
+        except Exception:
+            record(self, started)
+            raise
+        if hasattr(result, "addBoth"):  # a Deferred
+            return result.addBoth(lambda outcome: (record(self, started), outcome)[1])
+        record(self, started)
+        return result
+    return timed
+
+
+class Profiler:
+    # cProfile around a hot path. Only the thread that starts it is profiled.
+
+    def __init__(self, output):
+        self.output = output
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self, top=15):
+        self.profile.disable()
+        self.profile.dump_stats(self.output)
+        text = io.StringIO()
+        pstats.Stats(self.profile, stream=text).sort_stats("cumulative").print_stats(top)
+        return text.getvalue()
+
+
+@contextmanager
+def profiled(output=None):
+    # Profiles the block when `output` (or PROFILE_OUTPUT) is set, otherwise costs nothing
+    output = output or os.getenv("PROFILE_OUTPUT")
+    if not output:
+        yield
+        return
+    profiler = Profiler(output)
+    profiler.start()
+    try:
+        yield
+    finally:
+        print(profiler.stop())
+        print(f"Profile saved to {output}")
@@ -3,10 +3,25 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+import asyncio
+import logging
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+from protego import Protego
+
 from scrapy import signals
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.http import HtmlResponse
 
 # useful for handling different item types with a single interface
-from itemadapter import ItemAdapter
+from itemadapter import ItemAdapter, is_item
+
+from nexora_crawler import scheduler
+from nexora_crawler.crawl_state import load_crawl_state
+
+logger = logging.getLogger(__name__)
 
 
 class NexoraCrawlerSpiderMiddleware:
@@ -98,3 +113,475 @@ class NexoraCrawlerDownloaderMiddleware:
 
     def spider_opened(self, spider):
         spider.logger.info("Spider opened: %s" % spider.name)
+
+
+class IncrementalDownloaderMiddleware:
+    # Turns every request for a URL we crawled before into a conditional request.
+    # If the server answers 304 Not Modified, the request stops here: no parsing,
+    # no Mongo write and no new embedding.
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.known = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("INCREMENTAL_CRAWL_ENABLED"):
+            raise NotConfigured
+        s = cls(crawler.stats)
+        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        return s
+
+    def spider_opened(self, spider):
+        self.known = load_crawl_state(["etag", "last_modified"])
+        spider.logger.info("Incremental crawl: %d known URLs" % len(self.known))
+
+    def process_request(self, request, spider):
+        previous = self.known.get(request.url)
+        if not previous or request.meta.get("dont_revalidate"):
+            return None
+
+        if previous.get("etag"):
+            request.headers.setdefault("If-None-Match", previous["etag"])
+        if previous.get("last_modified"):
+            request.headers.setdefault("If-Modified-Since", previous["last_modified"])
+        return None
+
+    def process_response(self, request, response, spider):
+        if response.status == 304 and request.url in self.known:
+            self.stats.inc_value("incremental/not_modified")
+            raise IgnoreRequest(f"Not modified: {request.url}")
+        return response
+
+
+class IncrementalSpiderMiddleware:
+    # Copies the ETag and Last-Modified headers of the response onto the items
+    # built from it, so MongoPipeline stores them for the next conditional request.
+    # The URL that was requested goes with them: after a redirect it is not the
+    # item's source_url, and the next crawl asks for it again.
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("INCREMENTAL_CRAWL_ENABLED"):
+            raise NotConfigured
+        return cls()
+
+    async def process_spider_output(self, response, result, spider):
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        requested_url = (response.request.meta.get("redirect_urls") or [response.url])[0]
+
+        async for i in result:
+            if is_item(i):
+                adapter = ItemAdapter(i)
+                if adapter.get("source_url") == response.url and "etag" in adapter.field_names():
+                    adapter["requested_url"] = requested_url
+                    if etag:
+                        adapter["etag"] = etag.decode("latin-1")
+                    if last_modified:
+                        adapter["last_modified"] = last_modified.decode("latin-1")
+            yield i
+
+
+class PlaywrightRoutingMiddleware:
+    # Requests use Scrapy's normal HTTP downloader unless they opt in with
+    # meta['playwright'] = True. If a plain HTTP page turns out to be an empty
+    # JavaScript shell, we fetch it again once through the headless browser.
+
+    # Markers that a page builds its content with JavaScript
+    JS_SHELL_MARKERS = ('id="root"', 'id="app"', 'id="__next"', 'ng-app', 'data-reactroot', '<noscript')
+
+    def __init__(self, stats, detect_js_shell=True, min_text_length=200):
+        self.stats = stats
+        self.detect_js_shell = detect_js_shell
+        self.min_text_length = min_text_length
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(
+            crawler.stats,
+            detect_js_shell=crawler.settings.getbool("PLAYWRIGHT_DETECT_JS_SHELL", True),
+            min_text_length=crawler.settings.getint("PLAYWRIGHT_JS_SHELL_MIN_TEXT", 200),
+        )
+
+    def process_request(self, request, spider):
+        if request.meta.get("playwright"):
+            self.stats.inc_value("routing/playwright")
+        else:
+            self.stats.inc_value("routing/http")
+        return None
+
+    def process_response(self, request, response, spider):
+        if request.meta.get("playwright") or not self.detect_js_shell:
+            return response
+        # Only real pages: error pages and redirect stubs are small and often have
+        # a script too, and rendering them would only show the same error
+        if response.status != 200 or not isinstance(response, HtmlResponse):
+            return response
+        if not self.looks_like_js_shell(response):
+            return response
+
+        self.stats.inc_value("routing/js_shell_rerendered")
+        spider.logger.debug("JavaScript shell detected, rendering with Playwright: %s" % request.url)
+        meta = dict(request.meta, playwright=True)
+        return request.replace(meta=meta, dont_filter=True)
+
+    def looks_like_js_shell(self, response):
+        # Almost no visible text, but scripts (or a typical app mount point) that would build it
+        text = response.xpath(
+            "//body//text()[not(ancestor::script) and not(ancestor::style) and not(ancestor::noscript)]"
+        ).getall()
+        if len("".join(text).strip()) >= self.min_text_length:
+            return False
+
+        if not response.xpath("//script"):
+            return False
+        html = response.text
+        return bool(response.xpath("//body//script")) or any(marker in html for marker in self.JS_SHELL_MARKERS)
+
+
+class PlaywrightPageMiddleware:
+    # Closes the Playwright page of a response (meta['playwright_include_page'])
+    # as soon as the callback is done with it, so pages can't pile up in the browser.
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.open_pages = set()  # the pages counted in playwright/pages_open
+        self.closing = set()     # close tasks started where we couldn't wait for them
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        s = cls(crawler.stats)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def process_spider_output(self, response, result, spider):
+        page = self.page_opened(response)
+        try:
+            for i in result:
+                yield i
+        finally:
+            if page:
+                self.close_later(page)
+
+    async def process_spider_output_async(self, response, result, spider):
+        page = self.page_opened(response)
+        try:
+            async for i in result:
+                yield i
+        finally:
+            if page:
+                await self.close_page(page)
+
+    def process_spider_exception(self, response, exception, spider):
+        # The output generators above close the page when the callback fails
+        # mid-way; this covers failures before the callback even started.
+        page = response.meta.get("playwright_page")
+        if page and not page.is_closed():
+            self.close_later(page)
+
+    async def spider_closed(self, spider):
+        if self.closing:
+            await asyncio.gather(*self.closing)
+
+    def page_opened(self, response):
+        page = response.meta.get("playwright_page")
+        if page:
+            self.open_pages.add(page)
+            self.stats.inc_value("playwright/pages_open")
+            self.stats.max_value("playwright/pages_open_max", self.stats.get_value("playwright/pages_open"))
+        return page
+
+    def close_later(self, page):
+        # From sync code: the close runs as a task, kept until it is done (and awaited
+        # on spider_closed), and close_page logs its errors
+        task = asyncio.ensure_future(self.close_page(page))
+        self.closing.add(task)
+        task.add_done_callback(self.closing.discard)
+
+    async def close_page(self, page):
+        # Only pages that page_opened counted come off the gauge
+        if page in self.open_pages:
+            self.open_pages.discard(page)
+            self.stats.inc_value("playwright/pages_open", -1)
+        if page.is_closed():
+            return
+        try:
+            await page.close()
+        except Exception as e:
+            logger.warning("Could not close Playwright page %s: %s", page.url, e)
+            return
+        self.stats.inc_value("playwright/pages_closed")
+
+
+class PlaywrightResourceMiddleware:
+    # For requests that go through Playwright:
+    # - blocks images, fonts, media and known trackers inside the browser
+    #   (per spider with a `playwright_blocked_resources` attribute)
+    # - spreads each domain over at most PLAYWRIGHT_CONTEXTS_PER_DOMAIN browser contexts
+
+    def __init__(self, stats, blocked_types, blocked_domains, bytes_estimate, contexts_per_domain):
+        self.stats = stats
+        self.blocked_types = set(blocked_types)
+        self.blocked_domains = tuple(blocked_domains)
+        self.bytes_estimate = bytes_estimate
+        self.contexts_per_domain = contexts_per_domain
+        self.requests_per_domain = {}
+        self.contexts = {}  # the browser contexts we named, by name
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        s = cls(
+            crawler.stats,
+            blocked_types=settings.getlist("PLAYWRIGHT_BLOCKED_RESOURCE_TYPES"),
+            blocked_domains=settings.getlist("PLAYWRIGHT_BLOCKED_DOMAINS"),
+            bytes_estimate=settings.getdict("PLAYWRIGHT_BLOCKED_BYTES_ESTIMATE"),
+            contexts_per_domain=settings.getint("PLAYWRIGHT_CONTEXTS_PER_DOMAIN", 1),
+        )
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    async def spider_closed(self, spider):
+        # The download handler only closes its contexts when the whole engine stops
+        contexts, self.contexts = self.contexts, {}
+        results = await asyncio.gather(*(context.close() for context in contexts.values()), return_exceptions=True)
+        for name, result in zip(contexts, results):
+            if isinstance(result, Exception):
+                logger.warning("Could not close Playwright context %s: %s", name, result)
+            else:
+                self.stats.inc_value("playwright/contexts_closed")
+
+    def process_request(self, request, spider):
+        if not request.meta.get("playwright"):
+            return None
+
+        domain = urlparse(request.url).netloc
+        if "playwright_context" not in request.meta:
+            # Round-robin over a fixed set of contexts per domain
+            count = self.requests_per_domain.get(domain, 0)
+            self.requests_per_domain[domain] = count + 1
+            request.meta["playwright_context"] = f"{domain}#{count % self.contexts_per_domain}"
+
+        if "playwright_page_init_callback" not in request.meta:
+            request.meta["playwright_page_init_callback"] = self.page_init_callback(spider, domain)
+        return None
+
+    def page_init_callback(self, spider, domain):
+        blocked_types = set(getattr(spider, "playwright_blocked_resources", self.blocked_types))
+
+        async def init_page(page, request):
+            # Remembered here, the one place the browser context of a page shows up
+            self.contexts[request.meta.get("playwright_context")] = page.context
+
+            async def handle_route(route):
+                resource = route.request
+                if resource.resource_type in blocked_types or self.is_tracker(resource.url, domain):
+                    self.stats.inc_value(f"playwright/blocked/{resource.resource_type}")
+                    # An aborted request never tells us its size, so this is an estimate
+                    self.stats.inc_value(
+                        "playwright/bytes_saved_estimate",
+                        int(self.bytes_estimate.get(resource.resource_type, 0)),
+                    )
+                    await route.abort()
+                else:
+                    await route.continue_()
+
+            await page.route("**/*", handle_route)
+
+        return init_page
+
+    def is_tracker(self, url, page_domain):
+        host = urlparse(url).netloc
+        if host == page_domain:
+            return False
+        return any(host == blocked or host.endswith("." + blocked) for blocked in self.blocked_domains)
+
+
+class AdaptiveThrottleMiddleware:
+    # Tunes the download delay and concurrency of every domain (downloader slot)
+    # from what we observe: fast, healthy hosts are sped up step by step, while
+    # slow or failing ones (429/503, timeouts) are backed off, honouring Retry-After.
+    # A Crawl-delay in robots.txt is always kept as the lower bound of the delay.
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.min_delay = settings.getfloat("ADAPTIVE_THROTTLE_MIN_DELAY", 0.0)
+        self.max_delay = settings.getfloat("ADAPTIVE_THROTTLE_MAX_DELAY", 60.0)
+        self.max_concurrency = settings.getint("ADAPTIVE_THROTTLE_MAX_CONCURRENCY", 8)
+        self.target_latency = settings.getfloat("ADAPTIVE_THROTTLE_TARGET_LATENCY", 1.0)
+        self.user_agent = settings.get("ROBOTSTXT_USER_AGENT") or settings.get("USER_AGENT")
+        self.robots_delays = {}
+        self.fast_responses = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("ADAPTIVE_THROTTLE_ENABLED"):
+            raise NotConfigured
+        middleware = cls(crawler)
+        crawler.signals.connect(middleware.request_reached_downloader, signal=signals.request_reached_downloader)
+        return middleware
+
+    def request_reached_downloader(self, request, spider):
+        # Sent once the request has its slot, before it is downloaded. A new slot (or one
+        # recreated after being idle) starts at DOWNLOAD_DELAY, below a known Crawl-delay.
+        key = request.meta.get("download_slot")
+        if key in self.robots_delays:
+            slot = self.crawler.engine.downloader.slots.get(key)
+            if slot is not None:
+                slot.delay = max(slot.delay, self.robots_delays[key])
+
+    def process_response(self, request, response, spider):
+        if urlparse(request.url).path == "/robots.txt":
+            self.read_crawl_delay(request, response)
+            return response
+
+        key, slot = self.get_slot(request)
+        if slot is None:
+            return response
+
+        latency = request.meta.get("download_latency")
+        if response.status in (429, 503):
+            self.back_off(key, slot, self.retry_after(response))
+        elif response.status >= 500:
+            self.back_off(key, slot)
+        elif latency is not None:
+            self.adjust_for_latency(key, slot, latency)
+
+        self.record(key, slot)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        # Timeouts, refused connections, DNS errors...
+        key, slot = self.get_slot(request)
+        if slot is not None:
+            self.back_off(key, slot)
+            self.record(key, slot)
+        return None
+
+    def get_slot(self, request):
+        key = request.meta.get("download_slot")
+        return key, self.crawler.engine.downloader.slots.get(key)
+
+    def floor_delay(self, key):
+        return max(self.min_delay, self.robots_delays.get(key, 0.0))
+
+    def adjust_for_latency(self, key, slot, latency):
+        if latency <= self.target_latency:
+            # Scale up after a full "round" of fast responses at the current concurrency
+            fast = self.fast_responses.get(key, 0) + 1
+            if fast >= slot.concurrency:
+                fast = 0
+                slot.concurrency = min(self.max_concurrency, slot.concurrency + 1)
+                slot.delay = max(self.floor_delay(key), slot.delay * 0.75)
+            self.fast_responses[key] = fast
+        else:
+            # The server is slowing down: aim for one request per `latency / concurrency`
+            self.fast_responses[key] = 0
+            if latency > 2 * self.target_latency:
+                slot.concurrency = max(1, slot.concurrency - 1)
+            target_delay = latency / slot.concurrency
+            slot.delay = min(self.max_delay, max(self.floor_delay(key), (slot.delay + target_delay) / 2))
+
+    def back_off(self, key, slot, retry_after=None):
+        self.fast_responses[key] = 0
+        self.stats.inc_value("adaptive_throttle/backoffs")
+        slot.concurrency = max(1, slot.concurrency // 2)
+        delay = max(slot.delay * 2, 1.0, self.floor_delay(key))
+        if retry_after:
+            delay = max(delay, retry_after)
+        slot.delay = min(self.max_delay, delay)
+
+    def retry_after(self, response):
+        value = response.headers.get("Retry-After")
+        if not value:
+            return None
+        value = value.decode("latin-1").strip()
+        # Either a number of seconds or an HTTP date
+        if value.isdigit():
+            return float(value)
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def read_crawl_delay(self, request, response):
+        if response.status != 200:
+            return
+        try:
+            delay = Protego.parse(response.text).crawl_delay(self.user_agent or "*")
+        except Exception:
+            return
+        if delay:
+            # robots.txt is downloaded in the slot of the host it is for
+            key = request.meta.get("download_slot") or urlparse(request.url).hostname
+            self.robots_delays[key] = float(delay)
+            self.stats.set_value(f"adaptive_throttle/{key}/robots_delay", float(delay))
+            # The slot's delay only moved towards it on the next response; the host's
+            # requests already waiting for robots.txt would go out too fast
+            slot = self.crawler.engine.downloader.slots.get(key)
+            if slot is not None:
+                slot.delay = max(slot.delay, float(delay))
+                self.record(key, slot)
+
+    def record(self, key, slot):
+        self.stats.set_value(f"adaptive_throttle/{key}/delay", round(slot.delay, 3))
+        self.stats.set_value(f"adaptive_throttle/{key}/concurrency", slot.concurrency)
+
+
+class FrontierAckMiddleware:
+    # With SharedScheduler (crawl_workers.py): tells the scheduler which items a
+    # leased request's callback yields and when it has yielded everything. The
+    # scheduler marks the request done in the shared frontier once those items are
+    # stored too. Placed next to the engine, so every item and request has gone
+    # past the other middlewares (and the requests to the scheduler) by then.
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not scheduler.is_enabled(crawler.settings):
+            raise NotConfigured
+        return cls(crawler)
+
+    async def process_spider_output(self, response, result, spider):
+        async for i in result:
+            if is_item(i):
+                self.crawler.signals.send_catch_log(signal=scheduler.item_yielded, request=response.request, item=i)
+            yield i
+        self.done(response)
+
+    def process_spider_exception(self, response, exception, spider):
+        # The callback raised: retrying it on another worker would only raise again
+        self.done(response)
+        return None
+
+    def done(self, response):
+        self.crawler.signals.send_catch_log(signal=scheduler.request_done, request=response.request)
+
+
+class FrontierDelayMiddleware:
+    # With SharedScheduler: the frontier booked a download slot for the request's
+    # domain when it was leased (so the whole fleet keeps FRONTIER_DOMAIN_DELAY
+    # between two requests to a domain); wait here until that slot comes.
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not scheduler.is_enabled(crawler.settings):
+            raise NotConfigured
+        return cls(crawler.stats)
+
+    async def process_request(self, request, spider):
+        # Popped, so a retry of the request doesn't wait for an old slot again
+        slot = request.meta.pop("frontier_slot", None)
+        wait = slot - time.time() if slot else 0
+        if wait > 0:
+            self.stats.inc_value("frontier/politeness_wait_ms", int(wait * 1000))
+            await asyncio.sleep(wait)
+        return None
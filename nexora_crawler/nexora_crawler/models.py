@@ -0,0 +1,41 @@
+import os
+
+# The embedding model and the LLM. Choose with MODEL_BACKEND in .env:
+#   google - Gemini through langchain_google_genai (default)
+#   stub   - local stand-ins that need no API key or network, for tests and
+#            benchmarks. They sleep STUB_EMBED_LATENCY seconds per embedding call
+#            and STUB_LLM_LATENCY seconds per generated token, so batching and
+#            concurrency behave roughly like the real thing.
+#
+# The model libraries are imported only when a model is built; they are slow to import.
+
+EMBEDDING_MODEL = "models/text-embedding-004"
+CHAT_MODEL = "gemini-2.5-flash"
+
+
+def model_backend():
+    return os.getenv("MODEL_BACKEND", "google").lower()
+
+
+def embedding_model_name():
+    # Also part of the embedding cache keys, so stub vectors never mix with real ones
+    return "stub" if model_backend() == "stub" else EMBEDDING_MODEL
+
+
+def build_embeddings():
+    if model_backend() == "stub":
+        from nexora_crawler.stub_models import StubEmbeddings
+        return StubEmbeddings(size=768, latency=float(os.getenv("STUB_EMBED_LATENCY", "0.05")))
+
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+    # We use 'text-embedding-004' which matches our Index definition (768 dimensions).
+    return GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL)
+
+
+def build_llm():
+    if model_backend() == "stub":
+        from nexora_crawler.stub_models import StubChatModel
+        return StubChatModel(latency=float(os.getenv("STUB_LLM_LATENCY", "0.01")))
+
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(model=CHAT_MODEL, temperature=0)
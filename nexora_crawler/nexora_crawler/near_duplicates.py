@@ -0,0 +1,126 @@
+import hashlib
+import re
+import zlib
+
+import numpy as np
+from bson.binary import Binary
+
+# Finds documents that are nearly the same as one we already indexed: paginated
+# listings, print versions, the same PDF under two URLs. The indexer runs this
+# before embedding, and a near-duplicate becomes an alias of the first copy
+# (duplicate_of) instead of getting passages of its own.
+#
+# How: every document is cut into overlapping 5-word shingles, and a MinHash
+# signature (NUM_PERM minimums of random hash functions) estimates the Jaccard
+# similarity of two shingle sets as the fraction of equal signature values.
+# To find candidates without comparing against every document, the signature is
+# cut into BANDS bands; documents sharing any band hash are candidates (LSH).
+# With 16 bands of 8 values, pairs above ~0.7 similarity almost always share a
+# band, pairs below ~0.4 almost never do. Candidates are then checked against
+# the threshold with their signatures.
+#
+# The band hashes are stored on the document (lsh_bands, with a multikey index),
+# so finding candidates is one indexed query per document.
+
+SHINGLE_WORDS = 5
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+
+WORD = re.compile(r"\w+")
+MERSENNE_PRIME = (1 << 61) - 1
+
+# Fixed parameters, so signatures from different runs and machines compare.
+# They span the whole field: with small ones, (a * x + b) of a 32-bit shingle hash
+# hardly ever wraps around the prime, every "permutation" keeps the order of the
+# shingle hashes, and the one with the smallest hash decides all 128 values. The
+# products overflow uint64 and wrap, which mixes the bits further.
+_rng = np.random.default_rng(20240601)
+A = _rng.integers(1, MERSENNE_PRIME, NUM_PERM, dtype=np.uint64)
+B = _rng.integers(0, MERSENNE_PRIME, NUM_PERM, dtype=np.uint64)
+
+
+def shingles(text):
+    words = WORD.findall(text.lower())
+    if len(words) < SHINGLE_WORDS:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def signature(text):
+    # NUM_PERM uint32 values, or None for a document without words
+    hashes = np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in shingles(text)), dtype=np.uint64)
+    if len(hashes) == 0:
+        return None
+    minimums = np.full(NUM_PERM, MERSENNE_PRIME, dtype=np.uint64)
+    # In slices, so a 500-page PDF doesn't need a NUM_PERM x shingles matrix at once
+    for start in range(0, len(hashes), 8192):
+        chunk = hashes[start:start + 8192]
+        values = (A[:, None] * chunk[None, :] + B[:, None]) % MERSENNE_PRIME
+        np.minimum(minimums, values.min(axis=1), out=minimums)
+    return (minimums & 0xFFFFFFFF).astype(np.uint32)
+
+
+def band_hashes(sig):
+    # One 64-bit number per band; the band number is part of the hash so bands never match across
+    return [
+        int.from_bytes(hashlib.blake2b(bytes([band]) + sig[band * ROWS:(band + 1) * ROWS].tobytes(),
+                                       digest_size=8).digest(), "big", signed=True)
+        for band in range(BANDS)
+    ]
+
+
+def similarity(sig, other):
+    return float(np.mean(sig == other))
+
+
+def encode_signature(sig):
+    return Binary(sig.tobytes())
+
+
+def decode_signature(value):
+    return np.frombuffer(value, dtype=np.uint32)
+
+
+class NearDuplicateFinder:
+    # Checks a batch of pending documents against the already indexed ones (and each other)
+
+    def __init__(self, collection, threshold=0.85):
+        self.collection = collection
+        self.threshold = threshold
+
+    def find(self, batch):
+        # Returns {doc _id: (signature, bands, canonical _id or None)} for the documents with text
+        results = {}
+        seen_in_batch = []
+        for doc in batch:
+            sig = signature(doc.get("text_content") or "")
+            if sig is None:
+                continue
+            bands = band_hashes(sig)
+            canonical = self.find_canonical(doc, sig, bands, seen_in_batch)
+            results[doc["_id"]] = (sig, bands, canonical)
+            if canonical is None:
+                seen_in_batch.append((doc["_id"], sig, set(bands)))
+        return results
+
+    def find_canonical(self, doc, sig, bands, seen_in_batch):
+        best, best_score = None, self.threshold
+        for doc_id, other, other_bands in seen_in_batch:
+            if other_bands.intersection(bands):
+                score = similarity(sig, other)
+                if score >= best_score:
+                    best, best_score = doc_id, score
+
+        # Only indexed originals count: an alias of an alias would be a chain to follow
+        candidates = self.collection.find(
+            {"lsh_bands": {"$in": bands}, "index_status": "indexed", "_id": {"$ne": doc["_id"]}},
+            {"minhash": 1},
+        )
+        for candidate in candidates:
+            if "minhash" not in candidate:
+                continue
+            score = similarity(sig, decode_signature(candidate["minhash"]))
+            if score >= best_score:
+                best, best_score = candidate["_id"], score
+        return best
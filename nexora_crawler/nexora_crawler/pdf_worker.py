@@ -0,0 +1,28 @@
+import time
+import fitz # PyMuPDF
+
+# This module runs inside the PDF worker processes started by PdfParsingPipeline.
+# Keep it small: every worker imports it, and everything passed in or out has to be picklable.
+
+
+def open_pdf(source):
+    # `source` is either the raw PDF bytes from the response or a path on disk
+    if isinstance(source, (bytes, bytearray)):
+        return fitz.open(stream=source, filetype="pdf")
+    return fitz.open(source)
+
+
+def extract_text(source, max_pages, max_seconds):
+    # We stop at the page cap or when the time budget runs out, so one huge
+    # or pathological file cannot keep a worker busy forever.
+    deadline = time.monotonic() + max_seconds
+    text = []
+
+    with open_pdf(source) as doc:
+        for page_number, page in enumerate(doc):
+            if page_number >= max_pages or time.monotonic() > deadline:
+                break
+            text.append(page.get_text())
+
+    # Pages are separated by a form feed so the chunker can tell which page a passage is from
+    return "\f".join(text)
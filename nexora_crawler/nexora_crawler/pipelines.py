@@ -1,68 +1,450 @@
+import asyncio
+import hashlib
+import logging
+import multiprocessing
 import pymongo
-import fitz # PyMuPDF
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure, PyMongoError
+from twisted.internet import defer, task, threads
+from twisted.python.failure import Failure
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
+from scrapy.exceptions import DropItem, NotConfigured
+from scrapy.utils.conf import build_component_list
+from scrapy.utils.misc import load_object
+
+from nexora_crawler import pdf_worker
+from nexora_crawler.content_extraction import extract_main_content
+from nexora_crawler.crawl_state import load_crawl_state
+from nexora_crawler.metrics import timed_pipeline_stage
+
+logger = logging.getLogger(__name__)
+
+# Sent by MongoPipeline when a batch is written: `items` are in Mongo now, `lost` are
+# (item, error) pairs that could not be written. SharedScheduler only marks a leased
+# request done once its items are in one or the other.
+items_stored = object()
+# Has MongoPipeline write its buffer now instead of at the next MONGO_FLUSH_INTERVAL
+# (SharedScheduler sends it when its leases only wait for items to be stored)
+flush_requested = object()
+
+
+def content_hash(text):
+    # A stable fingerprint of the text, used to recognise the same content again
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def write_file_once(path, body):
+    if os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(body)
 
 
 class NexoraCrawlerPipeline:
     def process_item(self, item, spider):
         return item
 
-class PdfParsingPipeline:
+class ContentExtractionPipeline:
+    # Turns the raw HTML of a page (item['html_body']) into text_content: the main
+    # content without navigation, footers, scripts and other boilerplate, with its
+    # headings kept as "# " lines for chunking (see content_extraction.py).
+    # Any site works, and a static page needs no browser to get there.
+    # It runs right here in the reactor thread: a page takes about a millisecond,
+    # less than sending it to another process would.
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.stats)
+
+    @timed_pipeline_stage
     def process_item(self, item, spider):
         adapter = ItemAdapter(item)
-        
+        page = adapter.get('html_body')
+        if not page or adapter.get('text_content'):
+            return item
+
+        adapter['text_content'] = extract_main_content(page)
+        self.stats.inc_value("content_extraction/pages")
+        self.stats.inc_value("content_extraction/html_chars", len(page))
+        self.stats.inc_value("content_extraction/text_chars", len(adapter['text_content']))
+        return item
+
+
+class PdfParsingPipeline:
+    def __init__(self, files_store, store_files=False, workers=None, timeout=60, max_pages=500,
+                 max_bytes=50 * 1024 * 1024):
+        self.files_store = files_store
+        self.store_files = store_files
+
+        # PDFs are parsed in a pool of worker processes so the reactor never waits on PyMuPDF
+        self.workers = workers or os.cpu_count()
+        self.timeout = timeout
+        self.max_pages = max_pages
+        self.max_bytes = max_bytes
+        self.executor = None
+        self.slots = asyncio.Semaphore(self.workers)
+        # Seconds on top of `timeout` before we give up on a worker (a spawned one imports PyMuPDF first)
+        self.startup_margin = 10
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(
+            files_store=crawler.settings.get("FILES_STORE"),
+            store_files=crawler.settings.getbool("PDF_STORE_FILES", False),
+            workers=crawler.settings.getint("PDF_WORKERS", 0),
+            timeout=crawler.settings.getfloat("PDF_TIMEOUT", 60),
+            max_pages=crawler.settings.getint("PDF_MAX_PAGES", 500),
+            max_bytes=crawler.settings.getint("PDF_MAX_BYTES", 50 * 1024 * 1024),
+        )
+
+    def open_spider(self, spider):
+        self.executor = self.start_executor()
+
+    def close_spider(self, spider):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def start_executor(self):
+        # "spawn" because forking a process that is running the reactor and its threads is unsafe
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+
+    def replace_executor(self, executor):
+        # Start a fresh pool for the next items, once: every PDF that was in the old
+        # pool ends up here (the others with BrokenProcessPool once we kill it)
+        if self.executor is not executor:
+            return
+        self.executor = self.start_executor()
+        # shutdown() alone waits for the running calls, and a hung one never returns.
+        # The executor has no public way to kill its workers before Python 3.14.
+        for process in list((executor._processes or {}).values()):
+            process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    @timed_pipeline_stage
+    async def process_item(self, item, spider):
+        adapter = ItemAdapter(item)
+
+        # Fast path: the spider already has the PDF bytes, so we parse them from memory
+        if adapter.get('file_body'):
+            body = adapter['file_body']
+            adapter['text_content'] = await self.extract_text_from_pdf(body)
+
+            # Keeping a copy on disk is optional, and done off the reactor thread
+            if self.store_files:
+                adapter['files'] = [await self.store_file(adapter.get('source_url'), body)]
+
         # Check if the item has downloaded files
-        if adapter.get('files'):
+        elif adapter.get('files'):
             # Get the path where Scrapy saved the file
             # 'files' is a list of dicts. We take the first one.
             file_info = adapter['files'][0] 
             relative_path = file_info['path']
             
-            # Construct absolute path (files are in 'downloads' folder)
-            # We assume current working directory is the project root
-            absolute_path = os.path.join(os.getcwd(), 'downloads', relative_path)
+            # Construct absolute path (files are in the FILES_STORE folder)
+            absolute_path = os.path.join(self.files_store, relative_path)
             
-            # Extract text
-            extracted_text = self.extract_text_from_pdf(absolute_path)
+            # Extract text (other downloads keep flowing while we wait)
+            extracted_text = await self.extract_text_from_pdf(absolute_path)
             
             # Save the text back into the item
             adapter['text_content'] = extracted_text
             
         return item
 
-    def extract_text_from_pdf(self, path):
+    async def store_file(self, url, body):
+        # Content-addressed like FilesPipeline: the same PDF is only ever written once
+        checksum = hashlib.sha1(body).hexdigest()
+        relative_path = f"full/{checksum}.pdf"
+        absolute_path = os.path.join(self.files_store, relative_path)
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, write_file_once, absolute_path, body)
+        return {"url": url, "path": relative_path, "checksum": checksum}
+
+    async def extract_text_from_pdf(self, source):
+        # `source` is the PDF bytes or a path to the saved file. A PDF we can't read
+        # drops the item: an error message is not the document's text.
         try:
-            doc = fitz.open(path)
-            text = []
-            for page in doc:
-                text.append(page.get_text())
-            return "\n".join(text)
-        except Exception as e:
-            return f"Error reading PDF: {e}"
-                
+            size = len(source) if isinstance(source, bytes) else os.path.getsize(source)
+        except OSError as e:
+            raise DropItem(f"Error reading PDF: {e}")
+        if size > self.max_bytes:
+            raise DropItem(f"Error reading PDF: file is {size} bytes, over the {self.max_bytes} byte limit")
+
+        # One PDF per worker process at a time. The rest wait here rather than in the
+        # pool, so the timeout only counts the parsing, not the wait for a free worker.
+        async with self.slots:
+            executor = self.executor
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(
+                executor, pdf_worker.extract_text, source, self.max_pages, self.timeout
+            )
+            try:
+                # The worker checks the time between pages, so it only stops itself when a
+                # page finishes. The extra margin covers the start-up of a fresh worker.
+                return await asyncio.wait_for(future, self.timeout + self.startup_margin)
+            except asyncio.TimeoutError:
+                # Stuck inside one page (or in opening the file): it would hold its
+                # process forever, so the pool is replaced
+                self.replace_executor(executor)
+                raise DropItem(f"Error reading PDF: timed out after {self.timeout} seconds")
+            except BrokenProcessPool as e:
+                # A worker crashed (e.g. PyMuPDF hit a corrupt file)
+                self.replace_executor(executor)
+                raise DropItem(f"Error reading PDF: {e}")
+            except Exception as e:
+                raise DropItem(f"Error reading PDF: {e}")
+
+class IncrementalPipeline:
+    # Drops items whose text is exactly what we already stored for that URL.
+    # Unchanged pages then cost no Mongo write and no new embedding call.
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.known_hashes = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("INCREMENTAL_CRAWL_ENABLED"):
+            raise NotConfigured
+        return cls(crawler.stats)
+
+    def open_spider(self, spider):
+        state = load_crawl_state(["content_hash"])
+        self.known_hashes = {url: doc.get("content_hash") for url, doc in state.items()}
+
+    @timed_pipeline_stage
+    def process_item(self, item, spider):
+        adapter = ItemAdapter(item)
+        if not adapter.get('text_content'):
+            return item
+
+        adapter['content_hash'] = content_hash(adapter['text_content'])
+        url = adapter.get('source_url')
+
+        if url and self.known_hashes.get(url) == adapter['content_hash']:
+            self.stats.inc_value("incremental/unchanged")
+            raise DropItem(f"Unchanged since last crawl: {url}")
+
+        self.known_hashes[url] = adapter['content_hash']
+        self.stats.inc_value("incremental/changed")
+        return item
+
 class MongoPipeline:
-    def __init__(self):
+    # Duplicate key: an upsert of the same URL got there first
+    DUPLICATE_KEY = 11000
+
+    def __init__(self, bulk_size=500, flush_interval=5.0, retries=3):
         # We read the URI from the environment variable (loaded in settings.py)
         self.mongo_uri = os.getenv("MONGO_URI")
         self.db_name = "nexora_db"
         self.collection_name = "raw_materials" # We call it raw because it's not vectorized yet
 
+        # Items are buffered and written in batches instead of one round trip each
+        self.bulk_size = bulk_size
+        self.flush_interval = flush_interval
+        self.buffer = []  # (item, operation)
+        self.pending_flushes = set()
+        self.retries = retries
+        self.stats = None
+        self.signals = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        pipeline = cls(
+            bulk_size=crawler.settings.getint("MONGO_BULK_SIZE", 500),
+            flush_interval=crawler.settings.getfloat("MONGO_FLUSH_INTERVAL", 5.0),
+            retries=crawler.settings.getint("MONGO_WRITE_RETRIES", 3),
+        )
+        pipeline.stats = crawler.stats
+        pipeline.signals = crawler.signals
+        crawler.signals.connect(pipeline.flush, signal=flush_requested)
+        return pipeline
+
     def open_spider(self, spider):
         # Connect when the spider starts
         self.client = pymongo.MongoClient(self.mongo_uri)
         self.db = self.client[self.db_name]
+        self.collection = self.db[self.collection_name]
+
+        # Upserts look documents up by URL (or by hash when there is no URL)
+        self.create_url_index()
+        self.collection.create_index("content_hash")
+        # The indexer finds its work with this index: pending documents, oldest first
+        self.collection.create_index([("index_status", 1), ("ingested_at", 1)])
+
+        # Flush on a timer too, so a slow crawl doesn't keep items in memory forever
+        self.flush_loop = task.LoopingCall(self.flush)
+        self.flush_loop.start(self.flush_interval, now=False)
+
+    def create_url_index(self):
+        if create_url_index(self.collection):
+            return
+        # Copies stored by earlier versions, before the index existed. The crawl still
+        # works on a plain index, but every upsert updates just one of the copies.
+        logger.error(
+            "Could not make source_url unique: %s holds several documents for some URLs. "
+            "Merge them once with `python indexer.py --dedupe-urls` (see README.md).",
+            self.collection_name,
+        )
+        if self.stats:
+            self.stats.set_value("mongo/duplicate_urls", True)
 
     def close_spider(self, spider):
-        # Disconnect when finished
-        self.client.close()
+        # Write whatever is left, wait for every batch, then disconnect
+        if self.flush_loop.running:
+            self.flush_loop.stop()
+        self.flush()
 
+        d = defer.DeferredList(list(self.pending_flushes))
+        d.addBoth(lambda _: self.client.close())
+        return d
+
+    @timed_pipeline_stage
     def process_item(self, item, spider):
         # We convert the Scrapy Item to a normal Python Dictionary
         data = dict(item)
-        
-        # Insert into MongoDB
-        self.db[self.collection_name].insert_one(data)
-        
-        return item
\ No newline at end of file
+
+        # Raw file bytes and HTML were only needed for parsing, they don't belong in the database
+        data.pop("file_body", None)
+        data.pop("html_body", None)
+
+        self.buffer.append((item, self.build_operation(data)))
+        if len(self.buffer) >= self.bulk_size:
+            self.flush()
+
+        return item
+
+    def build_operation(self, data):
+        if data.get("text_content") and not data.get("content_hash"):
+            data["content_hash"] = content_hash(data["text_content"])
+
+        # New or changed content: the indexer has to (re-)chunk and embed it.
+        # ingested_at also wakes up a watching indexer (python indexer.py --watch).
+        data["index_status"] = "pending"
+        data["ingested_at"] = datetime.now(timezone.utc)
+
+        # Re-crawling the same page updates the existing document instead of adding a copy
+        if data.get("source_url"):
+            key = {"source_url": data["source_url"]}
+        elif data.get("content_hash"):
+            key = {"content_hash": data["content_hash"]}
+        else:
+            return InsertOne(data)
+
+        # New content also gets a fresh start if the indexer had given up on the old one
+        return UpdateOne(key, {"$set": data, "$unset": {"index_failures": "", "index_error": ""}}, upsert=True)
+
+    def flush(self):
+        if not self.buffer:
+            return defer.succeed(None)
+
+        batch, self.buffer = self.buffer, []
+
+        # bulk_write blocks on the network, so it runs in the reactor thread pool
+        d = threads.deferToThread(self.write_batch, batch)
+        self.pending_flushes.add(d)
+        d.addBoth(self.flush_done, d, batch)
+        return d
+
+    def write_batch(self, batch):
+        # Returns the write counts and the (item, error) pairs that could not be written.
+        # Unordered: one bad document doesn't stop the rest of the batch.
+        counts = {"nUpserted": 0, "nModified": 0, "nInserted": 0}
+        lost = []
+        for attempt in range(self.retries + 1):
+            try:
+                result = self.collection.bulk_write([operation for _, operation in batch], ordered=False)
+                add_counts(counts, result.bulk_api_result)
+                return counts, lost
+            except BulkWriteError as e:
+                add_counts(counts, e.details)
+                retry = []
+                for error in e.details.get("writeErrors", []):
+                    entry = batch[error["index"]]
+                    # An upsert that lost a race: the document is there now, so running it
+                    # again updates it. Any other error would only fail again.
+                    if error.get("code") == self.DUPLICATE_KEY:
+                        retry.append(entry)
+                    else:
+                        lost.append((entry[0], error.get("errmsg")))
+                batch = retry
+                if not batch:
+                    return counts, lost
+            except PyMongoError as e:
+                # The connection or the server: the whole batch again (upserts don't mind)
+                logger.warning("Mongo bulk write of %d items failed (attempt %d): %s", len(batch), attempt + 1, e)
+                time.sleep(min(2 ** attempt, 30))
+        return counts, lost + [(item, "still failing after retries") for item, _ in batch]
+
+    def flush_done(self, result, d, batch):
+        self.pending_flushes.discard(d)
+
+        if isinstance(result, Failure):
+            logger.error("Mongo bulk write of %d items failed: %s", len(batch), result.getErrorMessage())
+            if self.stats:
+                self.stats.inc_value("mongo/bulk_errors")
+            self.send_stored([], [(item, result.getErrorMessage()) for item, _ in batch])
+            return None
+
+        counts, lost = result
+        if lost:
+            self.log_lost(lost)
+        lost_ids = {id(item) for item, _ in lost}
+        self.send_stored([item for item, _ in batch if id(item) not in lost_ids], lost)
+        if self.stats:
+            self.stats.inc_value("mongo/bulk_writes")
+            self.stats.inc_value("mongo/upserted", counts["nUpserted"])
+            self.stats.inc_value("mongo/modified", counts["nModified"])
+            self.stats.inc_value("mongo/inserted", counts["nInserted"])
+            if lost:
+                self.stats.inc_value("mongo/lost", len(lost))
+        return None
+
+    def send_stored(self, items, lost):
+        if self.signals:
+            self.signals.send_catch_log(signal=items_stored, items=items, lost=lost)
+
+    def log_lost(self, lost):
+        # Named one by one, so the pages can be crawled again
+        for item, error in lost:
+            logger.error("Not stored in Mongo: %s (%s)", ItemAdapter(item).get("source_url"), error)
+
+
+def add_counts(counts, result):
+    for key in counts:
+        counts[key] += result.get(key, 0)
+
+
+def create_url_index(collection):
+    # Unique, so there is one document per URL even when two upserts of it race
+    # (in one unordered batch, or from two crawl workers): the loser gets E11000
+    # and is simply retried as an update (see MongoPipeline.write_batch).
+    # False when stored duplicates prevent it: the index is then a plain one.
+    indexes = collection.index_information()
+    if "source_url_1" in indexes and not indexes["source_url_1"].get("unique"):
+        collection.drop_index("source_url_1")  # the plain index of earlier versions
+    try:
+        collection.create_index("source_url", unique=True, partialFilterExpression={"source_url": {"$type": "string"}})
+        return True
+    except OperationFailure:
+        collection.create_index("source_url")
+        return False
+
+
+def stores_items(settings):
+    # Whether MongoPipeline is one of the item pipelines, and so sends items_stored
+    paths = build_component_list(settings.getwithbase("ITEM_PIPELINES"))
+    return any(issubclass(load_object(path), MongoPipeline) for path in paths)
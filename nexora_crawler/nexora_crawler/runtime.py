@@ -0,0 +1,172 @@
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+# The database connection, models, caches and retriever, shared by console_app.py,
+# chat_server.py, indexer.py and test_nexora.py.
+#
+# Nothing is imported or connected until a part is first used, so a script that
+# needs only Mongo (or nothing, when there is no work) never loads the Gemini or
+# LangChain stacks. `prewarm()` builds parts in a background thread, e.g. while the
+# console waits for the first question. `report()` shows what was built, how long
+# it took and where; for the import cost of single modules, run with
+# `python -X importtime`.
+#
+# Every part is built once, under its own lock, by whichever thread asks first.
+
+load_dotenv()
+
+
+def context_budget_enabled():
+    return os.getenv("CONTEXT_BUDGET", "1") != "0"
+
+
+def part(build):
+    name = build.__name__
+
+    def get(self):
+        with self.locks[name]:
+            if name not in self.parts:
+                started = time.perf_counter()
+                self.parts[name] = build(self)
+                self.timings[name] = (time.perf_counter() - started, threading.current_thread().name)
+        return self.parts[name]
+
+    get.__name__ = name
+    return property(get)
+
+
+class Runtime:
+    PARTS = ["client", "collection", "passages", "embeddings", "vector_store", "llm", "retriever",
+             "context_budgeter", "answer_cache", "bm25"]
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.parts = {}
+        self.timings = {}
+        self.events = {}
+        self.locks = {name: threading.Lock() for name in self.PARTS}
+
+    @part
+    def client(self):
+        from pymongo import MongoClient
+        # One pooled client; chat_server.py shares it between all requests
+        return MongoClient(os.getenv("MONGO_URI"), maxPoolSize=int(os.getenv("MONGO_MAX_POOL_SIZE", "50")))
+
+    @part
+    def collection(self):
+        return self.client["nexora_db"]["raw_materials"]
+
+    @part
+    def passages(self):
+        # Each crawled document is split into passages; the passages are what we embed and search
+        return self.client["nexora_db"]["passages"]
+
+    @part
+    def embeddings(self):
+        # MODEL_BACKEND=stub uses local stand-ins for Gemini, see models.py.
+        # Text we embedded before (in any run or script) comes from the local cache.
+        from nexora_crawler.embedding_cache import DEFAULT_CACHE_PATH, CachedEmbeddings, EmbeddingCache
+        from nexora_crawler.models import build_embeddings, embedding_model_name
+
+        return CachedEmbeddings(
+            build_embeddings(),
+            embedding_model_name(),
+            EmbeddingCache(
+                os.getenv("EMBEDDING_CACHE_PATH", DEFAULT_CACHE_PATH),
+                max_entries=int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000")),
+            ),
+        )
+
+    @part
+    def vector_store(self):
+        # Atlas, or the local index with VECTOR_BACKEND=local
+        from nexora_crawler.vector_backends import build_vector_store
+        return build_vector_store(self.passages, self.embeddings)
+
+    @part
+    def llm(self):
+        from nexora_crawler.models import build_llm
+        return build_llm()
+
+    @part
+    def retriever(self):
+        # Vector search fused with BM25 keyword search, see vector_backends.py.
+        # With the context budget on it over-fetches and the budgeter picks the passages.
+        from nexora_crawler.vector_backends import build_retriever
+        k = int(os.getenv("CONTEXT_FETCH_K", "12")) if context_budget_enabled() else 3
+        return build_retriever(self.passages, self.vector_store, k=k)
+
+    @part
+    def context_budgeter(self):
+        # MMR selection and trimming of the retrieved passages to a token budget
+        # (context_budget.py); None with CONTEXT_BUDGET=0
+        if not context_budget_enabled():
+            return None
+        from nexora_crawler.context_budget import ContextBudgeter
+
+        return ContextBudgeter(
+            self.embeddings,
+            self.passages,
+            max_tokens=int(os.getenv("CONTEXT_MAX_TOKENS", "1500")),
+            max_passages=int(os.getenv("CONTEXT_MAX_PASSAGES", "3")),
+            mmr_lambda=float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7")),
+        )
+
+    @part
+    def answer_cache(self):
+        # A paraphrase of a question we answered before is answered again without
+        # retrieval or an LLM call (until its passages are re-indexed)
+        from nexora_crawler.answer_cache import DEFAULT_ANSWERS_PATH, AnswerCache
+        from nexora_crawler.models import embedding_model_name
+
+        return AnswerCache(
+            os.getenv("ANSWER_CACHE_PATH", DEFAULT_ANSWERS_PATH),
+            model_name=embedding_model_name(),
+            threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92")),
+            ttl=float(os.getenv("ANSWER_CACHE_TTL", "86400")),
+            max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000")),
+        )
+
+    @part
+    def bm25(self):
+        # The keyword index the indexer updates along with the passages
+        from nexora_crawler.vector_backends import open_bm25_index
+        return open_bm25_index()
+
+    def is_built(self, name):
+        return name in self.parts
+
+    def mark(self, event):
+        # Records a moment worth reporting, e.g. when the prompt was shown
+        self.events[event] = time.perf_counter() - self.started
+
+    def prewarm(self, *names):
+        # Builds the given parts (in order) in the background; errors surface later, on first use
+        def build():
+            for name in names:
+                try:
+                    getattr(self, name)
+                except Exception:
+                    return
+
+        thread = threading.Thread(target=build, name="prewarm", daemon=True)
+        thread.start()
+        return thread
+
+    def report(self):
+        lines = [f"Startup: runtime created {time.perf_counter() - self.started:.2f}s ago"]
+        for event, seconds in self.events.items():
+            lines.append(f"  {event} after {seconds:.2f}s")
+        for name in self.PARTS:
+            if name in self.timings:
+                seconds, thread = self.timings[name]
+                where = "in the background" if thread == "prewarm" else "on first use"
+                # A part's time includes the parts it needed that weren't built yet
+                lines.append(f"  {name:<13} {seconds:6.2f}s  {where}")
+        return "\n".join(lines)
+
+
+runtime = Runtime()
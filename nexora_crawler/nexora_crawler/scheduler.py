@@ -0,0 +1,258 @@
+import functools
+import os
+import pickle
+import socket
+import time
+from collections import deque
+from urllib.parse import urlparse
+
+from scrapy import signals
+from scrapy.core.scheduler import BaseScheduler
+from scrapy.exceptions import IgnoreRequest
+from scrapy.utils.misc import load_object
+from scrapy.utils.request import request_from_dict
+from twisted.internet import task
+
+from nexora_crawler import pipelines
+from nexora_crawler.frontier import DONE, FAILED, open_frontier
+
+# A Scrapy scheduler that keeps its requests in the shared frontier (frontier.py)
+# instead of in this process, so several workers can crawl one site together:
+#
+#   enqueue_request  requests found by this worker are pushed to the frontier in
+#                    batches; ones the fleet has already seen are dropped there
+#                    (also dont_filter ones: every worker yields the same start URLs)
+#   next_request     leases the next request (and a download slot for its domain),
+#                    with at most CONCURRENT_REQUESTS of them being crawled at once,
+#                    so one worker doesn't take the whole queue while the others idle
+#   finishing        a request is marked done when its callback has run to the end
+#                    (FrontierAckMiddleware sends request_done) and every item it
+#                    yielded is in Mongo (MongoPipeline sends items_stored) or was
+#                    dropped, or from its errback when the download failed; retries
+#                    and redirects of a leased request stay in this worker under the
+#                    same lease
+#
+# crawl_workers.py sets SCHEDULER to this class for every worker it starts.
+
+# Sent by FrontierAckMiddleware when a leased request's callback has finished
+request_done = object()
+# Sent by FrontierAckMiddleware for each item a leased request's callback yields
+item_yielded = object()
+
+
+def is_enabled(settings):
+    scheduler = settings.get("SCHEDULER")
+    return bool(scheduler) and issubclass(load_object(scheduler), SharedScheduler)
+
+
+class SharedScheduler(BaseScheduler):
+    def __init__(self, crawler, frontier, worker, delay=1.0, max_wait=5.0, poll_interval=0.5, push_batch=100,
+                 max_leases=16):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.fingerprinter = crawler.request_fingerprinter
+        self.frontier = frontier
+        self.worker = worker
+        self.delay = delay
+        self.max_wait = max_wait
+        self.poll_interval = poll_interval
+        self.push_batch = push_batch
+        self.spider = None
+        self.outbox = []          # requests waiting to be pushed
+        self.local = deque()      # retries and redirects of our leased requests
+        self.in_progress = set()  # ids leased by this worker and not finished yet
+        self.crawling = set()     # the ones of those whose callback hasn't finished yet
+        self.max_leases = max_leases
+        self.unstored = {}        # id -> items it yielded that aren't stored or dropped yet
+        self.item_requests = {}   # id(item) -> the id of the request that yielded it
+        self.errors = {}          # id -> why one of its items was not stored
+        self.idle_until = 0
+        self.pending_checked = (0, True)
+        self.wake_loop = task.LoopingCall(self.wake)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        frontier = open_frontier(
+            settings.get("FRONTIER_URI", "mongodb"),
+            settings.get("FRONTIER_NAME") or crawler.spidercls.name,
+            lease_seconds=settings.getfloat("FRONTIER_LEASE_SECONDS", 300),
+            max_attempts=settings.getint("FRONTIER_MAX_ATTEMPTS", 3),
+        )
+        scheduler = cls(
+            crawler,
+            frontier,
+            settings.get("FRONTIER_WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}",
+            delay=settings.getfloat("FRONTIER_DOMAIN_DELAY", settings.getfloat("DOWNLOAD_DELAY")),
+            max_wait=settings.getfloat("FRONTIER_MAX_WAIT", 5.0),
+            max_leases=settings.getint("CONCURRENT_REQUESTS"),
+        )
+        crawler.signals.connect(scheduler.on_request_done, signal=request_done)
+        crawler.signals.connect(scheduler.on_item_yielded, signal=item_yielded)
+        crawler.signals.connect(scheduler.on_items_stored, signal=pipelines.items_stored)
+        crawler.signals.connect(scheduler.on_item_dropped, signal=signals.item_dropped)
+        crawler.signals.connect(scheduler.on_item_error, signal=signals.item_error)
+        if not pipelines.stores_items(settings):
+            # Nothing sends items_stored: an item is as stored as it gets once scraped
+            crawler.signals.connect(scheduler.on_item_scraped, signal=signals.item_scraped)
+        return scheduler
+
+    def open(self, spider):
+        self.spider = spider
+        spider.logger.info("Shared frontier: worker %s, %s" % (self.worker, self.frontier.counts()))
+        self.wake_loop.start(self.poll_interval, now=False)
+
+    def close(self, reason):
+        if self.wake_loop.running:
+            self.wake_loop.stop()
+        self.flush()
+        # Whatever we leased and didn't finish goes back to the other workers now,
+        # instead of when its lease runs out
+        self.frontier.release(self.in_progress)
+        self.stats.set_value("frontier/released", len(self.in_progress))
+        self.frontier.close()
+
+    def has_pending_requests(self):
+        if self.local or self.outbox:
+            return True
+        # Also true while other workers are busy: what they find may still come our way
+        checked_at, pending = self.pending_checked
+        if time.monotonic() - checked_at > self.poll_interval:
+            pending = self.frontier.has_pending()
+            self.pending_checked = (time.monotonic(), pending)
+        return pending
+
+    def enqueue_request(self, request):
+        if "frontier_id" in request.meta:
+            # A retry or redirect of a request we leased: it stays here, under the same lease
+            self.local.append(request)
+            return True
+
+        self.outbox.append({
+            "_id": self.fingerprinter.fingerprint(request).hex(),
+            "url": request.url,
+            "domain": urlparse(request.url).hostname or "",
+            "priority": request.priority,
+            "request": pickle.dumps(request.to_dict(spider=self.spider), protocol=4),
+        })
+        if len(self.outbox) >= self.push_batch:
+            self.flush()
+        # Whether the fleet had seen it is only known after the push (see frontier/duplicates)
+        return True
+
+    def flush(self):
+        if not self.outbox:
+            return
+        added = self.frontier.push(self.outbox)
+        self.stats.inc_value("frontier/pushed", added)
+        self.stats.inc_value("frontier/duplicates", len(self.outbox) - added)
+        self.outbox = []
+        if added:
+            self.idle_until = 0  # there is new work, no need to wait for the next poll
+
+    def wake(self):
+        # Every poll_interval. When next_request finds nothing, the engine only asks
+        # again on its 5 second heartbeat (or when one of its downloads ends, and an
+        # idle worker has none), and that is also when it notices the crawl is over.
+        if not self.crawling and not self.local and any(self.unstored.values()):
+            # All our leases wait for is items in MongoPipeline's buffer: write them now
+            # instead of at the next MONGO_FLUSH_INTERVAL
+            self.crawler.signals.send_catch_log(signal=pipelines.flush_requested)
+        if len(self.crawling) >= self.max_leases:
+            return
+        # Have the engine ask now, for the work other workers pushed meanwhile
+        self.idle_until = 0
+        slot = getattr(self.crawler.engine, "_slot", None)
+        if slot is not None:
+            slot.nextcall.schedule()
+
+    def next_request(self):
+        if self.local:
+            return self.local.popleft()
+        self.flush()
+        # Enough to keep our downloader busy: the rest is for the other workers
+        if len(self.crawling) >= self.max_leases:
+            return None
+        # Don't ask the database again on every engine tick while the queue is empty
+        if time.monotonic() < self.idle_until:
+            return None
+
+        leased = self.frontier.lease(self.worker, self.delay, self.max_wait)
+        if leased is None:
+            self.idle_until = time.monotonic() + self.poll_interval
+            return None
+
+        request_id, data, slot = leased
+        request = request_from_dict(pickle.loads(data), spider=self.spider)
+        request.meta["frontier_id"] = request_id
+        request.meta["frontier_slot"] = slot  # FrontierDelayMiddleware waits for it
+        # A failed download never reaches the callback, so the lease is finished from the errback
+        request.errback = functools.partial(self.on_download_failure, request.errback, request_id)
+        self.in_progress.add(request_id)
+        self.crawling.add(request_id)
+        self.stats.inc_value("frontier/leased")
+        return request
+
+    def on_request_done(self, request):
+        request_id = request.meta.get("frontier_id")
+        if request_id in self.crawling:
+            self.crawling.discard(request_id)
+            self.finish_when_stored(request_id)
+
+    def on_item_yielded(self, request, item):
+        request_id = request.meta.get("frontier_id")
+        if request_id in self.in_progress:
+            self.item_requests[id(item)] = request_id
+            self.unstored[request_id] = self.unstored.get(request_id, 0) + 1
+
+    def on_items_stored(self, items, lost):
+        for item in items:
+            self.item_settled(item)
+        for item, error in lost:
+            self.item_settled(item, error)
+
+    def on_item_dropped(self, item, response, exception, spider):
+        self.item_settled(item)
+
+    def on_item_error(self, item, response, spider, failure):
+        self.item_settled(item, str(failure.value))
+
+    def on_item_scraped(self, item, response, spider):
+        self.item_settled(item)
+
+    def item_settled(self, item, error=None):
+        request_id = self.item_requests.pop(id(item), None)
+        if request_id not in self.in_progress:
+            return
+        self.unstored[request_id] -= 1
+        if error:
+            self.errors[request_id] = error
+        self.finish_when_stored(request_id)
+
+    def finish_when_stored(self, request_id):
+        # Done once the callback has finished and none of its items can still be lost
+        if request_id in self.crawling or self.unstored.get(request_id):
+            return
+        error = self.errors.get(request_id)
+        self.finish(request_id, FAILED if error else DONE, error)
+
+    def on_download_failure(self, errback, request_id, failure):
+        # IgnoreRequest (304 Not Modified, HTTP errors, robots.txt) is a handled request, not a failure
+        state = DONE if failure.check(IgnoreRequest) else FAILED
+        self.finish(request_id, state, str(failure.value))
+        if errback:
+            return errback(failure)
+        return failure  # so Scrapy still logs the download error as usual
+
+    def finish(self, request_id, state, error=None):
+        if request_id not in self.in_progress:
+            return
+        # The requests its callback yielded must be in the frontier before it counts as done,
+        # or a crash right after would lose them
+        self.flush()
+        self.frontier.finish(request_id, state, error)
+        self.in_progress.discard(request_id)
+        self.crawling.discard(request_id)
+        self.unstored.pop(request_id, None)
+        self.errors.pop(request_id, None)
+        self.stats.inc_value(f"frontier/{state}")
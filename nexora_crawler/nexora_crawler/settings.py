@@ -16,6 +16,9 @@ NEWSPIDER_MODULE = "nexora_crawler.spiders"
 ADDONS = {}
 
 # ENABLE PLAYWRIGHT
+# The Playwright handler only starts a browser for requests with meta['playwright'] = True.
+# Everything else (static pages, PDFs) goes through Scrapy's normal HTTP downloader.
+# See PlaywrightRoutingMiddleware below for how requests are routed.
 DOWNLOAD_HANDLERS = {
     "http": "scrapy_playwright.handler.ScrapyPlaywrightDownloadHandler",
     "https": "scrapy_playwright.handler.ScrapyPlaywrightDownloadHandler",
@@ -32,10 +35,20 @@ TWISTED_REACTOR = "twisted.internet.asyncioreactor.AsyncioSelectorReactor"
 ROBOTSTXT_OBEY = True
 
 # Concurrency and throttling settings
+# With the adaptive throttle on, these are only the starting values for each domain.
 #CONCURRENT_REQUESTS = 16
 CONCURRENT_REQUESTS_PER_DOMAIN = 1
 DOWNLOAD_DELAY = 1
 
+# Adaptive throttle: tune each domain's delay and concurrency from latency,
+# errors, 429/503 responses, Retry-After headers and the robots.txt Crawl-delay.
+# The current values show up in the stats as adaptive_throttle/<domain>/delay and /concurrency.
+ADAPTIVE_THROTTLE_ENABLED = True
+ADAPTIVE_THROTTLE_MIN_DELAY = 0.0
+ADAPTIVE_THROTTLE_MAX_DELAY = 60.0
+ADAPTIVE_THROTTLE_MAX_CONCURRENCY = 8
+ADAPTIVE_THROTTLE_TARGET_LATENCY = 1.0
+
 # Disable cookies (enabled by default)
 #COOKIES_ENABLED = False
 
@@ -48,23 +61,93 @@ DOWNLOAD_DELAY = 1
 #    "Accept-Language": "en",
 #}
 
+# Incremental crawl: remember ETag, Last-Modified and a content hash per URL,
+# send conditional requests, and skip pages whose content hasn't changed.
+INCREMENTAL_CRAWL_ENABLED = True
+
+# Seen-URL dedup with a Bloom filter (nexora_crawler/dupefilters.py) instead of a set
+# of every fingerprint, so memory stays flat on crawls with millions of URLs.
+# It is sized for BLOOM_CAPACITY URLs at a BLOOM_ERROR_RATE chance of skipping a new one.
+# Run with -s JOBDIR=crawls/<name> to keep it and the request queue on disk across restarts.
+DUPEFILTER_CLASS = "nexora_crawler.dupefilters.BloomDupeFilter"
+BLOOM_CAPACITY = 10_000_000
+BLOOM_ERROR_RATE = 1e-6
+
+# Distributed crawling: crawl_workers.py runs a spider in several worker processes
+# (on one or more machines) that share one request queue and seen-URL set, the
+# "frontier" (nexora_crawler/frontier.py), instead of each keeping its own:
+#   python crawl_workers.py site_spider --workers 4 -a start_urls=https://docs.example.com/
+# It sets SCHEDULER = "nexora_crawler.scheduler.SharedScheduler" for the workers, and
+# the Bloom dupefilter above is not used then (the frontier knows every URL seen).
+# FRONTIER_URI is "mongodb" (the MONGO_URI database) or sqlite:///crawls/frontier.sqlite
+# for workers on one machine.
+FRONTIER_URI = "mongodb"
+# Seconds between two requests to the same domain, across all the workers together
+FRONTIER_DOMAIN_DELAY = 1.0
+# A worker books a domain's download slot at most this far ahead and waits for it
+FRONTIER_MAX_WAIT = 5.0
+# A request leased by a worker that died goes to another one after FRONTIER_LEASE_SECONDS,
+# and is given up (state "failed") after FRONTIER_MAX_ATTEMPTS leases
+FRONTIER_LEASE_SECONDS = 300
+FRONTIER_MAX_ATTEMPTS = 3
+# Each worker holds at most CONCURRENT_REQUESTS requests it is still crawling, and a
+# request only counts as done once its items are in Mongo (or were dropped)
+
 # Enable or disable spider middlewares
 # See https://docs.scrapy.org/en/latest/topics/spider-middleware.html
-#SPIDER_MIDDLEWARES = {
-#    "nexora_crawler.middlewares.NexoraCrawlerSpiderMiddleware": 543,
-#}
+SPIDER_MIDDLEWARES = {
+    "nexora_crawler.middlewares.IncrementalSpiderMiddleware": 543,
+    "nexora_crawler.middlewares.PlaywrightPageMiddleware": 544,
+    # Only with SharedScheduler; closest to the engine, so it sees the final output
+    "nexora_crawler.middlewares.FrontierAckMiddleware": 10,
+}
 
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
-#DOWNLOADER_MIDDLEWARES = {
-#    "nexora_crawler.middlewares.NexoraCrawlerDownloaderMiddleware": 543,
-#}
+DOWNLOADER_MIDDLEWARES = {
+    # Only with SharedScheduler: waits for the domain slot booked in the shared frontier
+    "nexora_crawler.middlewares.FrontierDelayMiddleware": 50,
+    "nexora_crawler.middlewares.IncrementalDownloaderMiddleware": 543,
+    "nexora_crawler.middlewares.PlaywrightRoutingMiddleware": 545,
+    "nexora_crawler.middlewares.PlaywrightResourceMiddleware": 546,
+    # Above RetryMiddleware (550) so it sees 429/503 responses before they are retried
+    "nexora_crawler.middlewares.AdaptiveThrottleMiddleware": 560,
+}
+
+# Plain HTTP pages with less visible text than this, but with scripts, are
+# treated as JavaScript shells and fetched again with Playwright.
+PLAYWRIGHT_DETECT_JS_SHELL = True
+PLAYWRIGHT_JS_SHELL_MIN_TEXT = 200
+
+# What the browser doesn't need to load to give us the page text.
+# A spider can override the resource types with a `playwright_blocked_resources` attribute.
+PLAYWRIGHT_BLOCKED_RESOURCE_TYPES = ["image", "font", "media"]
+PLAYWRIGHT_BLOCKED_DOMAINS = [
+    "google-analytics.com",
+    "googletagmanager.com",
+    "doubleclick.net",
+    "facebook.net",
+    "hotjar.com",
+    "segment.io",
+]
+# Rough average sizes (bytes) used for the playwright/bytes_saved_estimate stat
+PLAYWRIGHT_BLOCKED_BYTES_ESTIMATE = {"image": 50000, "font": 30000, "media": 500000, "script": 40000}
+
+# Limit how many browser contexts (and pages in each) one domain can use at once
+PLAYWRIGHT_CONTEXTS_PER_DOMAIN = 2
+PLAYWRIGHT_MAX_PAGES_PER_CONTEXT = 4
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
-#EXTENSIONS = {
-#    "scrapy.extensions.telnet.TelnetConsole": None,
-#}
+EXTENSIONS = {
+    # Per-stage latency histograms (pipelines, HTTP vs Playwright downloads) in the crawl stats
+    'nexora_crawler.extensions.StageTimingExtension': 500,
+}
+METRICS_ENABLED = True
+# Also write the timings to a file when the spider closes: Prometheus text (.prom/.txt) or JSON
+#METRICS_EXPORT_PATH = "crawl_metrics.prom"
+# Profile the crawl with cProfile and save it here (inspect with `python -m pstats`)
+#PROFILE_OUTPUT = "crawl.prof"
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
@@ -77,12 +160,39 @@ ITEM_PIPELINES = {
     # Step 2: Parse the file (Higher number = Runs after Step 1)
     'nexora_crawler.pipelines.PdfParsingPipeline': 300,
 
-    # Step 3: MongoDB Pipeline
+    # Step 3: Extract the main text of HTML pages (item['html_body'])
+    'nexora_crawler.pipelines.ContentExtractionPipeline': 320,
+
+    # Step 4: Skip pages that haven't changed since the last crawl
+    'nexora_crawler.pipelines.IncrementalPipeline': 350,
+
+    # Step 5: MongoDB Pipeline
     'nexora_crawler.pipelines.MongoPipeline': 400,
 }
 
+# PdfParsingPipeline runs PyMuPDF in a pool of worker processes.
+# PDF_WORKERS = 0 means one worker per CPU core. Files over PDF_MAX_BYTES are skipped,
+# only the first PDF_MAX_PAGES pages are read and each file gets PDF_TIMEOUT seconds.
+PDF_WORKERS = 0
+PDF_TIMEOUT = 60
+PDF_MAX_PAGES = 500
+PDF_MAX_BYTES = 50 * 1024 * 1024
+
+# MongoPipeline buffers items and upserts them in batches.
+# A batch is written when it reaches MONGO_BULK_SIZE items or every MONGO_FLUSH_INTERVAL seconds.
+MONGO_BULK_SIZE = 500
+MONGO_FLUSH_INTERVAL = 5.0
+# A batch that fails (connection lost, upserts racing another worker) is tried again
+# this many times; whatever still fails is logged with its URL.
+MONGO_WRITE_RETRIES = 3
+
 # Where to save the files? (We create a "downloads" folder in your project)
-FILES_STORE = os.path.join(os.getcwd(), 'downloads')
+# The path is built from this file's location, so it doesn't depend on where Scrapy is started from.
+FILES_STORE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'downloads')
+
+# PDFs that arrive with their bytes (item['file_body']) are parsed from memory.
+# Set this to True to also keep a copy in FILES_STORE/full/<sha1>.pdf.
+PDF_STORE_FILES = False
 
 # Allow Scrapy to follow redirects (useful for file download links)
 MEDIA_ALLOW_REDIRECTS = True
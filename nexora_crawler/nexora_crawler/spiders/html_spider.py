@@ -1,6 +1,5 @@
 import scrapy
 from nexora_crawler.items import NexoraCrawlerItem
-from scrapy_playwright.page import PageMethod
 
 class HtmlSpider(scrapy.Spider):
     name = "html_spider"
@@ -10,26 +9,15 @@ class HtmlSpider(scrapy.Spider):
         # or a simple text page.
         url = "https://quotes.toscrape.com/"
         
-        yield scrapy.Request(
-            url,
-            meta=dict(
-                playwright=True,
-                playwright_include_page=True, 
-            )
-        )
+        # This page is static, so plain HTTP is enough.
+        # Add meta=dict(playwright=True) for pages that need a browser to render.
+        yield scrapy.Request(url)
 
     async def parse(self, response):
-        # Extract text from specific elements (p, div, etc.)
-        # We join them together to make one big block of text
-        
-        # This selector gets all text inside <span> tags with class "text"
-        quotes = response.css('span.text::text').getall()
-        
-        full_text = "\n".join(quotes)
-        
-        # Create the item
+        # No site-specific selectors: ContentExtractionPipeline finds the main content
+        # of any page (and turns it into text_content, which is what the Indexer needs)
         item = NexoraCrawlerItem()
         item['source_url'] = response.url
-        item['text_content'] = full_text # <--- This is what the Indexer needs!
-        
-        yield item
\ No newline at end of file
+        item['html_body'] = response.text
+
+        yield item
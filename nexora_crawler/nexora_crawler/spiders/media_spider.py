@@ -16,8 +16,18 @@ class MediaSpider(scrapy.Spider):
         # We create an Item to tell Scrapy "Download this!"
         item = NexoraCrawlerItem()
         
-        # We give it the URL of the file we found
-        item['file_urls'] = [response.url]
         item['source_url'] = response.url
+
+        if self.is_pdf(response):
+            # We already have the PDF, so we hand the bytes straight to the parser
+            # instead of letting FilesPipeline download it a second time
+            item['file_body'] = response.body
+        else:
+            # We give it the URL of the file we found
+            item['file_urls'] = [response.url]
         
-        yield item
\ No newline at end of file
+        yield item
+
+    def is_pdf(self, response):
+        content_type = response.headers.get('Content-Type', b'').decode('latin-1').lower()
+        return 'application/pdf' in content_type or response.body[:5] == b'%PDF-'
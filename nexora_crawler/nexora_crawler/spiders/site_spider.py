@@ -0,0 +1,109 @@
+import scrapy
+from scrapy.linkextractors import IGNORED_EXTENSIONS, LinkExtractor
+from scrapy.spiders import SitemapSpider
+from urllib.parse import urlparse
+
+from nexora_crawler.items import NexoraCrawlerItem
+
+
+def split_arg(value):
+    # Spider arguments arrive as strings: "a,b,c" -> ["a", "b", "c"]
+    if not value:
+        return []
+    if isinstance(value, str):
+        return [part.strip() for part in value.split(",") if part.strip()]
+    return list(value)
+
+
+class SiteSpider(SitemapSpider):
+    # Crawls a whole site: every HTML page and PDF reachable from the start URLs
+    # and/or listed in the sitemaps, as long as it matches the allow/deny rules.
+    #
+    #   scrapy crawl site_spider -a start_urls=https://docs.example.com/ \
+    #       -a sitemap_urls=https://docs.example.com/robots.txt \
+    #       -a allow=/docs/ -a deny=/blog/,/changelog/ \
+    #       -s JOBDIR=crawls/docs-example
+    #
+    # Arguments (comma-separated lists, allow/deny are regular expressions):
+    #   start_urls       pages to start following links from
+    #   sitemap_urls     sitemap.xml, sitemap index or robots.txt URLs
+    #   allowed_domains  defaults to the domains of the start and sitemap URLs
+    #                    (enforced by Scrapy's OffsiteMiddleware on every request)
+    #   allow, deny      URL patterns to keep / skip (deny wins)
+    #   follow_links     "0" to only fetch what the sitemaps list
+    #
+    # JOBDIR keeps the frontier (the scheduler's request queues) and the seen-URL
+    # Bloom filter on disk: stop the crawl with Ctrl-C once, and the same command
+    # carries on where it stopped. Delete the folder to crawl from scratch.
+    name = "site_spider"
+
+    custom_settings = {
+        # Breadth-first: the pages near the start URLs are usually the important ones,
+        # and a FIFO frontier doesn't pile up a deep backlog from one corner of the site
+        "DEPTH_PRIORITY": 1,
+        "SCHEDULER_DISK_QUEUE": "scrapy.squeues.PickleFifoDiskQueue",
+        "SCHEDULER_MEMORY_QUEUE": "scrapy.squeues.FifoMemoryQueue",
+    }
+
+    def __init__(self, start_urls=None, sitemap_urls=None, allowed_domains=None, allow=None, deny=None,
+                 follow_links="1", *args, **kwargs):
+        self.start_urls = split_arg(start_urls)
+        self.sitemap_urls = split_arg(sitemap_urls)
+        if not self.start_urls and not self.sitemap_urls:
+            raise ValueError("site_spider needs start_urls and/or sitemap_urls (-a start_urls=https://...)")
+
+        self.allowed_domains = split_arg(allowed_domains) or sorted(
+            {urlparse(url).hostname for url in self.start_urls + self.sitemap_urls}
+        )
+        self.follow_links = str(follow_links) != "0"
+        self.link_extractor = LinkExtractor(
+            allow=split_arg(allow),
+            deny=split_arg(deny),
+            # Scrapy skips .pdf links by default; PDFs are half of what we are here for
+            deny_extensions=[ext for ext in IGNORED_EXTENSIONS if ext != "pdf"],
+        )
+        super().__init__(*args, **kwargs)
+
+    async def start(self):
+        async for request in super().start():
+            yield request
+        for url in self.start_urls:
+            yield scrapy.Request(url, callback=self.parse, dont_filter=True, meta={"dont_revalidate": True})
+
+    def sitemap_filter(self, entries):
+        # The allow/deny rules apply to pages, not to the sitemaps that list them
+        if getattr(entries, "type", None) == "sitemapindex":
+            yield from entries
+            return
+        for entry in entries:
+            if self.link_extractor.matches(entry["loc"]):
+                yield entry
+
+    def parse(self, response):
+        item = NexoraCrawlerItem()
+        item['source_url'] = response.url
+
+        if self.is_pdf(response):
+            # Parsed from memory by PdfParsingPipeline, like in media_spider
+            item['file_body'] = response.body
+            yield item
+            return
+
+        if not isinstance(response, scrapy.http.TextResponse):
+            return  # images, archives and other files that slipped through
+
+        # ContentExtractionPipeline keeps the main content, without menus and footers
+        item['html_body'] = response.text
+        yield item
+
+        if self.follow_links:
+            for link in self.link_extractor.extract_links(response):
+                # A page answered with 304 Not Modified is never parsed, so its links would
+                # never be followed. Pages are always fetched (IncrementalPipeline still skips
+                # unchanged ones by content hash); only PDFs, which link nowhere, are revalidated.
+                is_document = urlparse(link.url).path.lower().endswith(".pdf")
+                yield scrapy.Request(link.url, callback=self.parse, meta={"dont_revalidate": not is_document})
+
+    def is_pdf(self, response):
+        content_type = response.headers.get('Content-Type', b'').decode('latin-1').lower()
+        return 'application/pdf' in content_type or response.body[:5] == b'%PDF-'
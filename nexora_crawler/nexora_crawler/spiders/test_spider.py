@@ -5,6 +5,9 @@ from scrapy_playwright.page import PageMethod
 class TestSpider(scrapy.Spider):
     name = "test_spider"
 
+    # We only need the text, so the browser can skip these as well
+    playwright_blocked_resources = ["image", "font", "media", "stylesheet"]
+
     def start_requests(self):
         # TEST: Print a variable from .env (Check your console logs when running)
         print(f"Checking .env: API Key placeholder is -> {os.getenv('GOOGLE_API_KEY')}")
@@ -23,6 +26,7 @@ class TestSpider(scrapy.Spider):
 
     async def parse(self, response):
         # This function runs when the website data is downloaded.
+        # The Playwright page is closed for us by PlaywrightPageMiddleware afterwards.
         
         # Let's extract all the quote texts to verify it worked.
         # This CSS selector finds elements with class "text"
@@ -0,0 +1,59 @@
+import asyncio
+import time
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# Local stand-ins for Gemini, used with MODEL_BACKEND=stub (see models.py)
+
+
+class StubEmbeddings(DeterministicFakeEmbedding):
+    # The same text always gets the same vector; each call costs `latency` seconds
+    latency: float = 0.0
+    calls: int = 0
+
+    def embed_documents(self, texts, task_type=None):
+        self.calls += 1
+        time.sleep(self.latency)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        self.calls += 1
+        time.sleep(self.latency)
+        return super().embed_query(text)
+
+
+class StubChatModel(BaseChatModel):
+    # Answers with the start of the context it was given, one word per token
+    latency: float = 0.0
+
+    @property
+    def _llm_type(self):
+        return "nexora-stub"
+
+    def answer_words(self, messages):
+        prompt = messages[-1].content if messages else ""
+        context = prompt.split("<context>")[-1].split("</context>")[0].split()
+        return ["Based", "on", "the", "context:"] + context[:40]
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        words = self.answer_words(messages)
+        time.sleep(self.latency * len(words))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=" ".join(words)))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        for number, word in enumerate(self.answer_words(messages)):
+            time.sleep(self.latency)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word if number == 0 else " " + word))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        for number, word in enumerate(self.answer_words(messages)):
+            await asyncio.sleep(self.latency)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word if number == 0 else " " + word))
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        words = self.answer_words(messages)
+        await asyncio.sleep(self.latency * len(words))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=" ".join(words)))])
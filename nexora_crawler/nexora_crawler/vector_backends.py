@@ -0,0 +1,85 @@
+import os
+
+from pymongo.errors import PyMongoError
+
+from nexora_crawler.bm25 import DEFAULT_INDEX_PATH, BM25Index
+
+# Where the passages are searched. Choose with VECTOR_BACKEND in .env:
+#   atlas - MongoDB Atlas Vector Search on the passages collection (default)
+#   local - LocalVectorStore, an in-process index kept in LOCAL_VECTOR_PATH
+#           and synced from the passages collection
+#
+# And how: RETRIEVAL_MODE=hybrid (default) also searches the BM25 keyword index
+# in BM25_INDEX_PATH and fuses both result lists; RETRIEVAL_MODE=vector doesn't.
+#
+# How the vectors are stored and quantized: VECTOR_STORAGE and VECTOR_QUANTIZATION,
+# see vector_codec.py. The local store rescores the best VECTOR_RESCORE_FACTOR * k
+# quantized candidates with the full vectors (0 = its default for the quantization).
+#
+# The LangChain modules are imported when a store is built, not when this module is.
+
+DEFAULT_LOCAL_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "vector_store")
+
+
+def vector_backend():
+    return os.getenv("VECTOR_BACKEND", "atlas").lower()
+
+
+def build_vector_store(passages, embeddings):
+    backend = vector_backend()
+
+    if backend == "atlas":
+        from langchain_mongodb import MongoDBAtlasVectorSearch
+
+        return MongoDBAtlasVectorSearch(
+            collection=passages,
+            embedding=embeddings,
+            index_name="vector_index",
+            text_key="text"  # We search passages (chunks of the crawled documents), not whole documents
+        )
+
+    if backend == "local":
+        # Imported here so the Atlas setup never loads the local index (numpy is needed
+        # either way: vector_codec packs the vectors with it)
+        from nexora_crawler.local_vector_store import LocalVectorStore
+        from nexora_crawler.vector_codec import quantization
+
+        store = LocalVectorStore(
+            os.getenv("LOCAL_VECTOR_PATH", DEFAULT_LOCAL_PATH),
+            embeddings,
+            quantization=quantization(),
+            rescore_factor=int(os.getenv("VECTOR_RESCORE_FACTOR", "0")),
+        )
+        sync_local_store(store, passages)
+        return store
+
+    raise ValueError(f"Unknown VECTOR_BACKEND '{backend}' (use 'atlas' or 'local')")
+
+
+def sync_local_store(store, passages):
+    # Without a database connection we still search whatever was synced last time
+    try:
+        added, removed = store.sync_from_mongo(passages)
+        print(f"Local vector store synced: {added} added, {removed} removed")
+    except PyMongoError as e:
+        print(f"Local vector store not synced ({type(e).__name__}), using the copy on disk")
+
+
+def open_bm25_index():
+    return BM25Index(os.getenv("BM25_INDEX_PATH", DEFAULT_INDEX_PATH))
+
+
+def build_retriever(passages, vector_store, k=3):
+    if os.getenv("RETRIEVAL_MODE", "hybrid").lower() == "vector":
+        return vector_store.as_retriever(search_kwargs={"k": k})
+
+    from nexora_crawler.hybrid_retriever import HybridRetriever
+
+    bm25 = open_bm25_index()
+    if len(bm25) == 0:
+        # First run with an existing passages collection: build the keyword index once
+        try:
+            print(f"BM25 index built from {bm25.rebuild_from_mongo(passages)} passages")
+        except PyMongoError as e:
+            print(f"BM25 index not built ({type(e).__name__}), keyword search finds nothing yet")
+    return HybridRetriever(vector_store=vector_store, bm25=bm25, passages=passages, k=k)
@@ -0,0 +1,84 @@
+import os
+
+import numpy as np
+from bson.binary import Binary, BinaryVectorDtype
+
+# How passage vectors are stored in Mongo and compressed for searching.
+#
+# VECTOR_STORAGE (in .env):
+#   float32 - packed little-endian float32 in a BSON binary vector (default): 768 dims
+#             take 3 KB instead of the ~7 KB of a BSON array of doubles (each element
+#             is a double plus a type byte and its index as a string key)
+#   array   - a plain array of doubles, as before
+# Both are read back the same way (decode_vector), so old passages keep working
+# and `python indexer.py --compact-vectors` converts them in place.
+# Atlas Vector Search indexes binary float32 vectors like arrays.
+#
+# VECTOR_QUANTIZATION: none (default), int8 or binary. The search candidates are
+# found on the quantized vectors and only the best ones are rescored with the full
+# float32 vectors:
+#   local backend - LocalVectorStore keeps int8 (4x smaller) or 1-bit (32x smaller)
+#                   codes next to its float32 file; see local_vector_store.py
+#   atlas backend - set the same "quantization" in the vector_index definition
+#                   (type "vector", path "embedding", numDimensions 768,
+#                   similarity "cosine", quantization "scalar" or "binary"); Atlas
+#                   quantizes the stored float32 vectors itself and rescores
+#                   binary results with them
+#
+# The vectors are only ever needed for indexing; everything that reads passages for
+# display or prompts uses WITHOUT_VECTORS as its projection.
+
+VECTOR_FIELD = "embedding"
+WITHOUT_VECTORS = {VECTOR_FIELD: 0}
+
+
+def storage_format():
+    return os.getenv("VECTOR_STORAGE", "float32").lower()
+
+
+def quantization():
+    mode = os.getenv("VECTOR_QUANTIZATION", "none").lower()
+    if mode not in ("none", "int8", "binary"):
+        raise ValueError(f"Unknown VECTOR_QUANTIZATION '{mode}' (use 'none', 'int8' or 'binary')")
+    return mode
+
+
+def encode_vector(vector, storage=None):
+    if (storage or storage_format()) == "array":
+        return [float(value) for value in vector]
+    return Binary.from_vector(np.asarray(vector, dtype=np.float32).tolist(), BinaryVectorDtype.FLOAT32)
+
+
+def decode_vector(value):
+    # A float32 numpy array from either storage format
+    if isinstance(value, Binary) and value.subtype == 9:
+        # The first two bytes are the dtype and padding, then the packed float32 values
+        if value[0] == BinaryVectorDtype.FLOAT32.value[0]:
+            return np.frombuffer(value, dtype="<f4", offset=2)
+        return np.asarray(value.as_vector().data, dtype=np.float32)
+    return np.asarray(value, dtype=np.float32)
+
+
+# --- quantized codes (used by LocalVectorStore) ------------------------------
+
+def quantize_int8(matrix):
+    # Each row scaled so its largest component is +-127. Returns (codes, scales) where
+    # row ~= codes * scale, so a dot product is (codes @ query) * scale.
+    peaks = np.abs(matrix).max(axis=1)
+    peaks[peaks == 0] = 1
+    codes = np.round(matrix / peaks[:, None] * 127).astype(np.int8)
+    return codes, (peaks / 127).astype(np.float32)
+
+
+def quantize_binary(matrix):
+    # One sign bit per dimension, 8 dimensions to a byte
+    return np.packbits(matrix > 0, axis=1)
+
+
+# Set bits in every byte value, to count differing bits between packed codes
+POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+
+def hamming_similarity(codes, query_bits, dim):
+    # Number of dimensions whose sign matches the query's
+    return dim - POPCOUNT[np.bitwise_xor(codes, query_bits)].sum(axis=1, dtype=np.int32)
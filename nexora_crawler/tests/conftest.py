@@ -0,0 +1,46 @@
+import contextlib
+import io
+
+import pytest
+
+import fixtures
+
+# The tests run offline like the benchmarks: stub models, a local vector store,
+# caches in a temporary folder and mongomock for every MongoClient. This has to
+# happen before nexora_crawler.runtime is first used.
+fixtures.offline_environment(fixtures.work_directory())
+fixtures.use_mongomock()
+
+DOCUMENTS = {
+    "https://docs.example.com/retries.html": (
+        "Retries. The client retries a request up to five times when the server answers "
+        "with 503 or 429. Each retry waits twice as long as the one before.\n\n"
+        "Set retry_limit to 0 to turn retries off."
+    ),
+    "https://docs.example.com/tokens.html": (
+        "Tokens. Every API call needs a session token. A token expires after one hour "
+        "and a new one is issued by the login endpoint.\n\n"
+        "Error E-4011 means the token has expired."
+    ),
+    "https://docs.example.com/install.html": (
+        "Installation. Install the client with pip and set the NEXORA_URL environment "
+        "variable to the address of your server.\n\n"
+        "The client needs Python 3.9 or newer."
+    ),
+}
+
+
+@pytest.fixture(scope="session")
+def indexed_runtime():
+    # The documents above, chunked, embedded and searchable as after indexer.py
+    import indexer
+    from nexora_crawler.pipelines import content_hash
+    from nexora_crawler.runtime import runtime
+
+    runtime.collection.insert_many([
+        {"source_url": url, "text_content": text, "content_hash": content_hash(text), "index_status": "pending"}
+        for url, text in DOCUMENTS.items()
+    ])
+    with contextlib.redirect_stdout(io.StringIO()):
+        indexer.run_indexing()
+    return runtime
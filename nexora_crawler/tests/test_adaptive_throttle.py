@@ -0,0 +1,78 @@
+from scrapy import Request, Spider, signals
+from scrapy.core.downloader import Slot
+from scrapy.http import TextResponse
+from scrapy.utils.test import get_crawler
+
+from nexora_crawler.middlewares import AdaptiveThrottleMiddleware
+
+ROBOTS = b"User-agent: *\nCrawl-delay: 5\nDisallow: /private/\n"
+
+
+class ExampleSpider(Spider):
+    name = "example"
+
+
+class FakeDownloader:
+    def __init__(self):
+        self.slots = {}
+
+
+class FakeEngine:
+    def __init__(self):
+        self.downloader = FakeDownloader()
+
+
+def make_middleware(**settings):
+    crawler = get_crawler(ExampleSpider, {"ADAPTIVE_THROTTLE_ENABLED": True, **settings})
+    crawler.engine = FakeEngine()
+    return crawler, AdaptiveThrottleMiddleware.from_crawler(crawler)
+
+
+def request(url):
+    return Request(url, meta={"download_slot": "docs.example.com"})
+
+
+def read_robots(middleware):
+    robots = request("https://docs.example.com/robots.txt")
+    middleware.process_response(robots, TextResponse(robots.url, body=ROBOTS, request=robots), None)
+
+
+def test_crawl_delay_applies_to_the_slot_right_away():
+    crawler, middleware = make_middleware()
+    slot = crawler.engine.downloader.slots["docs.example.com"] = Slot(8, 0.0)
+
+    read_robots(middleware)
+
+    assert slot.delay == 5.0
+    assert crawler.stats.get_value("adaptive_throttle/docs.example.com/robots_delay") == 5.0
+
+
+def test_a_new_slot_starts_at_the_crawl_delay():
+    crawler, middleware = make_middleware()
+    read_robots(middleware)
+
+    # Created after robots.txt was read (or again, after the old one expired)
+    slot = crawler.engine.downloader.slots["docs.example.com"] = Slot(8, 0.0)
+    crawler.signals.send_catch_log(signals.request_reached_downloader,
+                                   request=request("https://docs.example.com/guide.html"), spider=None)
+    assert slot.delay == 5.0
+
+    # A longer delay (a backoff) stays as it is
+    slot.delay = 12.0
+    crawler.signals.send_catch_log(signals.request_reached_downloader,
+                                   request=request("https://docs.example.com/api.html"), spider=None)
+    assert slot.delay == 12.0
+
+
+def test_fast_responses_never_go_below_the_crawl_delay():
+    crawler, middleware = make_middleware()
+    slot = crawler.engine.downloader.slots["docs.example.com"] = Slot(1, 0.0)
+    read_robots(middleware)
+
+    for _ in range(20):
+        page = request("https://docs.example.com/guide.html")
+        page.meta["download_latency"] = 0.05
+        middleware.process_response(page, TextResponse(page.url, body=b"ok", request=page), None)
+
+    assert slot.concurrency > 1  # sped up all the same
+    assert slot.delay == 5.0
@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta, timezone
+
+import mongomock
+import pytest
+
+from nexora_crawler.answer_cache import AnswerCache
+
+RETRIES = [1.0, 0.0, 0.0, 0.0]
+RETRIES_REWORDED = [0.95, 0.2, 0.0, 0.0]  # cosine 0.98
+TOKENS = [0.0, 1.0, 0.0, 0.0]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return AnswerCache(str(tmp_path / "answers.sqlite"), model_name="stub", threshold=0.92)
+
+
+def test_a_paraphrase_gets_the_earlier_answer(cache):
+    cache.store("How often are requests retried?", RETRIES, "Five times.", ["retries.html"], [])
+
+    assert cache.lookup(RETRIES_REWORDED) == ("Five times.", ["retries.html"])
+    assert cache.lookup(TOKENS) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_the_closest_question_wins(cache):
+    cache.store("retries", RETRIES, "Five times.", [], [])
+    cache.store("retries, reworded", RETRIES_REWORDED, "Up to five times.", [], [])
+    cache.store("tokens", TOKENS, "One hour.", [], [])
+
+    assert cache.lookup([0.96, 0.18, 0.0, 0.0])[0] == "Up to five times."
+    assert cache.lookup([0.1, 2.0, 0.0, 0.0])[0] == "One hour."  # the length doesn't matter
+
+
+def test_entries_survive_a_restart_and_are_evicted_beyond_max_entries(tmp_path):
+    path = str(tmp_path / "answers.sqlite")
+    cache = AnswerCache(path, model_name="stub", max_entries=2)
+    cache.store("retries", RETRIES, "Five times.", [], [])
+    cache.store("tokens", TOKENS, "One hour.", [], [])
+    cache.store("install", [0.0, 0.0, 1.0, 0.0], "With pip.", [], [])
+
+    reopened = AnswerCache(path, model_name="stub", max_entries=2)
+    assert reopened.lookup(RETRIES) is None  # the least recently used one went
+    assert reopened.lookup(TOKENS)[0] == "One hour."
+    assert reopened.lookup([0.0, 0.0, 1.0, 0.0])[0] == "With pip."
+    # Other embedding models have other vectors
+    assert AnswerCache(path, model_name="other").lookup(TOKENS) is None
+
+
+def test_answers_from_re_indexed_passages_are_dropped(cache):
+    passages = mongomock.MongoClient()["answers_test"]["passages"]
+    passages.insert_many([
+        {"_id": "doc:0", "indexed_at": datetime.now(timezone.utc) - timedelta(hours=1)},
+        {"_id": "doc:1", "indexed_at": datetime.now(timezone.utc) - timedelta(hours=1)},
+    ])
+    cache.store("retries", RETRIES, "Five times.", [], ["doc:0", "doc:1"])
+    assert cache.lookup(RETRIES, passages)[0] == "Five times."
+
+    passages.update_one({"_id": "doc:1"}, {"$set": {"indexed_at": datetime.now(timezone.utc) + timedelta(seconds=1)}})
+    assert cache.lookup(RETRIES, passages) is None
+    assert not cache.vectors
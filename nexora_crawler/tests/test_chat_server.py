@@ -0,0 +1,147 @@
+import asyncio
+import json
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+import chat_server
+from conftest import DOCUMENTS
+
+
+def with_client(test):
+    # Runs `test(client)` against a fresh app (pytest-aiohttp isn't a dependency)
+    async def main():
+        async with TestClient(TestServer(chat_server.create_app())) as client:
+            return await test(client)
+
+    return asyncio.run(main())
+
+
+def read_events(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_chat_answers_from_the_indexed_passages(indexed_runtime):
+    async def test(client):
+        response = await client.post("/chat", json={"question": "How long is a session token valid?"})
+        return response.status, await response.json()
+
+    status, data = with_client(test)
+    assert status == 200
+    assert data["answer"].startswith("Based on the context:")
+    assert data["cached"] is False
+    assert data["sources"] and set(data["sources"]) <= set(DOCUMENTS)
+    assert data["context"]["passages"] >= 1
+    assert data["timing"]["total_seconds"] >= data["timing"]["first_token_seconds"] >= 0
+
+
+def test_chat_without_a_question_is_a_bad_request(indexed_runtime):
+    async def test(client):
+        response = await client.post("/chat", json={"question": "  "})
+        return response.status, await response.json()
+
+    status, data = with_client(test)
+    assert status == 400
+    assert "question" in data["error"]
+
+
+def test_chat_stream_sends_tokens_then_done(indexed_runtime):
+    async def test(client):
+        response = await client.post("/chat/stream", json={"question": "What does error E-4011 mean?"})
+        return response.status, response.headers["Content-Type"], await response.text()
+
+    status, content_type, body = with_client(test)
+    assert status == 200
+    assert content_type == "text/event-stream"
+    events = read_events(body)
+    names = [name for name, _ in events]
+    assert names[-1] == "done"
+    assert len(names) > 2 and set(names[:-1]) == {"token"}
+    assert "".join(data for _, data in events[:-1]).startswith("Based on the context:")
+    done = events[-1][1]
+    assert done["cached"] is False
+    assert done["sources"] and set(done["sources"]) <= set(DOCUMENTS)
+
+
+def test_llm_limiter_refuses_with_retry_after_when_too_many_wait(indexed_runtime, monkeypatch):
+    # One LLM call at a time and one request waiting for it; a third request is refused
+    monkeypatch.setattr(chat_server, "MAX_LLM_CALLS", 1)
+    monkeypatch.setattr(chat_server, "MAX_WAITING", 1)
+
+    async def test(client):
+        limiter = client.app["llm_limiter"]
+        await limiter.semaphore.acquire()  # the LLM is busy
+        waiting = asyncio.create_task(client.post("/chat", json={"question": "How do I install the client?"}))
+        for _ in range(500):
+            if limiter.waiting:
+                break
+            await asyncio.sleep(0.01)
+        refused = await client.post("/chat", json={"question": "How do I turn retries off?"})
+        refused_status, retry_after, error = refused.status, refused.headers.get("Retry-After"), await refused.json()
+
+        limiter.semaphore.release()
+        answered = await waiting
+        return refused_status, retry_after, error, answered.status, limiter.rejected
+
+    refused_status, retry_after, error, answered_status, rejected = with_client(test)
+    assert refused_status == 503
+    assert retry_after == "1"
+    assert "retry" in error["error"]
+    assert answered_status == 200
+    assert rejected == 1
+
+
+class RecordingEmbeddings:
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+
+    def embed_queries(self, texts):
+        self.batches.append(list(texts))
+        if self.fail:
+            raise RuntimeError("embedding API down")
+        return [[float(len(text))] for text in texts]
+
+
+def run_embedder(embeddings, questions, **options):
+    async def main():
+        embedder = chat_server.MicroBatchEmbedder(embeddings, **options)
+        batcher = asyncio.create_task(embedder.run())
+        try:
+            return embedder, await asyncio.gather(*(embedder.embed(q) for q in questions), return_exceptions=True)
+        finally:
+            batcher.cancel()
+
+    return asyncio.run(main())
+
+
+def test_micro_batch_embedder_embeds_concurrent_questions_together():
+    embeddings = RecordingEmbeddings()
+    questions = [f"question {'x' * n}" for n in range(6)]
+    embedder, vectors = run_embedder(embeddings, questions, max_batch=4, max_wait=0.05)
+
+    # Full batches are sent right away, the rest together after max_wait
+    assert embeddings.batches == [questions[:4], questions[4:]]
+    assert vectors == [[float(len(q))] for q in questions]
+    assert (embedder.batches, embedder.queries) == (2, 6)
+
+
+def test_micro_batch_embedder_fails_every_question_of_a_failed_batch():
+    embeddings = RecordingEmbeddings(fail=True)
+    embedder, results = run_embedder(embeddings, ["a", "b", "c"], max_batch=8, max_wait=0.05)
+
+    assert len(embeddings.batches) == 1
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+@pytest.mark.parametrize("body", [b"not json", b'["a list"]', b'{"question": 42}'])
+def test_chat_rejects_malformed_bodies(indexed_runtime, body):
+    async def test(client):
+        response = await client.post("/chat", data=body, headers={"Content-Type": "application/json"})
+        return response.status
+
+    assert with_client(test) == 400
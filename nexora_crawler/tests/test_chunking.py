@@ -0,0 +1,55 @@
+from nexora_crawler.chunking import PAGE_BREAK, estimate_tokens, split_into_passages
+
+
+def paragraphs(count, words=40):
+    return [f"Paragraph {n}. " + " ".join(f"word{n}_{i}" for i in range(words)) + "." for n in range(count)]
+
+
+def test_short_text_is_one_passage():
+    passages = split_into_passages("A short page.\n\nWith two paragraphs.")
+    assert passages == [{"text": "A short page.\n\nWith two paragraphs.", "page_start": 1, "page_end": 1}]
+
+
+def test_blank_text_has_no_passages():
+    assert split_into_passages("") == []
+    assert split_into_passages("\n\n  \n\n") == []
+
+
+def test_passages_fit_the_budget_and_overlap():
+    parts = paragraphs(30, words=8)  # ~20 tokens each, so whole paragraphs carry over
+    passages = split_into_passages("\n\n".join(parts), max_tokens=200, overlap_tokens=50)
+
+    assert len(passages) > 1
+    assert all(estimate_tokens(p["text"]) <= 200 for p in passages)
+    # Every paragraph is in some passage, and each passage repeats the end of the one before
+    for part in parts:
+        assert any(part in p["text"] for p in passages)
+    for previous, passage in zip(passages, passages[1:]):
+        assert previous["text"].split("\n\n")[-1] in passage["text"]
+
+
+def test_long_paragraph_is_split_along_sentences():
+    sentences = [f"Sentence number {n} says something about retries." for n in range(60)]
+    passages = split_into_passages(" ".join(sentences), max_tokens=100, overlap_tokens=0)
+
+    assert len(passages) > 1
+    assert all(estimate_tokens(p["text"]) <= 100 for p in passages)
+    pieces = " ".join(p["text"] for p in passages)
+    for sentence in sentences:
+        assert sentence in pieces
+
+
+def test_unbroken_token_is_cut_at_a_fixed_width():
+    passages = split_into_passages("x" * 5000, max_tokens=100, overlap_tokens=0)
+    assert "".join(p["text"] for p in passages) == "x" * 5000
+    assert all(len(p["text"]) <= 400 for p in passages)
+
+
+def test_pdf_pages_are_tracked():
+    pages = ["\n\n".join(paragraphs(3, words=20)) for _ in range(4)]
+    passages = split_into_passages(PAGE_BREAK.join(pages), max_tokens=150, overlap_tokens=0)
+
+    assert passages[0]["page_start"] == 1
+    assert passages[-1]["page_end"] == 4
+    assert all(p["page_start"] <= p["page_end"] for p in passages)
+    assert [p["page_start"] for p in passages] == sorted(p["page_start"] for p in passages)
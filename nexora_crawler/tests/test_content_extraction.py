@@ -0,0 +1,110 @@
+from scrapy import Spider
+from scrapy.utils.test import get_crawler
+
+from nexora_crawler.content_extraction import extract_main_content
+from nexora_crawler.items import NexoraCrawlerItem
+from nexora_crawler.pipelines import ContentExtractionPipeline
+
+PAGE = """<!DOCTYPE html>
+<html><head><title>Retries | Docs</title><style>body { color: red }</style></head>
+<body>
+  <header class="site-header"><a href="/">Home</a> <a href="/docs">Docs</a></header>
+  <nav><ul><li><a href="/a">Getting started</a></li><li><a href="/b">API</a></li></ul></nav>
+  <div id="cookie-banner">We use cookies. <button>OK</button></div>
+  <main>
+    <h1>Retries</h1>
+    <p>The client retries a request up to <b>five</b> times.</p>
+    <h2>Settings</h2>
+    <ul><li>retry_limit: how often</li><li>retry_delay: how long to wait</li></ul>
+    <table><tr><th>Code</th><th>Retried</th></tr><tr><td>503</td><td>yes</td></tr></table>
+    <pre>client = Client(
+    retry_limit=3)</pre>
+    <div class="share-buttons"><a href="#">Tweet</a></div>
+    <p style="display: none">Hidden text</p>
+    <script>track()</script>
+  </main>
+  <aside>Related: <a href="/c">Timeouts</a></aside>
+  <footer>Copyright 2024</footer>
+</body></html>"""
+
+
+def test_keeps_the_main_content_with_its_structure():
+    assert extract_main_content(PAGE).split("\n\n") == [
+        "# Retries",
+        "The client retries a request up to five times.",
+        "## Settings",
+        "- retry_limit: how often",
+        "- retry_delay: how long to wait",
+        "Code | Retried",
+        "503 | yes",
+        "client = Client(\n    retry_limit=3)",
+    ]
+
+
+def test_drops_boilerplate():
+    text = extract_main_content(PAGE)
+    for boilerplate in ["Home", "Getting started", "cookies", "Tweet", "Hidden text", "track()", "Timeouts",
+                        "Copyright", "color: red"]:
+        assert boilerplate not in text
+
+
+def test_without_main_the_lone_article_is_the_content():
+    page = ("<html><body><div class='menu'><a href='/'>Home</a></div>"
+            "<article><h2>News</h2><p>Version 2 is out.</p></article>"
+            "<p>Unrelated footer text</p></body></html>")
+    assert extract_main_content(page) == "## News\n\nVersion 2 is out."
+
+
+def test_link_lists_are_skipped_unless_they_are_all_there_is():
+    page = ("<html><body><p>Read the <a href='/guide'>guide</a> first, it explains the setup in detail.</p>"
+            "<div><a href='/1'>Page one</a> <a href='/2'>Page two</a> <a href='/3'>Page three</a></div>"
+            "</body></html>")
+    assert extract_main_content(page) == "Read the guide first, it explains the setup in detail."
+
+    index = "<html><body><ul><li><a href='/1'>Page one</a></li><li><a href='/2'>Page two</a></li></ul></body></html>"
+    assert extract_main_content(index) == "- Page one\n\n- Page two"
+
+
+def test_paragraphs_that_are_mostly_links_are_still_prose():
+    page = ("<html><body><p>Read the <a href='/docs'>docs</a> and <a href='/api'>api reference</a></p>"
+            "<p>Both cover retries.</p></body></html>")
+    assert extract_main_content(page) == "Read the docs and api reference\n\nBoth cover retries."
+
+
+def test_highlighted_code_keeps_its_comments():
+    # highlight.js and Prism mark comments with class names that also mean boilerplate elsewhere
+    page = ("<html><body><main><h1>Retries</h1>"
+            "<pre><code class='hljs language-python'><span class='hljs-comment'># Retry three times</span>\n"
+            "client = <span class='hljs-title'>Client</span>(retry_limit=3)</code></pre>"
+            "<pre class='language-js'><code><span class='token comment'>// Wait between retries</span>\n"
+            "client.delay = 2</code></pre>"
+            "<div class='comments'><p>Great post!</p></div></main></body></html>")
+    assert extract_main_content(page).split("\n\n") == [
+        "# Retries",
+        "# Retry three times\nclient = Client(retry_limit=3)",
+        "// Wait between retries\nclient.delay = 2",
+    ]
+
+
+def test_adds_the_title_when_the_page_has_no_heading():
+    page = "<html><head><title>  Release notes </title></head><body><p>Fixed a crash.</p></body></html>"
+    assert extract_main_content(page) == "# Release notes\n\nFixed a crash."
+
+
+def test_bytes_empty_pages_and_xml_declarations():
+    assert extract_main_content(b"<html><body><p>caf\xc3\xa9</p></body></html>") == "café"
+    assert extract_main_content("") == ""
+    assert extract_main_content("   ") == ""
+    declared = '<?xml version="1.0" encoding="utf-8"?><html><body><p>Declared</p></body></html>'
+    assert extract_main_content(declared) == "Declared"
+
+
+def test_pipeline_fills_text_content_only_for_html_items():
+    crawler = get_crawler(Spider)
+    pipeline = ContentExtractionPipeline.from_crawler(crawler)
+    page = pipeline.process_item(NexoraCrawlerItem(source_url="https://a.example/", html_body=PAGE), None)
+    pdf = pipeline.process_item(NexoraCrawlerItem(source_url="https://a.example/x.pdf", text_content="PDF text"), None)
+
+    assert page["text_content"] == extract_main_content(PAGE)
+    assert pdf["text_content"] == "PDF text"
+    assert crawler.stats.get_value("content_extraction/pages") == 1
@@ -0,0 +1,123 @@
+import mongomock
+import numpy as np
+from langchain_core.documents import Document
+
+from nexora_crawler.context_budget import ContextBudgeter, mmr
+from nexora_crawler.embedding_cache import CachedEmbeddings, EmbeddingCache
+from nexora_crawler.vector_codec import encode_vector
+
+
+class FixedEmbeddings:
+    # Known vectors per text; counts the calls that would go to the API
+    def __init__(self, vectors):
+        self.vectors = vectors
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        return [self.vectors[text] for text in texts]
+
+    def embed_query(self, text):
+        self.calls += 1
+        return self.vectors[text]
+
+
+def cached_embeddings(tmp_path, vectors):
+    return CachedEmbeddings(FixedEmbeddings(vectors), "test", EmbeddingCache(str(tmp_path / "embeddings.sqlite")))
+
+
+# The second passage is a near copy of the first, the last one is off topic
+PASSAGES = {
+    "Retries wait twice as long each time.": [1.0, 0.0, 0.0],
+    "Each retry waits twice as long as the last.": [1.0, 0.0, 0.05],
+    "Set retry_limit to 0 to turn retries off.": [0.0, 1.0, 0.0],
+    "Tokens expire after one hour.": [0.0, 0.0, 1.0],
+}
+QUERY = [1.0, 0.8, 0.0]
+
+
+def documents():
+    return [Document(page_content=text, metadata={"_id": str(n)}) for n, text in enumerate(PASSAGES)]
+
+
+def test_mmr_skips_near_copies():
+    vectors = np.array(list(PASSAGES.values()))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    relevance = vectors @ (np.array(QUERY) / np.linalg.norm(QUERY))
+
+    assert mmr(relevance, vectors, 2, mmr_lambda=1.0) == [0, 1]  # relevance only: both copies
+    assert mmr(relevance, vectors, 2, mmr_lambda=0.5) == [0, 2]  # the copy gives way
+
+
+def test_select_picks_diverse_passages_from_the_cache_without_calling_the_api(tmp_path):
+    embeddings = cached_embeddings(tmp_path, PASSAGES)
+    embeddings.embed_documents(list(PASSAGES))  # what the indexer did
+    api_calls = embeddings.embeddings.calls
+
+    budgeter = ContextBudgeter(embeddings, max_tokens=1000, max_passages=2, mmr_lambda=0.5)
+    selected, usage = budgeter.select("how do retries work", QUERY, documents())
+
+    assert [doc.page_content for doc in selected] == list(PASSAGES)[:3:2]
+    assert embeddings.embeddings.calls == api_calls
+    assert usage["candidates"] == 4 and usage["passages"] == 2
+    assert budgeter.from_mongo == 0 and budgeter.unranked == 0
+
+
+def stored_passages(texts):
+    # The passages collection, with the vectors the indexer stored
+    passages = mongomock.MongoClient()["budget_test"]["passages"]
+    passages.insert_many([{"_id": str(n), "text": text, "embedding": encode_vector(PASSAGES[text])}
+                          for n, text in enumerate(PASSAGES) if text in texts])
+    return passages
+
+
+def test_select_reads_the_vectors_from_mongo_on_a_cold_cache(tmp_path):
+    embeddings = cached_embeddings(tmp_path, PASSAGES)  # indexed elsewhere: nothing cached here
+
+    budgeter = ContextBudgeter(embeddings, stored_passages(PASSAGES), max_tokens=1000, max_passages=2,
+                               mmr_lambda=0.5)
+    selected, _ = budgeter.select("how do retries work", QUERY, documents())
+
+    assert [doc.page_content for doc in selected] == list(PASSAGES)[:3:2]  # as with a warm cache
+    assert embeddings.embeddings.calls == 0
+    assert budgeter.from_mongo == 4 and budgeter.unranked == 0
+
+
+def test_a_passage_without_any_vector_keeps_its_place(tmp_path):
+    embeddings = cached_embeddings(tmp_path, PASSAGES)
+    embeddings.embed_documents(list(PASSAGES)[2:])
+    # The first passage has no vector anywhere, the second one only in Mongo
+    passages = stored_passages(list(PASSAGES)[1:2])
+
+    budgeter = ContextBudgeter(embeddings, passages, max_tokens=1000, max_passages=3, mmr_lambda=0.5)
+    selected, _ = budgeter.select("how do retries work", QUERY, documents())
+
+    # First as the retriever ranked it; MMR fills the other two places from the rest
+    assert [doc.page_content for doc in selected] == list(PASSAGES)[:3]
+    assert embeddings.embeddings.calls == 1  # only the indexer's call above
+    assert (budgeter.from_mongo, budgeter.unranked) == (1, 1)
+    assert "1 passage vectors read from Mongo, 1 passages without one" in budgeter.report()
+
+
+def test_select_trims_to_the_token_budget_keeping_sentence_order(tmp_path):
+    sentences = [f"Sentence {n} is about {'retries' if n % 3 == 0 else 'other things'} and fills space."
+                 for n in range(30)]
+    text = " ".join(sentences)
+    embeddings = cached_embeddings(tmp_path, {text: [1.0, 0.0, 0.0]})
+    embeddings.embed_documents([text])
+
+    budgeter = ContextBudgeter(embeddings, max_tokens=60, max_passages=1)
+    selected, usage = budgeter.select("retries", QUERY, [Document(page_content=text, metadata={})])
+
+    assert usage["tokens"] <= 60 < usage["baseline_tokens"]
+    assert usage["tokens_saved"] == usage["baseline_tokens"] - usage["tokens"]
+    kept = selected[0].page_content
+    assert "retries" in kept
+    # The kept sentences are in their original order
+    positions = [text.index(sentence) for sentence in sentences if sentence in kept]
+    assert positions == sorted(positions) and len(positions) >= 2
+
+
+def test_select_without_candidates():
+    selected, usage = ContextBudgeter(embeddings=None).select("question", QUERY, [])
+    assert selected == [] and usage["candidates"] == 0
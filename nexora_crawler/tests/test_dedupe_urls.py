@@ -0,0 +1,66 @@
+import contextlib
+import io
+from datetime import datetime, timedelta, timezone
+
+import mongomock
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+import indexer
+from nexora_crawler.pipelines import create_url_index
+from nexora_crawler.runtime import runtime
+
+URL = "https://docs.example.com/retries.html"
+
+
+@pytest.fixture
+def collections(monkeypatch, tmp_path):
+    # A database of its own, as left behind by the insert_one pipeline of earlier versions
+    db = mongomock.MongoClient()["dedupe_test"]
+    monkeypatch.setitem(runtime.parts, "collection", db["raw_materials"])
+    monkeypatch.setitem(runtime.parts, "passages", db["passages"])
+    monkeypatch.setenv("LOCAL_VECTOR_PATH", str(tmp_path / "vector_store"))
+    return db["raw_materials"], db["passages"]
+
+
+def store_copies(collection, passages):
+    now = datetime.now(timezone.utc)
+    ids = collection.insert_many([
+        {"source_url": URL, "text_content": "old", "ingested_at": now - timedelta(days=2), "index_status": "indexed"},
+        {"source_url": URL, "text_content": "newest", "ingested_at": now, "index_status": "indexed"},
+        {"source_url": URL, "text_content": "older", "ingested_at": now - timedelta(days=1), "index_status": "indexed"},
+        {"source_url": "https://docs.example.com/tokens.html", "text_content": "tokens", "ingested_at": now},
+    ]).inserted_ids
+    for doc_id in ids:
+        passages.insert_one({"_id": f"{doc_id}:0", "parent_id": doc_id, "text": "a passage"})
+    return ids
+
+
+def test_the_unique_index_needs_the_duplicates_gone(collections):
+    collection, passages = collections
+    store_copies(collection, passages)
+
+    assert not create_url_index(collection)
+    assert not collection.index_information()["source_url_1"].get("unique")
+
+
+def test_dedupe_keeps_the_newest_copy_of_each_url(collections):
+    collection, passages = collections
+    old, newest, older, other = store_copies(collection, passages)
+    # Set aside as a near-duplicate of a copy that is about to go
+    waiting = collection.insert_one({"source_url": "https://mirror.example.com/retries.html",
+                                     "index_status": "duplicate", "duplicate_of": old}).inserted_id
+
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        indexer.dedupe_urls()
+
+    assert [doc["_id"] for doc in collection.find({"source_url": URL})] == [newest]
+    assert collection.find_one({"_id": other})
+    assert {passage["parent_id"] for passage in passages.find()} == {newest, other}
+    assert collection.find_one({"_id": waiting})["index_status"] == "pending"
+    assert collection.index_information()["source_url_1"]["unique"]
+    assert "1 URLs are stored more than once, 2 older copies to remove" in output.getvalue()
+
+    # From now on a second copy is refused
+    with pytest.raises(DuplicateKeyError):
+        collection.insert_one({"source_url": URL})
@@ -0,0 +1,73 @@
+import hashlib
+
+import pytest
+from scrapy import Request, Spider
+from scrapy.utils.test import get_crawler
+
+from nexora_crawler.dupefilters import BloomDupeFilter, BloomFilter
+
+
+def fingerprint(n):
+    return hashlib.sha1(f"https://example.com/page/{n}".encode()).digest()
+
+
+def test_bloom_filter_remembers_what_it_saw():
+    bloom = BloomFilter(capacity=1000, error_rate=1e-4)
+    assert bloom.add(fingerprint(1)) is False
+    assert bloom.add(fingerprint(1)) is True
+    assert fingerprint(1) in bloom
+    assert fingerprint(2) not in bloom
+    assert len(bloom) == 1
+
+
+def test_bloom_filter_false_positive_rate_stays_near_the_target():
+    bloom = BloomFilter(capacity=10_000, error_rate=1e-3)
+    for n in range(10_000):
+        bloom.add(fingerprint(n))
+    false_positives = sum(fingerprint(n) in bloom for n in range(10_000, 30_000))
+    assert false_positives / 20_000 < 3e-3
+    assert bloom.false_positive_rate() == pytest.approx(1e-3, rel=0.5)
+
+
+def test_bloom_filter_file_survives_a_restart(tmp_path):
+    path = str(tmp_path / "requests.bloom")
+    bloom = BloomFilter(capacity=1000, error_rate=1e-4, path=path)
+    for n in range(50):
+        bloom.add(fingerprint(n))
+    bloom.close()
+
+    # A resumed crawl keeps the original size even if the settings changed
+    resumed = BloomFilter(capacity=5, error_rate=0.1, path=path)
+    assert (resumed.bits, resumed.hashes, len(resumed)) == (bloom.bits, bloom.hashes, 50)
+    assert all(fingerprint(n) in resumed for n in range(50))
+    assert resumed.add(fingerprint(50)) is False
+    resumed.close()
+
+
+def test_bloom_filter_refuses_a_foreign_file(tmp_path):
+    path = tmp_path / "requests.bloom"
+    path.write_bytes(b"not a bloom filter at all, just some bytes")
+    with pytest.raises(ValueError):
+        BloomFilter(capacity=1000, error_rate=1e-4, path=str(path))
+
+
+class ExampleSpider(Spider):
+    name = "example"
+
+
+def test_dupefilter_filters_repeated_requests_and_reports_stats(tmp_path):
+    crawler = get_crawler(ExampleSpider, {"JOBDIR": str(tmp_path), "BLOOM_CAPACITY": 1000})
+    dupefilter = BloomDupeFilter.from_crawler(crawler)
+
+    assert dupefilter.request_seen(Request("https://example.com/a")) is False
+    assert dupefilter.request_seen(Request("https://example.com/a")) is True
+    assert dupefilter.request_seen(Request("https://example.com/b")) is False
+    dupefilter.close("finished")
+
+    assert crawler.stats.get_value("bloom/urls_seen") == 2
+    assert (tmp_path / "requests.bloom").exists()
+
+    # The next run with the same JOBDIR still knows both URLs
+    resumed = BloomDupeFilter.from_crawler(get_crawler(ExampleSpider, {"JOBDIR": str(tmp_path)}))
+    assert resumed.request_seen(Request("https://example.com/b")) is True
+    resumed.close("finished")
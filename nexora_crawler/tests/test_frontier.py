@@ -0,0 +1,94 @@
+import time
+
+import mongomock
+import pytest
+
+from nexora_crawler.frontier import DONE, FAILED, MongoFrontier, SqliteFrontier
+
+
+@pytest.fixture(params=["sqlite", "mongo"])
+def open_frontier(request, tmp_path):
+    # Both backends, with the same options
+    frontiers = []
+
+    def open_frontier(**options):
+        if request.param == "sqlite":
+            frontier = SqliteFrontier(str(tmp_path / "frontier.sqlite"), "test", **options)
+        else:
+            frontier = MongoFrontier(mongomock.MongoClient(), "test", **options)
+        frontiers.append(frontier)
+        return frontier
+
+    yield open_frontier
+    for frontier in frontiers:
+        frontier.close()
+
+
+def entry(name, domain="a.example", priority=0):
+    return {"_id": name, "url": f"https://{domain}/{name}", "domain": domain, "priority": priority,
+            "request": name.encode()}
+
+
+def test_push_skips_requests_the_fleet_has_seen(open_frontier):
+    frontier = open_frontier()
+    assert frontier.push([entry("one"), entry("two")]) == 2
+    assert frontier.push([entry("two"), entry("three")]) == 1
+    assert frontier.push([]) == 0
+    assert frontier.counts()["queued"] == 3
+
+
+def test_lease_by_priority_and_finish(open_frontier):
+    frontier = open_frontier()
+    frontier.push([entry("low", "a.example"), entry("high", "b.example", priority=10)])
+
+    request_id, data, slot = frontier.lease("worker-1", delay=0, max_wait=5)
+    assert (request_id, data) == ("high", b"high")
+    assert slot <= time.time()
+    frontier.finish(request_id, DONE)
+    assert frontier.lease("worker-1", delay=0, max_wait=5)[0] == "low"
+
+    assert frontier.has_pending()  # "low" is still leased
+    frontier.finish("low", FAILED, "boom")
+    assert not frontier.has_pending()
+    assert frontier.counts() == {"queued": 0, "leased": 0, "done": 1, "failed": 1}
+
+
+def test_one_domain_slot_per_delay_across_workers(open_frontier):
+    frontier = open_frontier()
+    frontier.push([entry("a1"), entry("a2"), entry("b1", "b.example")])
+
+    first = frontier.lease("worker-1", delay=10, max_wait=5)
+    second = frontier.lease("worker-2", delay=10, max_wait=5)
+    # a.example's next slot is 10 s away, more than max_wait: the other domain goes first
+    assert first[0] == "a1"
+    assert second[0] == "b1"
+    assert frontier.lease("worker-2", delay=10, max_wait=5) is None
+    assert frontier.counts()["queued"] == 1
+
+
+def test_a_slot_within_max_wait_is_booked_ahead(open_frontier):
+    frontier = open_frontier()
+    frontier.push([entry("a1"), entry("a2")])
+    _, _, first_slot = frontier.lease("worker-1", delay=2, max_wait=5)
+    _, _, second_slot = frontier.lease("worker-2", delay=2, max_wait=5)
+    assert second_slot == pytest.approx(first_slot + 2, abs=0.5)
+
+
+def test_expired_leases_go_to_another_worker_until_max_attempts(open_frontier):
+    frontier = open_frontier(lease_seconds=0, max_attempts=2)
+    frontier.push([entry("page")])
+
+    assert frontier.lease("worker-1", delay=0, max_wait=5)[0] == "page"
+    assert frontier.lease("worker-2", delay=0, max_wait=5)[0] == "page"  # worker-1 died
+    assert frontier.lease("worker-3", delay=0, max_wait=5) is None
+    assert frontier.counts()["failed"] == 1
+
+
+def test_release_puts_leases_back_without_counting_an_attempt(open_frontier):
+    frontier = open_frontier(max_attempts=1)
+    frontier.push([entry("page")])
+    request_id, _, _ = frontier.lease("worker-1", delay=0, max_wait=5)
+
+    frontier.release([request_id])
+    assert frontier.counts()["queued"] == 1
+    assert frontier.lease("worker-2", delay=0, max_wait=5)[0] == "page"
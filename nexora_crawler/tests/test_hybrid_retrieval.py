@@ -0,0 +1,78 @@
+import mongomock
+from langchain_core.documents import Document
+
+from nexora_crawler.bm25 import BM25Index, tokenize
+from nexora_crawler.hybrid_retriever import HybridRetriever
+
+
+def test_tokenize_keeps_identifiers_together():
+    assert tokenize("What does E-1234 mean for api.v2 and err_404?") == ["does", "e-1234", "mean", "api.v2", "err_404"]
+
+
+def test_bm25_ranks_the_passage_with_the_exact_term_first(tmp_path):
+    index = BM25Index(str(tmp_path / "bm25.sqlite"))
+    index.replace_parent("doc1", [
+        ("doc1-0", "Error E-4011 means the session token has expired."),
+        ("doc1-1", "Tokens are issued by the login endpoint."),
+    ])
+    index.replace_parent("doc2", [("doc2-0", "Retries wait twice as long each time; errors are logged.")])
+
+    hits = index.search("what is E-4011")
+    assert [doc_id for doc_id, _ in hits] == ["doc1-0"]
+    assert index.search("the of and") == []  # nothing but stopwords
+    assert index.search("unknownterm") == []
+
+
+def test_bm25_replace_parent_drops_the_old_passages(tmp_path):
+    index = BM25Index(str(tmp_path / "bm25.sqlite"))
+    index.replace_parent("doc1", [("doc1-0", "old text about retries"), ("doc1-1", "more old text")])
+    index.replace_parent("doc1", [("doc1-0", "new text about tokens")])
+
+    assert len(index) == 1
+    assert index.search("retries") == []
+    assert [doc_id for doc_id, _ in index.search("tokens")] == ["doc1-0"]
+
+
+class FakeVectorStore:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def similarity_search(self, query, k=4):
+        return self.docs[:k]
+
+
+class FakeBM25:
+    def __init__(self, hits):
+        self.hits = hits
+
+    def search(self, query, k=20):
+        return self.hits[:k]
+
+
+def passage(doc_id, text):
+    return Document(page_content=text, metadata={"_id": doc_id, "source_url": f"https://example.com/{doc_id}"})
+
+
+def test_rrf_puts_passages_found_by_both_searches_first():
+    vector_docs = [passage("a", "A"), passage("b", "B"), passage("c", "C")]
+    keyword_hits = [("c", 9.0), ("d", 5.0), ("a", 1.0)]
+    passages = mongomock.MongoClient()["nexora_db"]["passages"]
+    passages.insert_one({"_id": "d", "text": "D", "source_url": "https://example.com/d", "embedding": [0.1, 0.2]})
+
+    retriever = HybridRetriever(vector_store=FakeVectorStore(vector_docs), bm25=FakeBM25(keyword_hits),
+                                passages=passages, k=4)
+    docs = retriever.invoke("question")
+
+    # a: ranks 1 and 3, c: ranks 3 and 1 (a tie, vector order wins), then b before d
+    assert [doc.metadata["_id"] for doc in docs] == ["a", "c", "b", "d"]
+    # Only BM25 found "d": it is loaded from Mongo, without its vector
+    assert docs[-1].page_content == "D"
+    assert "embedding" not in docs[-1].metadata
+
+
+def test_rrf_keeps_only_k_passages():
+    vector_docs = [passage(name, name) for name in "abcdef"]
+    retriever = HybridRetriever(vector_store=FakeVectorStore(vector_docs), bm25=FakeBM25([("f", 3.0)]),
+                                passages=mongomock.MongoClient()["nexora_db"]["passages"], k=2)
+    # "f" is last in the vector results but also found by BM25, so it beats "a"
+    assert [doc.metadata["_id"] for doc in retriever.invoke("question")] == ["f", "a"]
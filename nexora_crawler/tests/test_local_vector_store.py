@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+
+from nexora_crawler import local_vector_store
+from nexora_crawler.local_vector_store import LocalVectorStore
+
+DIM = 64
+
+
+def random_vectors(count, seed=0):
+    return np.random.default_rng(seed).normal(size=(count, DIM)).astype(np.float32)
+
+
+def fill(store, vectors):
+    ids = [f"passage-{n}" for n in range(len(vectors))]
+    store.add_embeddings([f"text {n}" for n in range(len(vectors))], vectors,
+                         [{"chunk_index": n} for n in range(len(vectors))], ids)
+    return ids
+
+
+def top_id(store, vector):
+    (doc, _), = store.similarity_search_by_vector_with_score(vector, k=1)
+    return doc.metadata["_id"]
+
+
+def recall_at_1(store, vectors, queries=200, noise=1.0):
+    # Each query is a stored vector plus noise of about its own length: that vector
+    # should come out first. Binary codes alone find ~80% of them, the rescoring the rest.
+    rng = np.random.default_rng(1)
+    rows = rng.choice(len(vectors), queries, replace=False)
+    hits = sum(top_id(store, vectors[row] + rng.normal(scale=noise, size=DIM)) == f"passage-{row}" for row in rows)
+    return hits / queries
+
+
+@pytest.mark.parametrize("quantization", ["none", "int8", "binary"])
+def test_top_1_recall(tmp_path, quantization):
+    store = LocalVectorStore(str(tmp_path), None, quantization=quantization)
+    vectors = random_vectors(2000)
+    fill(store, vectors)
+
+    assert recall_at_1(store, vectors) >= 0.95
+
+
+@pytest.mark.parametrize("quantization", ["none", "int8", "binary"])
+def test_top_1_recall_with_the_ivf_index(tmp_path, monkeypatch, quantization):
+    monkeypatch.setattr(local_vector_store, "TRAIN_MIN_ROWS", 1000)
+    store = LocalVectorStore(str(tmp_path), None, nprobe=8, quantization=quantization)
+    # Passages come in topics, and the IVF lists follow them
+    rng = np.random.default_rng(2)
+    topics = rng.normal(size=(40, DIM))
+    vectors = (topics[rng.integers(0, 40, 3000)] + rng.normal(scale=0.5, size=(3000, DIM))).astype(np.float32)
+    fill(store, vectors)
+
+    assert store.centroids is not None
+    assert recall_at_1(store, vectors, noise=0.3) >= 0.9
+
+
+def test_results_come_with_their_text_and_metadata(tmp_path):
+    store = LocalVectorStore(str(tmp_path), None)
+    vectors = random_vectors(10)
+    fill(store, vectors)
+
+    (doc, score), = store.similarity_search_by_vector_with_score(vectors[3], k=1)
+    assert doc.page_content == "text 3"
+    assert doc.metadata == {"chunk_index": 3, "_id": "passage-3"}
+    assert score == pytest.approx(1.0)
+
+
+@pytest.mark.parametrize("quantization", ["none", "int8", "binary"])
+def test_everything_is_there_after_reopening(tmp_path, quantization):
+    vectors = random_vectors(500)
+    store = LocalVectorStore(str(tmp_path), None, quantization=quantization)
+    fill(store, vectors)
+    store.delete(["passage-7"])
+    before = [top_id(store, vector) for vector in vectors[:20]]
+
+    reopened = LocalVectorStore(str(tmp_path), None, quantization=quantization)
+    assert reopened.count == 500 and len(reopened.row_of_id) == 499
+    assert [top_id(reopened, vector) for vector in vectors[:20]] == before
+    assert top_id(reopened, vectors[7]) != "passage-7"
+
+
+def test_reopening_with_another_quantization_rebuilds_the_codes(tmp_path):
+    vectors = random_vectors(500)
+    fill(LocalVectorStore(str(tmp_path), None), vectors)
+
+    reopened = LocalVectorStore(str(tmp_path), None, quantization="int8")
+    assert reopened.codes is not None
+    assert [top_id(reopened, vector) for vector in vectors[:20]] == [f"passage-{n}" for n in range(20)]
+
+
+def test_deleted_passages_can_be_added_again(tmp_path):
+    vectors = random_vectors(100)
+    store = LocalVectorStore(str(tmp_path), None)
+    fill(store, vectors)
+
+    store.delete(["passage-5"])
+    assert top_id(store, vectors[5]) != "passage-5"
+
+    # Re-indexed with other content: found where its new vector is, not at the old one
+    moved = random_vectors(1, seed=9)[0]
+    store.add_embeddings(["new text"], [moved], [{"chunk_index": 5}], ["passage-5"])
+    assert top_id(store, moved) == "passage-5"
+    assert top_id(store, vectors[5]) != "passage-5"
+
+    reopened = LocalVectorStore(str(tmp_path), None)
+    assert top_id(reopened, moved) == "passage-5"
+    assert len(reopened.row_of_id) == 100
+
+
+def test_adding_an_id_again_replaces_its_vector(tmp_path):
+    vectors = random_vectors(100)
+    store = LocalVectorStore(str(tmp_path), None)
+    fill(store, vectors)
+
+    moved = random_vectors(1, seed=9)[0]
+    store.add_embeddings(["new text"], [moved], [{}], ["passage-5"])
+    assert store.count == 100
+    assert top_id(store, moved) == "passage-5"
+    assert top_id(store, vectors[5]) != "passage-5"
@@ -0,0 +1,79 @@
+import random
+
+import mongomock
+
+from nexora_crawler.near_duplicates import (
+    NearDuplicateFinder, band_hashes, decode_signature, encode_signature, signature, similarity,
+)
+
+import fixtures
+
+
+def text(seed, words=300):
+    rng = random.Random(seed)
+    return " ".join(rng.choice(fixtures.WORDS) for _ in range(words))
+
+
+def edited(original, every=100):
+    # The same text with one word in every `every` changed, like a page with a new date or counter
+    words = original.split()
+    return " ".join("changed" if i % every == 0 else word for i, word in enumerate(words))
+
+
+def test_signature_is_stable_and_empty_text_has_none():
+    assert signature("") is None
+    assert signature("!!! ...") is None
+    assert (signature(text(1)) == signature(text(1))).all()
+    assert (decode_signature(encode_signature(signature(text(1)))) == signature(text(1))).all()
+
+
+def test_similarity_separates_near_copies_from_other_documents():
+    original = signature(text(1))
+    assert similarity(original, signature(edited(text(1)))) >= 0.85
+    assert similarity(original, signature(text(2))) < 0.3
+
+
+def indexed(collection, doc_id, content):
+    sig = signature(content)
+    collection.insert_one({"_id": doc_id, "text_content": content, "index_status": "indexed",
+                           "minhash": encode_signature(sig), "lsh_bands": band_hashes(sig)})
+
+
+def test_finder_points_near_copies_at_the_indexed_original():
+    collection = mongomock.MongoClient()["nexora_db"]["raw_materials"]
+    indexed(collection, "original", text(1))
+    finder = NearDuplicateFinder(collection, threshold=0.85)
+
+    results = finder.find([
+        {"_id": "copy", "text_content": edited(text(1))},
+        {"_id": "other", "text_content": text(2)},
+        {"_id": "empty", "text_content": ""},
+    ])
+
+    assert results["copy"][2] == "original"
+    assert results["other"][2] is None
+    assert "empty" not in results
+    sig, bands, _ = results["other"]
+    assert len(bands) == 16 and bands == band_hashes(sig)
+
+
+def test_finder_checks_the_batch_against_itself():
+    collection = mongomock.MongoClient()["nexora_db"]["raw_materials"]
+    finder = NearDuplicateFinder(collection)
+
+    results = finder.find([
+        {"_id": "first", "text_content": text(3)},
+        {"_id": "second", "text_content": edited(text(3))},
+    ])
+    assert results["first"][2] is None
+    assert results["second"][2] == "first"
+
+
+def test_finder_ignores_originals_that_are_not_indexed():
+    # A pending or duplicate document can't be an original: no chains of aliases
+    collection = mongomock.MongoClient()["nexora_db"]["raw_materials"]
+    indexed(collection, "original", text(1))
+    collection.update_one({"_id": "original"}, {"$set": {"index_status": "duplicate"}})
+
+    results = NearDuplicateFinder(collection).find([{"_id": "copy", "text_content": edited(text(1))}])
+    assert results["copy"][2] is None
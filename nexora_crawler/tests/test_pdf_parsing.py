@@ -0,0 +1,76 @@
+import asyncio
+import os
+import time
+
+import fitz
+import pytest
+from scrapy.exceptions import DropItem
+
+from nexora_crawler import pipelines
+from nexora_crawler.pipelines import PdfParsingPipeline
+
+
+def pdf_bytes(*pages):
+    pdf = fitz.open()
+    for text in pages:
+        pdf.new_page().insert_text((72, 72), text)
+    return pdf.tobytes()
+
+
+def run(pipeline, coroutine):
+    async def main():
+        pipeline.open_spider(None)
+        try:
+            return await coroutine()
+        finally:
+            pipeline.close_spider(None)
+
+    return asyncio.run(main())
+
+
+def test_pages_are_separated_by_form_feeds(tmp_path):
+    pipeline = PdfParsingPipeline(files_store=str(tmp_path), workers=1)
+
+    text = run(pipeline, lambda: pipeline.extract_text_from_pdf(pdf_bytes("First page", "Second page")))
+
+    assert text.split("\f") == ["First page\n", "Second page\n"]
+
+
+def test_files_over_the_size_limit_are_dropped(tmp_path):
+    pipeline = PdfParsingPipeline(files_store=str(tmp_path), workers=1, max_bytes=100)
+
+    with pytest.raises(DropItem, match="over the 100 byte limit"):
+        run(pipeline, lambda: pipeline.extract_text_from_pdf(pdf_bytes("First page")))
+
+
+def extract_text(source, max_pages, max_seconds):
+    # A worker stuck inside one page: it never gets to check the time
+    time.sleep(3600)
+
+
+def test_a_hung_worker_is_killed_and_the_pool_replaced(tmp_path, monkeypatch):
+    pipeline = PdfParsingPipeline(files_store=str(tmp_path), workers=1, timeout=1)
+    pipeline.startup_margin = 2
+
+    async def hang_then_parse():
+        old = pipeline.executor
+        # The worker processes run this module's extract_text (they import it by name)
+        with monkeypatch.context() as patch:
+            patch.setattr(pipelines, "pdf_worker", __import__(__name__))
+            hung = asyncio.ensure_future(pipeline.extract_text_from_pdf(pdf_bytes("Never read")))
+            while not old._processes:
+                await asyncio.sleep(0.01)
+            workers = list(old._processes.values())
+            with pytest.raises(DropItem, match="timed out after 1 seconds"):
+                await hung
+
+        assert pipeline.executor is not old
+        for process in workers:
+            process.join(5)
+            assert not process.is_alive()
+
+        # The only worker slot is free again and the fresh pool parses the next PDF
+        pipeline.timeout = 30
+        return await pipeline.extract_text_from_pdf(pdf_bytes("After the hang"))
+
+    assert run(pipeline, hang_then_parse) == "After the hang\n"
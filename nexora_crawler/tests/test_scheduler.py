@@ -0,0 +1,130 @@
+import pytest
+from scrapy import Request, Spider, signals
+from scrapy.exceptions import IgnoreRequest
+from scrapy.utils.test import get_crawler
+from twisted.python.failure import Failure
+
+from nexora_crawler import pipelines, scheduler
+from nexora_crawler.items import NexoraCrawlerItem
+
+
+class ExampleSpider(Spider):
+    name = "example"
+
+
+def make_scheduler(tmp_path, **settings):
+    crawler = get_crawler(ExampleSpider, {
+        "SCHEDULER": "nexora_crawler.scheduler.SharedScheduler",
+        "FRONTIER_URI": f"sqlite:///{tmp_path / 'frontier.sqlite'}",
+        "FRONTIER_DOMAIN_DELAY": 0,
+        **settings,
+    })
+    shared = scheduler.SharedScheduler.from_crawler(crawler)
+    shared.spider = ExampleSpider()
+    return crawler, shared
+
+
+def lease(shared, count):
+    for n in range(count):
+        shared.enqueue_request(Request(f"https://example.com/{n}"))
+    return [shared.next_request() for _ in range(count)]
+
+
+def test_a_request_is_done_once_its_items_are_stored(tmp_path):
+    crawler, shared = make_scheduler(tmp_path)
+    send = crawler.signals.send_catch_log
+    first, second = lease(shared, 2)
+    items = [NexoraCrawlerItem(source_url=request.url) for request in (first, second)]
+    for request, item in zip((first, second), items):
+        send(scheduler.item_yielded, request=request, item=item)
+        send(scheduler.request_done, request=request)
+
+    # The callbacks are done, but the items are still in MongoPipeline's buffer
+    assert shared.frontier.counts()["leased"] == 2
+    send(pipelines.items_stored, items=[items[0]], lost=[(items[1], "E11000 and worse")])
+    assert shared.frontier.counts() == {"queued": 0, "leased": 0, "done": 1, "failed": 1}
+    assert not shared.in_progress and not shared.item_requests and not shared.unstored
+
+
+def test_items_stored_before_the_callback_ends_wait_for_it(tmp_path):
+    crawler, shared = make_scheduler(tmp_path)
+    send = crawler.signals.send_catch_log
+    (request,) = lease(shared, 1)
+    stored, dropped = NexoraCrawlerItem(source_url="a"), NexoraCrawlerItem(source_url="b")
+    send(scheduler.item_yielded, request=request, item=stored)
+    send(scheduler.item_yielded, request=request, item=dropped)
+    send(pipelines.items_stored, items=[stored], lost=[])
+    send(signals.item_dropped, item=dropped, response=None, exception=None, spider=None)
+
+    assert shared.frontier.counts()["leased"] == 1  # the callback may still yield more
+    send(scheduler.request_done, request=request)
+    assert shared.frontier.counts()["done"] == 1
+
+
+def test_without_mongo_a_scraped_item_counts_as_stored(tmp_path):
+    crawler, shared = make_scheduler(tmp_path, ITEM_PIPELINES={})
+    send = crawler.signals.send_catch_log
+    (request,) = lease(shared, 1)
+    item = NexoraCrawlerItem(source_url=request.url)
+    send(scheduler.item_yielded, request=request, item=item)
+    send(signals.item_scraped, item=item, response=None, spider=None)
+    send(scheduler.request_done, request=request)
+    assert shared.frontier.counts()["done"] == 1
+
+
+@pytest.mark.parametrize("error, state", [(IgnoreRequest("304"), "done"), (ConnectionError("reset"), "failed")])
+def test_download_failures_finish_the_lease(tmp_path, error, state):
+    _, shared = make_scheduler(tmp_path)
+    (request,) = lease(shared, 1)
+    result = request.errback(Failure(error))
+    assert isinstance(result, Failure)  # still logged by Scrapy
+    assert shared.frontier.counts()[state] == 1
+
+
+def test_a_worker_crawls_at_most_concurrent_requests_at_once(tmp_path):
+    crawler, shared = make_scheduler(tmp_path, CONCURRENT_REQUESTS=2)
+    requests = lease(shared, 3)
+    assert requests[2] is None  # the third is left to the other workers
+
+    crawler.signals.send_catch_log(scheduler.request_done, request=requests[0])
+    assert shared.next_request().url == "https://example.com/2"
+
+
+class FakeEngine:
+    # Just what SharedScheduler.wake uses: engine._slot.nextcall.schedule()
+    def __init__(self):
+        self.scheduled = 0
+        self._slot = self
+        self.nextcall = self
+
+    def schedule(self):
+        self.scheduled += 1
+
+
+def test_wake_has_the_engine_ask_for_work_again(tmp_path):
+    crawler, shared = make_scheduler(tmp_path, CONCURRENT_REQUESTS=1)
+    crawler.engine = FakeEngine()
+    shared.idle_until = float("inf")  # next_request found nothing a moment ago
+
+    shared.wake()
+    assert crawler.engine.scheduled == 1
+    assert shared.idle_until == 0
+
+    lease(shared, 1)  # a full worker is left alone
+    shared.wake()
+    assert crawler.engine.scheduled == 1
+
+
+def test_wake_flushes_mongo_when_leases_only_wait_for_storage(tmp_path):
+    crawler, shared = make_scheduler(tmp_path)
+    crawler.engine = FakeEngine()
+    flushes = []
+    crawler.signals.connect(lambda: flushes.append(True), signal=pipelines.flush_requested, weak=False)
+    (request,) = lease(shared, 1)
+    crawler.signals.send_catch_log(scheduler.item_yielded, request=request, item=NexoraCrawlerItem())
+
+    shared.wake()
+    assert flushes == []  # the callback is still running
+    crawler.signals.send_catch_log(scheduler.request_done, request=request)
+    shared.wake()
+    assert flushes == [True]
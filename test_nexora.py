@@ -2,32 +2,25 @@
 Quick test to verify the Nexora chatbot is working
 """
 import os
-from dotenv import load_dotenv
-from pymongo import MongoClient
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
-from langchain_mongodb import MongoDBAtlasVectorSearch
+import sys
 
-# Load Environment Variables
-load_dotenv()
-MONGO_URI = os.getenv("MONGO_URI")
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+# The shared modules live next to console_app.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "nexora_crawler"))
+# The same (lazily built) clients and models as console_app.py; it also loads .env
+from nexora_crawler.runtime import runtime
 
 print("Testing Nexora Components...")
 
 # Test 1: MongoDB Connection
 try:
-    client = MongoClient(MONGO_URI)
-    db = client["nexora_db"]
-    collection = db["raw_materials"]
-    doc_count = collection.count_documents({})
+    doc_count = runtime.collection.count_documents({})
     print(f"✓ MongoDB connected: {doc_count} documents found")
 except Exception as e:
     print(f"✗ MongoDB error: {e}")
 
 # Test 2: Embeddings
 try:
-    embeddings = GoogleGenerativeAIEmbeddings(model="models/text-embedding-004")
-    test_embedding = embeddings.embed_query("test")
+    test_embedding = runtime.embeddings.embed_query("test")
     print(f"✓ Embeddings working: {len(test_embedding)} dimensions")
 except Exception as e:
     print(f"✗ Embeddings error: {e}")
@@ -35,8 +28,7 @@ except Exception as e:
 # Test 3: LLM
 try:
     print("Testing LLM (may take a few seconds)...")
-    llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash", temperature=0)
-    response = llm.invoke("Say 'Hello from Nexora' in exactly 4 words.")
+    response = runtime.llm.invoke("Say 'Hello from Nexora' in exactly 4 words.")
     answer = response.content if hasattr(response, 'content') else str(response)
     print(f"✓ LLM working: {answer}")
 except Exception as e:
@@ -45,12 +37,7 @@ except Exception as e:
 # Test 4: Vector Store
 try:
     print("Testing Vector Store...")
-    vector_store = MongoDBAtlasVectorSearch(
-        collection=collection,
-        embedding=embeddings,
-        index_name="vector_index"
-    )
-    retriever = vector_store.as_retriever(search_kwargs={"k": 1})
+    retriever = runtime.vector_store.as_retriever(search_kwargs={"k": 1})
     docs = retriever.invoke("test query")
     print(f"✓ Vector search working: {len(docs)} documents retrieved")
     if docs:
@@ -58,4 +45,5 @@ try:
 except Exception as e:
     print(f"✗ Vector search error: {type(e).__name__}: {str(e)[:200]}")
 
+print(runtime.report())
 print("\n✅ All systems operational! You can now use console_app.py")